@@ -1,2 +1,5 @@
 from .storage import Storage
-from .replayBuffer import ReplayBuffer
\ No newline at end of file
+from .replayBuffer import ReplayBuffer
+from .memmapReplayBuffer import MemmapReplayBuffer
+from .frameReplayBuffer import FrameReplayBuffer
+from .sharedReplayBuffer import SharedReplayBuffer, SharedReplayWriter
\ No newline at end of file
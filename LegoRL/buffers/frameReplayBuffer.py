@@ -0,0 +1,141 @@
+from LegoRL.buffers.replayBuffer import ReplayBuffer
+from LegoRL.buffers.storage import Storage
+
+import numpy as np
+
+class FrameReplayBuffer(ReplayBuffer):
+    """
+    Replay Memory for stacked image observations (see atari_wrappers.FrameStack).
+    Instead of full stacks for "states" and "next_states", only the newest frame of each state is kept;
+    previous frames are found by links between consecutive steps of the same environment (see episode index of ReplayBuffer).
+    Stacks are rebuilt by indices when batch is requested, so each frame is stored once.
+
+    Requires "states", "next_states" and "is_start" keys in stored Storage,
+    and the same number of environments in each store. Both kinds of states are kept in dtype for "states".
+    The k-1 oldest transitions of each environment may have lost part of their history to overwriting;
+    missing frames are then substituted with the oldest available one.
+
+    Args:
+        capacity - size of buffer, int
+        frame_stack - number of stacked frames k, int
+        stack_axis - axis of observation along which frames are stacked, int
+
+    Provides:
+        store - add data from Storage to buffer
+        at - get data by indices
+    """
+    def __init__(self, par, capacity=10000, frame_stack=4, stack_axis=0, *args, **kwargs):
+        super().__init__(par, capacity, *args, **kwargs)
+
+        self.frame_stack = frame_stack
+        self.stack_axis = stack_axis
+        assert self.mdp.observation_shape[stack_axis] % frame_stack == 0, "Error: observation can't be split into given number of frames"
+        self._frame_size = self.mdp.observation_shape[stack_axis] // frame_stack
+
+        self._last_next_states = None     # next states of the latest step (their frames are not stored yet)
+
+    def _columns(self, storage):
+        assert {"states", "next_states", "is_start"} <= storage.keys(), "Error: Frame Replay Buffer requires states, next_states and is_start"
+
+        columns = {name: self._encode(name, data.numpy) for name, data in storage.items() if name not in ("states", "next_states")}
+        n = len(columns["is_start"])
+        assert self._last_slots is None or len(self._last_slots) == n, "Error: number of environments changed"
+
+        # the newest frame of each state
+        newest = [slice(None)] * (len(self.mdp.observation_shape) + 1)
+        newest[1 + self.stack_axis] = slice((self.frame_stack - 1) * self._frame_size, None)
+        columns["frames"] = self._encode("states", storage.states.numpy[tuple(newest)])
+
+        columns.update(self._links(storage.is_start.numpy))
+        return columns
+
+    def store(self, storage):
+        """
+        Remembers given transitions.
+        input: Storage
+        output: index of storing, list of ints
+        """
+        assert storage.total_size() <= self.capacity, "Error: Frame Replay Buffer can't store more than capacity at once"
+        with self._lock:
+            idxs = super().store(storage)
+            self._last_next_states = self._encode("states", storage.next_states.numpy).copy()
+        return idxs
+
+    def _stack(self, indices):
+        '''
+        Rebuilds stacked states stored on given positions.
+        input: indices - numpy array, ints
+        output: numpy array, (len(indices), *observation_shape)
+        '''
+        prev, stamp = self._buffer["prev"], self._buffer["stamp"]
+
+        # history of slots: last column is the step itself, previous columns - preceding steps
+        history = np.empty((len(indices), self.frame_stack), dtype=np.int64)
+        history[:, -1] = indices
+        for j in range(self.frame_stack - 2, -1, -1):
+            current = history[:, j + 1]
+            candidate = prev[current]
+            valid = (candidate >= 0) & (stamp[candidate] == stamp[current] - 1)
+            history[:, j] = np.where(valid, candidate, current)
+
+        # (batch, k, *frame_shape) -> (batch, *observation_shape)
+        frames = np.moveaxis(self._buffer["frames"][history], 1, 1 + self.stack_axis)
+        return frames.reshape((len(indices),) + tuple(self.mdp.observation_shape))
+
+    def _next_stack(self, indices):
+        '''
+        Rebuilds next states for given positions.
+        input: indices - numpy array, ints
+        output: numpy array, (len(indices), *observation_shape)
+        '''
+        stamp = self._buffer["stamp"]
+        nxt = self._buffer["next"][indices]
+        known = (nxt >= 0) & (stamp[nxt] == stamp[indices] + 1)
+
+        # next state is the state of the next step of the same environment
+        # (when the episode has ended, this is the first state of the new one, as it was returned by the env)
+        result = np.empty((len(indices),) + tuple(self.mdp.observation_shape), dtype=self._buffer["frames"].dtype)
+        result[known] = self._stack(nxt[known])
+
+        # the latest steps of environments are not followed by anything yet
+        latest = (indices[~known] - self._last_slots[0]) % self.capacity
+        assert (latest < len(self._last_slots)).all(), "Error: next state of transition is lost"
+        result[~known] = self._last_next_states[latest]
+        return result
+
+    def at(self, indices, keys=None):
+        """
+        Returns storage with data on given indices
+        input: indices - list of ints or numpy array of ints of any shape (leading dimensions of data)
+        input: keys - list of str or None (all keys)
+        output: Storage
+        """
+        indices = np.asarray(indices)
+        flat = indices.reshape(-1)
+        unflatten = lambda data: data.reshape(indices.shape + data.shape[1:])
+
+        storage = Storage()
+        with self._lock:
+            for name in (self._types.keys() if keys is None else keys):
+                if name == "states":
+                    storage[name] = self._decode("states", unflatten(self._stack(flat)))
+                elif name == "next_states":
+                    storage[name] = self._decode("states", unflatten(self._next_stack(flat)))
+                else:
+                    storage[name] = self._decode(name, self._buffer[name][indices])
+        return storage
+
+    def _meta(self):
+        meta = super()._meta()
+        meta.update(last_next_states=self._last_next_states)
+        return meta
+
+    def _restore_meta(self, meta):
+        super()._restore_meta(meta)
+        self._last_next_states = meta["last_next_states"]
+
+    def hyperparameters(self):
+        return {"capacity": self.capacity, "frame_stack": self.frame_stack}
+
+    def __repr__(self):
+        return f"Stores each of {self.frame_stack} stacked frames once in raw numpy format"
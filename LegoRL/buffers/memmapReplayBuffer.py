@@ -0,0 +1,83 @@
+from LegoRL.buffers.replayBuffer import ReplayBuffer
+
+import os
+import pickle
+import numpy as np
+
+class MemmapReplayBuffer(ReplayBuffer):
+    """
+    Replay Memory keeping its data in memory-mapped files on disk.
+    Used for buffers that do not fit in RAM: the hot part of the buffer is served by OS page cache.
+    Files are kept inside folder of the system, so reloaded system reattaches to the stored data.
+
+    Args:
+        capacity - size of buffer, int
+        folder_name - folder to keep files in, str or None (folder of system is used)
+        dtypes - how to keep data (see ReplayBuffer)
+
+    Provides:
+        store - add data from Storage to buffer
+        at - get data by indices
+    """
+    def __init__(self, par, capacity=10000, folder_name=None, dtypes=None):
+        super().__init__(par, capacity, checkpoint=True, dtypes=dtypes)
+
+        self.folder_name = folder_name or self.system.folder_name
+        assert self.folder_name is not None, "Error: folder name must be provided for memory-mapped replay buffer"
+
+    def _path(self):
+        '''
+        Returns directory with files of this buffer.
+        output: str
+        '''
+        return os.path.join(self.folder_name, self.name)
+
+    def _allocate(self, name, shape, dtype):
+        os.makedirs(self._path(), exist_ok=True)
+        return np.lib.format.open_memmap(os.path.join(self._path(), name + ".npy"),
+                                         mode="w+", dtype=dtype, shape=(self.capacity, *shape))
+
+    def _promote(self, name, column, dtype):
+        # new file will replace the old one, so data is copied to memory first
+        data = np.array(column)
+        promoted = self._allocate(name, data.shape[1:], dtype)
+        promoted[:] = data
+        return promoted
+
+    def flush(self):
+        '''Writes changes in memory-mapped files to disk.'''
+        for column in self._buffer.values():
+            column.flush()
+
+    def save(self, folder_name):
+        '''
+        Flushes data and stores position of buffer to folder_name/<name>/scheme.
+        Data itself is already on disk, so it is not copied to given folder: scheme refers to folder of the buffer.
+        '''
+        self.flush()
+        path = os.path.join(folder_name, self.name)
+        os.makedirs(path, exist_ok=True)
+        with open(os.path.join(path, "scheme"), 'wb') as f:
+            pickle.dump(dict(self._meta(), folder_name=os.path.abspath(self.folder_name)), f)
+
+    def load(self, folder_name):
+        '''
+        Reads scheme from folder_name/<name>/ and reattaches to files of the buffer it refers to.
+        '''
+        scheme = os.path.join(folder_name, self.name, "scheme")
+        if not os.path.exists(scheme):
+            self.system.add_message(f"<{self.name}> has not found stored transitions")
+            return
+
+        with open(scheme, 'rb') as f:
+            meta = pickle.load(f)
+
+        self._check_meta(meta)
+        self.folder_name = meta.get("folder_name", self.folder_name)
+        self._buffer = {}
+        for name in (meta["types"] or {}).keys():
+            self._buffer[name] = np.load(os.path.join(self._path(), name + ".npy"), mmap_mode="r+")
+        self._restore_meta(meta)
+
+    def __repr__(self):
+        return f"Stores data in memory-mapped files in <{self._path()}>"
@@ -1,80 +1,508 @@
 from LegoRL.core.RLmodule import RLmodule
 from LegoRL.buffers.storage import Storage
 
+import os
+import pickle
+import threading
 import numpy as np
-from collections import defaultdict
+
+def encode(data, dtype, scale=None):
+    '''
+    Casts data to narrow dtype for keeping in buffer (see Representation.compact for decoding).
+    input: data - numpy array
+    input: dtype - numpy dtype
+    input: scale - float or None, data is divided by scale and rounded to integers
+    output: numpy array
+    '''
+    if scale is not None:
+        info = np.iinfo(dtype)
+        data = np.clip(np.rint(data / scale), info.min, info.max)
+    return data.astype(dtype, copy=False)
+
+def _chunk_index(file_name):
+    '''
+    Returns index of chunk by name of its file ("chunk<index>.npz" or unfinished "chunk<index>.tmp.npz").
+    '''
+    return int(file_name[len("chunk"):].split(".")[0])
 
 class ReplayBuffer(RLmodule):
     """
     Replay Memory storing data in raw numpy format.
     Used for experience replay.
-    
+    Each key of stored Storage is kept in one preallocated array of size capacity,
+    so storing and gathering batches are done without python loops over transitions.
+    When system is saved, contents are written as compressed chunks of slots;
+    consequent saves rewrite only chunks changed since the previous save.
+
+    If stored data contains "is_start" key, buffer also keeps index of episodes:
+    links between consecutive steps of each environment and episode id of each slot.
+    Then sequences of steps and returns-to-go can be queried without python loops over steps.
+    Index assumes that each store contains one step of the same environments in the same order;
+    when number of transitions in store changes, episodes of all environments are considered to be restarted.
+
+    Keys can be kept in narrower dtypes than provided (i.e. uint8 images, float16 rewards).
+    Sampled data stays narrow until it is requested by model: cast to float and scaling are done once,
+    after transfer to device (see Representation.compact).
+
     Args:
         capacity - size of buffer, int
+        checkpoint - whether to save contents of buffer with the system, bool
+        chunk_size - number of slots in one saved chunk, int
+        dtypes - how to keep data: dict <str, numpy dtype or (numpy dtype, scale)>,
+                 "compact" (dtypes of MDPconfig.compact_dtype) or None (as provided)
 
     Provides:
         store - add data from Storage to buffer
         at - get data by indices
     """
-    def __init__(self, par, capacity=10000):
+    def __init__(self, par, capacity=10000, checkpoint=True, chunk_size=10000, dtypes=None):
         super().__init__(par)
-        
-        self.capacity = capacity        
-        self._buffer = defaultdict(list)
+
+        self.capacity = capacity
+        self._buffer = {}
         self._buffer_pos = 0
         self._size = 0
         self._types = None
-    
-    def _store_transition(self, storage):
-        """
-        Remembers single transition.
+        self._lock = threading.RLock()      # samplers may read from background threads
+
+        self.dtypes = dtypes
+        self._codecs = {}
+
+        # episode index
+        self._stamp = 0                   # number of stores performed
+        self._episodes = 0                # number of episodes started
+        self._last_slots = None           # where the latest step of each environment is stored
+
+        # whether stored transitions survive saving and loading of the system
+        self.keeps_contents = checkpoint
+        self.chunk_size = chunk_size
+        self._dirty = set()       # chunks changed since the last save
+        self._saved_to = None     # folder of the last save
+
+    def _allocate(self, name, shape, dtype):
+        '''
+        Creates storage for one key of transitions.
+        Override to change where the data is kept.
+        input: name - key of Storage, str
+        input: shape - shape of one transition, tuple
+        input: dtype - numpy dtype
+        output: numpy array, (capacity, *shape)
+        '''
+        return np.zeros((self.capacity, *shape), dtype=dtype)
+
+    def _codec(self, name):
+        '''
+        Returns how data of given key is kept.
+        input: name - key of Storage, str
+        output: (numpy dtype, scale) or None if data is kept as provided
+        '''
+        if name not in self._codecs:
+            if self._types is None or name not in self._types:
+                return None
+
+            if self.dtypes == "compact":
+                codec = self.mdp.compact_dtype(self._types[name])
+            else:
+                codec = (self.dtypes or {}).get(name)
+            if codec is not None and not isinstance(codec, tuple):
+                codec = (codec, None)
+            self._codecs[name] = codec
+        return self._codecs[name]
+
+    def _encode(self, name, data):
+        '''
+        Casts data of given key to dtype in which it is kept.
+        input: name - key of Storage, str
+        input: data - numpy array
+        output: numpy array
+        '''
+        codec = self._codec(name)
+        return data if codec is None else encode(data, *codec)
+
+    def _decode(self, name, data):
+        '''
+        Wraps kept data of given key into its representation.
+        input: name - key of Storage, str
+        input: data - numpy array
+        output: Representation
+        '''
+        codec = self._codec(name)
+        return self._types[name](data) if codec is None else self._types[name].compact(data, codec[1])
+
+    def _columns(self, storage):
+        '''
+        Translates storage to numpy arrays with transitions along first axis.
         input: Storage
-        output: index of storing, int
-        """
-        if self._size < self.capacity:
-            self._size += 1
-            for name, data in storage.items():
-                self._buffer[name].append(data.numpy)
+        output: dict <str, numpy array>
+        '''
+        columns = {name: self._encode(name, data.numpy) for name, data in storage.items()}
+        if "is_start" in columns:
+            columns.update(self._links(storage.is_start.numpy))
+        return columns
+
+    def _links(self, is_start):
+        '''
+        Creates columns of episode index for new steps.
+        Links to the next steps are not known yet; they are set on next store.
+        input: is_start - numpy array, bool
+        output: dict <str, numpy array>
+        '''
+        n = len(is_start)
+        if self._last_slots is None or len(self._last_slots) != n:
+            prev = np.full(n, -1)
         else:
-            for name, data in storage.items():
-                self._buffer[name][self._buffer_pos] = data.numpy
-        
-        idx = self._buffer_pos
-        self._buffer_pos = (self._buffer_pos + 1) % self.capacity
-        return idx
-        
+            prev = np.where(is_start.astype(bool), -1, self._last_slots)
+
+        # steps continuing an episode inherit its id, others start new episodes
+        episode = np.empty(n, dtype=np.int64)
+        new = prev < 0
+        if not new.all():
+            episode[~new] = self._buffer["episode"][prev[~new]]
+        episode[new] = self._episodes + np.arange(new.sum())
+        self._episodes += int(new.sum())
+
+        return {"prev": prev, "next": np.full(n, -1), "stamp": np.full(n, self._stamp), "episode": episode}
+
+    def _write(self, name, data, start):
+        '''
+        Writes consecutive transitions starting from given position with wraparound.
+        input: name - key of Storage, str
+        input: data - numpy array, (n, *shape)
+        input: start - position of first transition, int
+        '''
+        column = self._buffer.get(name)
+        if column is None:
+            column = self._buffer[name] = self._allocate(name, data.shape[1:], data.dtype)
+        elif np.result_type(column.dtype, data.dtype) != column.dtype:
+            # scheme is fixed by first store, but dtype is allowed to be promoted (i.e. int rewards to float)
+            column = self._buffer[name] = self._promote(name, column, np.result_type(column.dtype, data.dtype))
+
+        # if more than capacity is given, only last transitions survive
+        if len(data) > self.capacity:
+            start = (start + len(data) - self.capacity) % self.capacity
+            data = data[-self.capacity:]
+
+        first = min(len(data), self.capacity - start)
+        column[start:start + first] = data[:first]
+        column[:len(data) - first] = data[first:]
+
+    def _promote(self, name, column, dtype):
+        '''
+        Recreates column with wider dtype keeping stored data.
+        input: name - key of Storage, str
+        input: column - numpy array
+        input: dtype - numpy dtype
+        output: numpy array
+        '''
+        promoted = self._allocate(name, column.shape[1:], dtype)
+        promoted[:] = column
+
+        # saved chunks have narrower type, so everything is to be saved again
+        self._saved_to = None
+        return promoted
+
+    def _mark_dirty(self, idxs):
+        '''
+        Remembers that data on given positions is changed since the last save.
+        input: idxs - numpy array, ints
+        '''
+        self._dirty.update(np.unique(idxs // self.chunk_size).tolist())
+
     def store(self, storage):
         """
         Remembers given transitions.
         input: Storage
         output: index of storing, list of ints
         """
-        if self._types is None:
-            self._types = storage.types()
-        else:
-            assert self._types == storage.types(), f"Error: Replay Buffer expected scheme {self._types}; received scheme {storage.types()}"
+        with self._lock:
+            if self._types is None:
+                self._types = storage.types()
+            else:
+                assert self._types == storage.types(), f"Error: Replay Buffer expected scheme {self._types}; received scheme {storage.types()}"
 
-        idxs = []
-        for transition in storage.transitions():              
-            idxs.append(self._store_transition(transition))
-        return idxs
+            columns = self._columns(storage)
+            n = len(next(iter(columns.values())))
+            for name, data in columns.items():
+                assert len(data) == n, f"Error: Replay Buffer received {len(data)} transitions for {name}, {n} expected"
+                self._write(name, data, self._buffer_pos)
 
-    def at(self, indices):
+            idxs = (self._buffer_pos + np.arange(n)) % self.capacity
+            self._mark_dirty(idxs)
+            self._buffer_pos = (self._buffer_pos + n) % self.capacity
+            self._size = min(self._size + n, self.capacity)
+
+            if "next" in columns:
+                if self._last_slots is not None and len(self._last_slots) == n:
+                    self._buffer["next"][self._last_slots] = idxs
+                    self._mark_dirty(self._last_slots)
+                self._last_slots = idxs
+                self._stamp += 1
+        return idxs.tolist()
+
+    def at(self, indices, keys=None):
         """
         Returns storage with data on given indices
-        input: indices - list of ints
+        input: indices - list of ints or numpy array of ints of any shape (leading dimensions of data)
+        input: keys - list of str or None (all keys)
         output: Storage
         """
-        return Storage({
-            name: ty(np.stack([self._buffer[name][i] for i in indices])) 
-            for name, ty in self._types.items()
-        })
+        with self._lock:
+            return Storage({
+                name: self._decode(name, self._buffer[name][indices])
+                for name in (self._types.keys() if keys is None else keys)
+            })
 
     def __len__(self):
         return self._size
 
+    # episode index queries -------------------------------------------------------------
+    def _follow(self, slots, direction="next"):
+        '''
+        Moves each slot one step along its environment.
+        input: slots - numpy array of ints
+        input: direction - "next" or "prev"
+        output: linked slots, numpy array of ints (-1 if step is not stored)
+        output: whether linked step belongs to the same episode, numpy array of bools
+        '''
+        assert "next" in self._buffer, "Error: episode index requires is_start key in stored data"
+        stamp, episode = self._buffer["stamp"], self._buffer["episode"]
+
+        linked = self._buffer[direction][slots]
+        stored = (linked >= 0) & (stamp[linked] == stamp[slots] + (1 if direction == "next" else -1))
+        linked = np.where(stored, linked, -1)
+        return linked, stored & (episode[linked] == episode[slots])
+
+    def episodes(self, indices):
+        '''
+        Returns ids of episodes of given slots.
+        input: indices - numpy array of ints
+        output: numpy array of ints
+        '''
+        return self._buffer["episode"][indices]
+
+    def episode_bounds(self, indices):
+        '''
+        Returns the first and the last stored steps of episodes containing given slots.
+        Steps are followed simultaneously for all slots, so complexity is linear in episode length.
+        input: indices - numpy array of ints
+        output: first slots, numpy array of ints
+        output: last slots, numpy array of ints
+        '''
+        with self._lock:
+            bounds = []
+            for direction in ["prev", "next"]:
+                slots = np.array(indices, dtype=np.int64)
+                active = np.ones(len(slots), dtype=bool)
+                while active.any():
+                    linked, same = self._follow(slots[active], direction)
+                    slots[active] = np.where(same, linked, slots[active])
+                    active[active] = same
+                bounds.append(slots)
+        return tuple(bounds)
+
+    def _chain(self, indices, length):
+        '''
+        Returns slots of consecutive steps starting from given slots.
+        Chains are cut at the end of episode or at the latest stored step;
+        the rest is padded with the last valid slot.
+        input: indices - numpy array of ints
+        input: length - int
+        output: slots, numpy array of ints, (length, len(indices))
+        output: valid steps, numpy array of bools, (length, len(indices))
+        '''
+        slots = np.empty((length, len(indices)), dtype=np.int64)
+        valid = np.ones((length, len(indices)), dtype=bool)
+        slots[0] = indices
+        for t in range(1, length):
+            linked, same = self._follow(slots[t - 1])
+            valid[t] = valid[t - 1] & same
+            slots[t] = np.where(valid[t], linked, slots[t - 1])
+        return slots, valid
+
+    def sequences(self, indices, length):
+        '''
+        Returns sequences of consecutive steps starting from given slots (see _chain).
+        input: indices - numpy array of ints
+        input: length - int
+        output: Storage with data of shape (length, len(indices), ...)
+        output: valid steps, numpy array of bools, (length, len(indices))
+        '''
+        with self._lock:
+            slots, valid = self._chain(indices, length)
+            return self.at(slots), valid
+
+    def nstep_at(self, indices, n_steps):
+        '''
+        Returns storage with data on given indices, where rewards, discounts and next_states
+        are substituted with n-step ones: discounted sum of rewards of n steps starting from the index,
+        product of their discounts and next state of the last of them.
+        Steps are not taken beyond the end of episode and the latest stored step.
+        input: indices - numpy array of ints
+        input: n_steps - int or numpy array of ints (for each index)
+        output: Storage
+        '''
+        with self._lock:
+            indices = np.asarray(indices)
+            n_steps = np.broadcast_to(n_steps, indices.shape)
+            slots, valid = self._chain(indices, int(n_steps.max()))
+            valid &= np.arange(len(slots))[:, None] < n_steps[None]
+            last = slots[valid.sum(axis=0) - 1, np.arange(len(indices))]
+
+            # coefficient of reward on step t is product of discounts of previous steps
+            rewards = np.where(valid, self._floats("rewards", slots), 0)
+            discounts = np.where(valid, self._floats("discounts", slots), 1)
+            coefs = np.cumprod(np.concatenate([np.ones((1, len(indices))), discounts[:-1]]), axis=0)
+
+            substituted = ("rewards", "discounts", "next_states")
+            storage = self.at(indices, [name for name in self._types.keys() if name not in substituted])
+            storage.rewards = self._types["rewards"]((coefs * rewards).sum(axis=0).astype(np.float32))
+            storage.discounts = self._types["discounts"](discounts.prod(axis=0).astype(np.float32))
+            storage.next_states = self.at(last, ["next_states"]).next_states
+            return Storage({name: storage[name] for name in self._types.keys()})
+
+    def _floats(self, name, slots):
+        '''
+        Returns kept data of given key as float numpy array.
+        '''
+        data = self._buffer[name][slots].astype(np.float64)
+        codec = self._codec(name)
+        return data if codec is None or codec[1] is None else data * codec[1]
+
+    def returns_to_go(self, indices, gamma=None, max_length=None):
+        '''
+        Returns discounted sums of rewards from given slots till the end of episode.
+        Requires "rewards" key; without gamma also "discounts" key.
+        input: indices - numpy array of ints
+        input: gamma - float or None, discount factor (if None, stored discounts are used)
+        input: max_length - int or None, maximum number of summed rewards
+        output: returns, numpy array of floats
+        output: whether the end of episode was reached (otherwise sum is truncated), numpy array of bools
+        '''
+        with self._lock:
+            slots = np.array(indices, dtype=np.int64)
+            returns = np.zeros(len(slots))
+            coef = np.ones(len(slots))
+            ended = np.zeros(len(slots), dtype=bool)
+            active = np.ones(len(slots), dtype=bool)
+
+            steps = 0
+            while active.any() and (max_length is None or steps < max_length):
+                current = slots[active]
+                returns[active] += coef[active] * self._floats("rewards", current)
+                coef[active] *= gamma if gamma is not None else self._floats("discounts", current)
+
+                # episode is over when next step is stored but belongs to another episode
+                linked, same = self._follow(current)
+                ended[active] = (linked >= 0) & ~same
+                slots[active] = np.where(same, linked, current)
+                active[active] = same
+                steps += 1
+        return returns, ended
+
+    # saving and loading functions -------------------------------------------------------
+    def _meta(self):
+        '''
+        Returns everything except stored data required to restore the buffer.
+        output: dict
+        '''
+        return {"capacity": self.capacity,
+                "buffer_pos": self._buffer_pos,
+                "size": self._size,
+                "stamp": self._stamp,
+                "episodes": self._episodes,
+                "last_slots": self._last_slots,
+                "types": None if self._types is None else {name: self.mdp.recipe(ty) for name, ty in self._types.items()}}
+
+    def _check_meta(self, meta):
+        '''
+        Checks that stored buffer fits this one; called before any stored data is read.
+        input: dict
+        '''
+        assert meta["capacity"] == self.capacity, f"Error: stored buffer has capacity {meta['capacity']}, {self.capacity} expected"
+
+    def _restore_meta(self, meta):
+        '''
+        Restores the buffer from output of _meta.
+        Types of stored data are wrapped by MDP again, if they are not known to it yet.
+        input: dict
+        '''
+        self._buffer_pos = meta["buffer_pos"]
+        self._size = meta["size"]
+        self._stamp = meta.get("stamp", 0)
+        self._episodes = meta.get("episodes", 0)
+        self._last_slots = meta.get("last_slots")
+
+        self._types = None
+        if meta["types"] is not None:
+            self._types = {name: self.mdp.from_recipe(recipe) for name, recipe in meta["types"].items()}
+
+    def save(self, folder_name):
+        '''
+        Writes chunks changed since the last save to folder_name/<name>/.
+        When everything is rewritten, chunk files left by other runs are removed.
+        '''
+        if not self.keeps_contents:
+            return
+
+        path = os.path.join(folder_name, self.name)
+        os.makedirs(path, exist_ok=True)
+
+        num_chunks = (self._size + self.chunk_size - 1) // self.chunk_size
+        if self._saved_to == path:
+            chunks = sorted(self._dirty)
+        else:
+            chunks = range(num_chunks)
+            for file_name in os.listdir(path):
+                if file_name.startswith("chunk") and _chunk_index(file_name) not in chunks:
+                    os.remove(os.path.join(path, file_name))
+
+        for chunk in chunks:
+            start = chunk * self.chunk_size
+            end = min(start + self.chunk_size, self.capacity)
+
+            # file is replaced only after it is fully written
+            tmp_file = os.path.join(path, f"chunk{chunk}.tmp.npz")
+            np.savez_compressed(tmp_file, **{"column " + name: column[start:end] for name, column in self._buffer.items()})
+            os.replace(tmp_file, os.path.join(path, f"chunk{chunk}.npz"))
+
+        with open(os.path.join(path, "meta"), 'wb') as f:
+            pickle.dump(self.chunk_size, f)
+            pickle.dump(self._meta(), f)
+
+        self._dirty = set()
+        self._saved_to = path
+
+    def load(self, folder_name):
+        '''
+        Reads stored chunks one by one into the buffer.
+        Only chunks covering stored size are read.
+        '''
+        if not self.keeps_contents:
+            return
+
+        path = os.path.join(folder_name, self.name)
+        if not os.path.exists(os.path.join(path, "meta")):
+            self.system.add_message(f"<{self.name}> has not found stored transitions")
+            return
+
+        with open(os.path.join(path, "meta"), 'rb') as f:
+            chunk_size = pickle.load(f)
+            meta = pickle.load(f)
+
+        self._check_meta(meta)
+        self._buffer = {}
+        for index in range((meta["size"] + chunk_size - 1) // chunk_size):
+            with np.load(os.path.join(path, f"chunk{index}.npz")) as chunk:
+                for key in chunk.files:
+                    self._write(key[len("column "):], chunk[key], index * chunk_size)
+        self._restore_meta(meta)
+
+        # chunks on disk may be of different size, so the next save rewrites everything
+        self._dirty = set()
+        self._saved_to = path if chunk_size == self.chunk_size else None
+
     def hyperparameters(self):
-        return {"capacity": self.capacity}        
+        return {"capacity": self.capacity}
 
     def __repr__(self):
-        return f"Stores data in raw numpy format"
\ No newline at end of file
+        return f"Stores data in raw numpy format"
@@ -0,0 +1,279 @@
+from LegoRL.buffers.replayBuffer import ReplayBuffer, encode
+from LegoRL.buffers.storage import Storage
+
+import time
+import weakref
+import numpy as np
+import multiprocessing as mp
+from multiprocessing import shared_memory
+
+class SharedReplayWriter():
+    """
+    Handle to columns of SharedReplayBuffer living in shared memory segments.
+    Can be passed to other processes on their creation (i.e. as argument of multiprocessing.Process);
+    there it reattaches to the same segments, so store does not send transitions through pipes.
+
+    Consistency model:
+        - slots are reserved by atomic increment of shared write cursor, so producers never write the same slot;
+        - transitions become visible (counted in len) only after they are written;
+          commits are done in order of reservation, so all slots below len are written;
+        - each slot has a version counter, which is odd while slot is being rewritten.
+          Readers repeat gathering of slots which were changed during reading,
+          so each returned transition is consistent, though it may be newer than when its index was drawn;
+        - producer which dies between reservation and commit blocks commits of all later reservations.
+          Such slots can not be recovered, as they may be partially written, so waiting producers
+          raise TimeoutError after commit_timeout seconds instead of waiting forever;
+        - readers back off between repeated gatherings and raise TimeoutError if some slot stays
+          inconsistent for commit_timeout seconds (i.e. its producer died while writing it).
+
+    Args:
+        capacity - size of buffer, int
+        start_method - start method of producer processes, str or None (default of multiprocessing)
+        commit_timeout - seconds to wait for commits of previous reservations, float
+
+    Provides:
+        store - add data from Storage to shared buffer
+    """
+    def __init__(self, capacity, start_method=None, commit_timeout=60.):
+        self.capacity = capacity
+        self.commit_timeout = commit_timeout
+
+        context = mp.get_context(start_method)
+        self.reserved = context.Value('q', 0)       # number of transitions for which slots were given
+        self.committed = context.Value('q', 0)      # number of transitions fully written
+
+        self._segments = {}                                   # key None is reserved for versions of slots
+        self.columns = {}
+        self.codecs = {}                                      # (dtype, scale) of narrowed columns
+        self.versions = self._create(None, (), np.int64)
+
+    def _create(self, name, shape, dtype):
+        '''
+        Creates new shared memory segment for one key of transitions.
+        output: numpy array, (capacity, *shape)
+        '''
+        nbytes = max(1, int(np.prod((self.capacity, *shape))) * np.dtype(dtype).itemsize)
+        segment = shared_memory.SharedMemory(create=True, size=nbytes)
+        self._segments[name] = segment
+        array = np.ndarray((self.capacity, *shape), dtype=dtype, buffer=segment.buf)
+        array[:] = 0
+        return array
+
+    def add_column(self, name, shape, dtype):
+        '''
+        Creates column for given key of transitions.
+        Must be called before handle is passed to other processes.
+        output: numpy array, (capacity, *shape)
+        '''
+        assert name not in self.columns, f"Error: column {name} already exists"
+        self.columns[name] = self._create(name, shape, dtype)
+        return self.columns[name]
+
+    def store(self, storage):
+        """
+        Writes transitions to shared memory.
+        input: Storage
+        output: index of storing, list of ints
+        """
+        data = {name: repr.numpy if self.codecs.get(name) is None else encode(repr.numpy, *self.codecs[name])
+                for name, repr in storage.items()}
+        assert data.keys() == self.columns.keys(), f"Error: Shared Replay Buffer expected keys {set(self.columns.keys())}; received {set(data.keys())}"
+
+        n = len(next(iter(data.values())))
+        assert n <= self.capacity, "Error: Shared Replay Buffer can't store more than capacity at once"
+        for name, column in self.columns.items():
+            assert np.can_cast(data[name].dtype, column.dtype, "same_kind"), f"Error: {name} of type {data[name].dtype} can't be stored as {column.dtype}"
+
+        with self.reserved.get_lock():
+            start = self.reserved.value
+            self.reserved.value += n
+        slots = (start + np.arange(n)) % self.capacity
+
+        self.versions[slots] += 1
+        first = min(n, self.capacity - start % self.capacity)
+        for name, column in self.columns.items():
+            column[start % self.capacity:start % self.capacity + first] = data[name][:first]
+            column[:n - first] = data[name][first:]
+        self.versions[slots] += 1
+
+        # waiting for producers which reserved previous slots
+        deadline = time.monotonic() + self.commit_timeout
+        while self.committed.value != start:
+            if time.monotonic() > deadline:
+                raise TimeoutError(f"Error: transitions {self.committed.value}-{start} reserved by another producer were not committed in {self.commit_timeout} seconds")
+            time.sleep(0)
+        self.committed.value = start + n
+        return slots.tolist()
+
+    def gather(self, indices, keys=None):
+        '''
+        Reads consistent copies of transitions on given positions.
+        input: indices - numpy array, ints
+        input: keys - list of str or None (all keys)
+        output: dict <str, numpy array>
+        '''
+        columns = {name: self.columns[name] for name in (self.columns.keys() if keys is None else keys)}
+        result = {name: np.empty((len(indices), *column.shape[1:]), dtype=column.dtype) for name, column in columns.items()}
+
+        pending = np.arange(len(indices))
+        deadline, delay = time.monotonic() + self.commit_timeout, 0
+        while len(pending) > 0:
+            slots = indices[pending]
+            before = self.versions[slots]
+            for name, column in columns.items():
+                result[name][pending] = column[slots]
+            after = self.versions[slots]
+
+            # slots rewritten during gathering are read again
+            pending = pending[(before != after) | (before % 2 == 1)]
+            if len(pending) > 0:
+                if time.monotonic() > deadline:
+                    raise TimeoutError(f"Error: slots {indices[pending].tolist()} were not written in {self.commit_timeout} seconds")
+                time.sleep(delay)
+                delay = min(max(2 * delay, 1e-5), 1e-2)
+        return result
+
+    def __len__(self):
+        return min(self.committed.value, self.capacity)
+
+    def unlink(self):
+        '''Releases shared memory; to be called by the owner when all producers are finished.'''
+        _release(self._segments)
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state["_segments"] = {name: segment.name for name, segment in self._segments.items()}
+        state["columns"] = {name: (column.shape, column.dtype) for name, column in self.columns.items()}
+        state["versions"] = None
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+
+        names, self._segments = self._segments, {}
+        for name, segment_name in names.items():
+            self._segments[name] = shared_memory.SharedMemory(name=segment_name)
+
+        specs, self.columns = self.columns, {}
+        for name, (shape, dtype) in specs.items():
+            self.columns[name] = np.ndarray(shape, dtype=dtype, buffer=self._segments[name].buf)
+        self.versions = np.ndarray((self.capacity,), dtype=np.int64, buffer=self._segments[None].buf)
+
+def _release(segments):
+    for segment in segments.values():
+        segment.close()
+        try:
+            segment.unlink()
+        except FileNotFoundError:
+            pass
+    segments.clear()
+
+class SharedReplayBuffer(ReplayBuffer):
+    """
+    Replay Memory with columns in shared memory, filled by several acting processes.
+    Producers get handle with writer() and call its store; learner samples from this module as usual.
+    Scheme of data must be known before producers are started: call allocate with example Storage.
+    See SharedReplayWriter for consistency guarantees.
+
+    Producers store transitions of different environments in arbitrary order, so episode index is not kept:
+    episode queries (nstep_at and sequences for more than one step, returns_to_go, episode_bounds) raise.
+
+    Args:
+        capacity - size of buffer, int
+        start_method - start method of producer processes, str or None (default of multiprocessing)
+        commit_timeout - seconds producers wait for commits of each other, float
+        checkpoint - whether to save contents of buffer with the system, bool
+
+    Provides:
+        allocate - create shared columns by example
+        writer - handle for other processes
+        store - add data from Storage to buffer
+        at - get data by indices
+    """
+    def __init__(self, par, capacity=10000, start_method=None, commit_timeout=60., checkpoint=False, *args, **kwargs):
+        super().__init__(par, capacity, checkpoint, *args, **kwargs)
+
+        self._writer = SharedReplayWriter(capacity, start_method, commit_timeout)
+        self._finalizer = weakref.finalize(self, _release, self._writer._segments)
+
+    def _allocate(self, name, shape, dtype):
+        return self._writer.add_column(name, shape, dtype)
+
+    def _promote(self, name, column, dtype):
+        raise Exception(f"Error: Shared Replay Buffer can't change type of {name} to {dtype}")
+
+    def allocate(self, storage):
+        '''
+        Creates shared columns for given scheme of data.
+        input: Storage
+        '''
+        assert self._types is None, "Error: Shared Replay Buffer is already allocated"
+        self._types = storage.types()
+        for name, data in storage.items():
+            column = self._encode(name, data.numpy)
+            self._buffer[name] = self._allocate(name, column.shape[1:], column.dtype)
+            self._writer.codecs[name] = self._codec(name)
+
+    def writer(self):
+        '''
+        Returns handle for producers in other processes.
+        output: SharedReplayWriter
+        '''
+        assert self._types is not None, "Error: call allocate before creating producers"
+        return self._writer
+
+    def store(self, storage):
+        """
+        Remembers given transitions.
+        input: Storage
+        output: index of storing, list of ints
+        """
+        if self._types is None:
+            self.allocate(storage)
+        else:
+            assert self._types == storage.types(), f"Error: Replay Buffer expected scheme {self._types}; received scheme {storage.types()}"
+        return self._writer.store(storage)
+
+    def at(self, indices, keys=None):
+        """
+        Returns storage with data on given indices
+        input: indices - list of ints or numpy array of ints of any shape (leading dimensions of data)
+        input: keys - list of str or None (all keys)
+        output: Storage
+        """
+        indices = np.asarray(indices)
+        data = self._writer.gather(indices.reshape(-1), keys)
+        return Storage({name: self._decode(name, data[name].reshape(indices.shape + data[name].shape[1:])) for name in data.keys()})
+
+    def __len__(self):
+        return len(self._writer)
+
+    def _follow(self, slots, direction="next"):
+        raise Exception("Error: Shared Replay Buffer does not keep episode index")
+
+    def episodes(self, indices):
+        raise Exception("Error: Shared Replay Buffer does not keep episode index")
+
+    def close(self):
+        '''Releases shared memory.'''
+        self._finalizer()
+
+    # saving and loading functions -------------------------------------------------------
+    def _meta(self):
+        meta = super()._meta()
+        meta.update(buffer_pos=self._writer.committed.value % self.capacity, size=len(self))
+        return meta
+
+    def _restore_meta(self, meta):
+        super()._restore_meta(meta)
+        committed = self._size if self._size < self.capacity else self.capacity + self._buffer_pos
+        self._writer.reserved.value = committed
+        self._writer.committed.value = committed
+
+    def save(self, folder_name):
+        # writes of other processes are not tracked, so everything is saved
+        self._saved_to = None
+        super().save(folder_name)
+
+    def __repr__(self):
+        return f"Stores data in shared memory"
@@ -1,7 +1,7 @@
 from LegoRL.representations.representation import Representation
 
+import torch
 import numpy as np
-from LegoRL.utils.namedTensorsUtils import torch_stack
 
 def stack(to_stack):
     '''
@@ -11,8 +11,8 @@ def stack(to_stack):
     '''
     # list of representations case
     if isinstance(to_stack[0], Representation):
-        if hasattr(to_stack, "tensor"):
-            data = torch_stack([r.tensor for r in to_stack], 0, "timesteps")
+        if hasattr(to_stack[0], "_tensor"):
+            data = torch.stack([r.plain for r in to_stack])
         else:
             data = np.stack([r.numpy for r in to_stack])
         return type(to_stack[0])(data)
@@ -53,12 +53,74 @@ class Storage(dict):
         for data in zip(*self.values()):
             yield {name: repr for name, repr in zip(self.keys(), data)}
 
-    def batch(self, indices):
+    @classmethod
+    def cat(cls, storages):
+        '''
+        Concatenates storages along "batch" axis
+        input: storages - list of Storage
+        output: Storage
+        '''
+        return Storage({key: type(storages[0][key]).cat([storage[key] for storage in storages])
+                        for key in storages[0].keys()})
+
+    def flatten(self):
+        '''
+        Merges "timesteps" and "batch" axes of all representations (views of data when possible).
+        output: Storage
+        '''
+        return Storage({key: data.flatten() for key, data in self.items()})
+
+    def index(self, indices, keep_timesteps=False):
+        '''
+        Selects transitions by positions in flattened (timesteps, batch) dimensions for all keys,
+        or whole trajectories by positions along "batch" axis if keep_timesteps.
+        Indices are converted once for each device (and once to numpy) and shared by all keys.
+        input: indices - numpy array, list or LongTensor, ints
+        input: keep_timesteps - bool
+        output: Storage
+        '''
+        converted = {}
+        def on(device):
+            if device not in converted:
+                converted[device] = torch.as_tensor(indices, device=device) if device is not None else \
+                                    (indices.cpu().numpy() if torch.is_tensor(indices) else np.asarray(indices))
+            return converted[device]
+
+        result = Storage()
+        for key, data in self.items():
+            assert isinstance(data, Representation), f"Error: {key} is not a representation and can't be indexed"
+            result[key] = data.batch(on(data._tensor.device if hasattr(data, "_tensor") else None), keep_timesteps)
+        return result
+
+    # all keys are indexed by the same positions
+    batch = index
+
+    def split(self, size):
+        '''
+        Splits storage along "batch" axis into mini-batches (views of data).
+        input: size - size of mini-batch, int
+        output: list of Storage
+        '''
+        chunks = {key: data.split(size) for key, data in self.items()}
+        return [Storage({key: chunks[key][i] for key in self.keys()}) for i in range(len(next(iter(chunks.values()))))]
+
+    def to(self, device, non_blocking=False):
+        '''
+        Moves all representations to device; other values are kept as is.
+        input: device - str or torch.device
+        input: non_blocking - whether transfers may be asynchronous (see pin_memory), bool
+        output: Storage
+        '''
+        return Storage({key: data.to(device, non_blocking) if isinstance(data, Representation) else data
+                        for key, data in self.items()})
+
+    def pin_memory(self):
         '''
-        input: indices - list of ints
+        Puts tensors of all representations to page-locked memory, so that to(device, non_blocking=True) is asynchronous.
         output: Storage
         '''
-        return Storage({key: data.batch(indices) for key, data in self.items()})
+        return Storage({key: data.pin_memory() if isinstance(data, Representation) else data
+                        for key, data in self.items()})
 
     # def rename(self, key1, key2):
     #     '''
@@ -67,6 +67,10 @@ class RLmodule():
         '''Adds something to logs'''
         self.system.log(*args, **kwargs)
 
+    def accumulate(self, *args, **kwargs):
+        '''Adds tensor to metrics accumulated on device'''
+        self.system.accumulate(*args, **kwargs)
+
     def save(self, folder_name):
         '''
         Called when saved if something must be stored in separate files 
@@ -1,3 +1,4 @@
 from .RLmodule import RLmodule
 from .system import System
-from .trainer import Trainer
\ No newline at end of file
+from .trainer import Trainer
+from .cache import ForwardCache
\ No newline at end of file
@@ -0,0 +1,107 @@
+import torch
+import threading
+import numpy as np
+
+class TensorBridge():
+    """
+    Translates numpy data to PyTorch tensors on device with as few copies as possible:
+        - on CPU, tensor shares memory with numpy array if no cast is required (torch.from_numpy);
+        - on accelerators, data is copied to pinned staging buffer and transferred asynchronously;
+        - cast to required dtype is done once, after transfer, so narrow dtypes are transferred as is.
+    Counts bytes copied in host memory and bytes transferred to device.
+    Calls are serialized by a lock, as batches may be translated by prefetching threads (see Sampler),
+    while staging buffers and counters are shared.
+
+    Args:
+        device - str or torch.device
+        pin_memory - whether to transfer through pinned staging buffers, bool
+
+    Provides:
+        __call__ - translate data to tensor
+        flush_counters - return counters and reset them
+    """
+    def __init__(self, device="cpu", pin_memory=True):
+        self.device = torch.device(device)
+        self.pin_memory = pin_memory and self.device.type == "cuda"
+
+        self._staging = {}                  # (shape, dtype) -> pinned tensor, event of its last transfer
+        self._lock = threading.Lock()
+        self.copied = 0
+        self.transferred = 0
+
+    def _host(self, data):
+        '''
+        Returns CPU tensor with given data, sharing memory with numpy array if possible.
+        input: data - numpy array, list, scalar or Tensor
+        output: Tensor
+        '''
+        if isinstance(data, torch.Tensor):
+            return data
+
+        array = np.asarray(data)
+        if not array.flags.c_contiguous or not array.flags.writeable or array.dtype.byteorder == ">":
+            array = np.ascontiguousarray(array, dtype=array.dtype.newbyteorder("="))
+            if not array.flags.writeable:
+                array = array.copy()
+            self.copied += array.nbytes
+        return torch.from_numpy(array)
+
+    def _stage(self, tensor):
+        '''
+        Copies tensor to pinned staging buffer, reused for data of the same shape and dtype.
+        input: Tensor
+        output: Tensor, pinned
+        '''
+        key = (tuple(tensor.shape), tensor.dtype)
+        if key not in self._staging:
+            self._staging[key] = (torch.empty(tensor.shape, dtype=tensor.dtype).pin_memory(), None)
+        staging, event = self._staging[key]
+
+        # previous transfer from this buffer must be finished before it is rewritten
+        if event is not None:
+            event.synchronize()
+        staging.copy_(tensor)
+        self.copied += tensor.numel() * tensor.element_size()
+        return staging
+
+    def __call__(self, data, dtype=None):
+        '''
+        Translates data to tensor on device.
+        input: data - numpy array, list, scalar or Tensor
+        input: dtype - torch dtype or None (dtype of data is kept)
+        output: Tensor
+        '''
+        with self._lock:
+            return self._translate(data, dtype)
+
+    def _translate(self, data, dtype):
+        tensor = self._host(data)
+
+        if tensor.device != self.device:
+            nbytes = tensor.numel() * tensor.element_size()
+            if self.pin_memory and tensor.device.type == "cpu":
+                staging = self._stage(tensor)
+                tensor = staging.to(self.device, non_blocking=True)
+
+                event = torch.cuda.Event()
+                event.record()
+                self._staging[(tuple(staging.shape), staging.dtype)] = (staging, event)
+            else:
+                tensor = tensor.to(self.device)
+            self.transferred += nbytes
+
+        if dtype is not None and tensor.dtype != dtype:
+            tensor = tensor.to(dtype)
+            if tensor.device.type == "cpu":
+                self.copied += tensor.numel() * tensor.element_size()
+        return tensor
+
+    def flush_counters(self):
+        '''
+        Returns numbers of bytes copied in host memory and transferred to device since the last call.
+        output: int, int
+        '''
+        with self._lock:
+            counters = self.copied, self.transferred
+            self.copied, self.transferred = 0, 0
+        return counters
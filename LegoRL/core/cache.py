@@ -0,0 +1,121 @@
+import torch
+from copy import copy
+from functools import wraps
+
+'''
+Forward cache memoizes outputs of models within one iteration of the system.
+Output is reused when model is called again for the same input objects while its parameters are unchanged.
+Cache is cleared at the beginning of each iteration and after each optimization step.
+Callers always receive their own copy of stored output, so in-place operations on it do not affect other calls.
+'''
+
+class ForwardCache():
+    """
+    Memoizes outputs of Model calls, keyed by model, versions of its parameters and identity of inputs.
+    Outputs computed with gradients are reused in no_grad mode, but not vice versa.
+    Stochastic layers (e.g. noisy networks) give the same output for repeated calls within an iteration.
+
+    Args:
+        enabled - bool
+
+    Provides:
+        lookup - returns stored output or None
+        store - stores output of model
+        prefetch - computes model for several inputs in one batched forward pass
+        clear - drops all entries
+    """
+    def __init__(self, enabled=False):
+        self.enabled = enabled
+        self._entries = {}              # (model id, input ids) -> inputs, parameter versions, grad mode, output
+        self.hits = 0
+        self.misses = 0
+
+    def _version(self, model):
+        '''
+        Parameters are changed in-place by optimizers and target network updates, which increments their versions.
+        output: tuple of ints
+        '''
+        return tuple(p._version for p in model.net.parameters())
+
+    def lookup(self, model, inputs):
+        '''
+        input: model - Model
+        input: inputs - tuple of Representation
+        output: Representation or None
+        '''
+        entry = self._entries.get((id(model), tuple(map(id, inputs))))
+        if entry is not None:
+            stored_inputs, version, with_grad, output = entry
+            if (all(a is b for a, b in zip(stored_inputs, inputs)) and version == self._version(model) and
+               (with_grad or not torch.is_grad_enabled())):
+                self.hits += 1
+                return output
+        self.misses += 1
+        return None
+
+    def store(self, model, inputs, output):
+        '''
+        input: model - Model
+        input: inputs - tuple of Representation
+        input: output - Representation
+        '''
+        if self.enabled:
+            key = (id(model), tuple(map(id, inputs)))
+            self._entries[key] = (inputs, self._version(model), torch.is_grad_enabled(), output)
+
+    def prefetch(self, model, *inputs):
+        '''
+        Computes model for several inputs (e.g. states and next_states) in one batched forward pass
+        and stores output for each of them, so that following calls of model for these inputs are not computed.
+        Outputs share grad mode of this call.
+        input: model - Model with one input
+        input: inputs - Representations of the same type with "batch" dimension
+        output: list of Representation
+        '''
+        merged = model(type(inputs[0]).cat(list(inputs)))
+        d = merged.names.index("batch")
+        outputs = [type(merged)(chunk) for chunk in merged.plain.split([data.batch_size for data in inputs], d)]
+
+        for data, output in zip(inputs, outputs):
+            self.store(model, (data,), output)
+        return [_unaliased(output) for output in outputs]
+
+    def clear(self):
+        '''
+        Drops all entries.
+        '''
+        self._entries.clear()
+
+def _unaliased(output):
+    '''
+    Returns copy of representation owning its data: tensor is cloned (gradients still flow to the stored one),
+    numpy copy is dropped, so in-place operations on the copy do not change stored output.
+    input: Representation
+    output: Representation
+    '''
+    result = copy(output)
+    result.__dict__.pop("_numpy", None)
+    result._tensor = output.plain.clone()
+    return result
+
+def cached_forward(call):
+    '''
+    Decorator for Model.__call__, memoizing outputs in forward cache of the system.
+    Calls with recurrent memory are not cached.
+    Models overriding __call__ without this decorator bypass the cache,
+    e.g. ImplicitQuantileNetwork, which samples new quantile levels on each call.
+    '''
+    @wraps(call)
+    def wrapper(model, *input, memory=None):
+        cache = model.system.cache
+        if memory is not None or not cache.enabled:
+            return call(model, *input, memory=memory)
+
+        output = cache.lookup(model, input)
+        if output is None:
+            output = call(model, *input)
+            cache.store(model, input, output)
+
+        # callers may change returned representation in-place (e.g. +=), but not the stored one
+        return _unaliased(output)
+    return wrapper
@@ -1,4 +1,5 @@
-from LegoRL.representations.standard import Embedding
+from LegoRL.representations.standard import Embedding, State, Action, Reward, Discount, Flag
+from LegoRL.core.bridge import TensorBridge
 
 import gym
 import torch
@@ -12,17 +13,22 @@ class MDPconfig():
     Args:
         env - gym environment
         gamma - discount factor, float from 0 to 1
+        named_tensors - whether tensor property of representations returns PyTorch Named Tensors, bool
+                        (representations work with plain tensors internally in any case)
     """
-    def __init__(self, env, gamma=1):
+    def __init__(self, env, gamma=1, named_tensors=True):
         # TODO: move EVERYTHING to system?!
         # we are not going to dynamically change mdp! :(
-        USE_CUDA = torch.cuda.is_available()
         self.device = "cuda" if torch.cuda.is_available() else "cpu"
-        self.FloatTensor = lambda *args, **kwargs: torch.tensor(*args, **kwargs).float().cuda() if USE_CUDA else torch.tensor(*args, **kwargs).float()
-        self.LongTensor = lambda *args, **kwargs: torch.tensor(*args, **kwargs).long().cuda() if USE_CUDA else torch.tensor(*args, **kwargs).long()
-        self.BoolTensor = lambda *args, **kwargs: torch.tensor(*args, **kwargs).cuda() if USE_CUDA else torch.tensor(*args, **kwargs)
+        # data is cast after transfer, so narrow dtypes are transferred as is
+        self.bridge = TensorBridge(self.device)
+        self.FloatTensor = lambda data: self.bridge(data, torch.float32)
+        self.LongTensor = lambda data: self.bridge(data, torch.int64)
+        self.BoolTensor = lambda data: self.bridge(data)
+        self.named_tensors = named_tensors
         
         self.gamma = gamma
+        self.observation_space = env.observation_space
         self.observation_shape = env.observation_space.shape
         self.reward_shape = tuple()
 
@@ -63,9 +69,86 @@ class MDPconfig():
         class MDP_wrapped_repr(repr):
             mdp = self
 
-        self._representations[clsname] = MDP_wrapped_repr      
+        self._representations[clsname] = MDP_wrapped_repr
         return MDP_wrapped_repr
 
+    def key(self, repr):
+        '''
+        Returns key under which wrapped class is registered in this MDP.
+        Used to save representation types by name.
+        input: repr - class, wrapped by this MDP
+        output: str or None
+        '''
+        for clsname, wrapped in self._representations.items():
+            if wrapped is repr:
+                return clsname
+        return None
+
+    def registered(self, clsname):
+        '''
+        Returns already wrapped class without creating a new one.
+        input: clsname - str, key of representation
+        output: class or None
+        '''
+        return self._representations.get(clsname)
+
+    def recipe(self, repr):
+        '''
+        Returns picklable description of wrapped class, sufficient to wrap it again in another process.
+        Classes created by factories (e.g. Embedding(size)) can not be pickled, so only their key is kept.
+        input: repr - class, wrapped by this MDP
+        output: key - str
+        output: base - Representation class or None
+        output: named - whether class is a scalar embedding created by name, bool
+        '''
+        clsname = self.key(repr)
+        base = repr.__bases__[0]
+        picklable = "<locals>" not in base.__qualname__
+        return clsname, base if picklable else None, base._default_name() != clsname
+
+    def from_recipe(self, recipe):
+        '''
+        Wraps class again from output of recipe.
+        input: recipe - output of recipe (or key alone)
+        output: class
+        '''
+        clsname, base, named = recipe if isinstance(recipe, tuple) else (recipe, None, False)
+        if self.registered(clsname) is not None:
+            return self.registered(clsname)
+        if named:
+            return self[clsname]
+        if base is None:
+            raise Exception(f"Error: representation <{clsname}> can not be restored, create it before loading")
+        return self[base]
+
+    def compact_dtype(self, repr):
+        '''
+        Returns narrow dtype to keep data of given representation in replay buffers.
+        Observations from [0, 1] are quantized to 256 levels; discounts are kept in float32,
+        as float16 changes gamma noticeably (0.99 -> 0.9897).
+        input: repr - Representation class
+        output: (numpy dtype, scale) or None if data is to be kept as is
+        '''
+        if issubclass(repr, State):
+            if self.observation_space.dtype == np.uint8:
+                return np.uint8, None
+            if isinstance(self.observation_space, gym.spaces.Box) and (self.observation_space.low >= 0).all() and (self.observation_space.high <= 1).all():
+                return np.uint8, 1 / 255
+            return np.float32, None
+        if issubclass(repr, Action):
+            if self.space == "continuous":
+                return np.float32, None
+            if self.num_actions <= np.iinfo(np.int8).max:
+                return np.int8, None
+            return (np.int16 if self.num_actions <= np.iinfo(np.int16).max else np.int32), None
+        if issubclass(repr, Reward):
+            return np.float16, None
+        if issubclass(repr, Discount):
+            return np.float32, None
+        if issubclass(repr, Flag):
+            return np.bool_, None
+        return None
+
     def __repr__(self):
         if self.space == "discrete":
             action_descr = f"discrete, {self.num_actions} actions"
@@ -0,0 +1,64 @@
+import torch
+
+'''
+Metrics accumulated on device.
+Modules push detached tensors without synchronization with host;
+statistics are transferred to logger only when accumulators are flushed (see System.accumulate).
+'''
+
+class MetricAccumulator():
+    """
+    Accumulates sum, count, minimum and maximum of pushed values.
+    Tensors stay on their device; host synchronization happens once, on flush.
+
+    Provides:
+        push - adds value
+        flush - returns statistics and resets
+    """
+    def __init__(self):
+        self.y_axis = None
+        self._reset()
+
+    def _reset(self):
+        self.count = 0
+        self.sum = None
+        self.min = None
+        self.max = None
+
+    def push(self, value):
+        '''
+        input: value - Tensor with one element or number
+        '''
+        if torch.is_tensor(value):
+            value = value.detach().reshape(())
+        else:
+            value = torch.tensor(float(value))
+
+        # numbers and values from different devices are gathered where accumulated state lives;
+        # state moves to accelerator once, if some value is there, so pushing never synchronizes
+        if self.count > 0 and value.device != self.sum.device:
+            if self.sum.device.type == "cpu":
+                self.sum, self.min, self.max = self.sum.to(value.device), self.min.to(value.device), self.max.to(value.device)
+            else:
+                value = value.to(self.sum.device)
+
+        if self.count == 0:
+            self.sum, self.min, self.max = value.clone(), value.clone(), value.clone()
+        else:
+            self.sum += value
+            torch.minimum(self.min, value, out=self.min)
+            torch.maximum(self.max, value, out=self.max)
+        self.count += 1
+
+    def flush(self):
+        '''
+        Returns statistics of values pushed since the last call.
+        output: mean, min, max - floats, or None if nothing was pushed
+        '''
+        if self.count == 0:
+            return None
+
+        total, low, high = torch.stack([self.sum, self.min, self.max]).tolist()
+        mean = total / self.count
+        self._reset()
+        return mean, low, high
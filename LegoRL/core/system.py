@@ -1,5 +1,8 @@
 from LegoRL.core.RLmodule import RLmodule
 from LegoRL.core.mdp_config import MDPconfig
+from LegoRL.core.cache import ForwardCache
+from LegoRL.core.metrics import MetricAccumulator
+from LegoRL.buffers.replayBuffer import ReplayBuffer
 from LegoRL.representations.standard import State
 
 from LegoRL.utils.multiprocessing_env import VecEnv, DummyVecEnv
@@ -27,8 +30,10 @@ class System(RLmodule):
         folder_name - folder name to save model, str or None
         save_timer - timer for saving models, int
         rare_logs_timer - timer for computing expensive logs like average magnitude.
+        forward_cache - whether to memoize outputs of models within iteration (see ForwardCache), bool
     """
-    def __init__(self, env=None, make_env=None, already_vectorized=False, gamma=0.99, folder_name=None, save_timer=1000, rare_logs_timer=100):
+    def __init__(self, env=None, make_env=None, already_vectorized=False, gamma=0.99, folder_name=None, save_timer=1000, rare_logs_timer=100,
+                 forward_cache=False):
         # creating environment creation function for runners.
         if env is None and make_env is None: 
             raise Exception("Environment env or function make_env must be provided")
@@ -51,12 +56,14 @@ class System(RLmodule):
         self.modules = []
         self._mdp = MDPconfig(self.env, gamma)
         self.initial_state_example = self.mdp[State](self.env.reset())
+        self.cache = ForwardCache(forward_cache)
 
         # logging
         self.iterations = 0
         self.logger = defaultdict(list)                  # lists of values
         self.logger_times = defaultdict(list)            # lists of timestamps when values were recorded
         self.logger_labels = defaultdict(tuple)          # xaxis and yaxis names
+        self.accumulators = defaultdict(MetricAccumulator)  # values on device, logged on rare logs iterations
         self.reload_messages = []                        # additional messages like reloading from file
         self.time_for_rare_logs = lambda: self.iterations % rare_logs_timer == 0
 
@@ -84,6 +91,31 @@ class System(RLmodule):
         if y_axis is not None:
             self.logger_labels[key] = ("training iteration", y_axis)
 
+    def accumulate(self, key, value, y_axis=None):
+        """
+        Accumulate value for given key without synchronization with device;
+        mean, minimum and maximum of accumulated values are logged on rare logs iterations.
+        input: key - name of logged value, str
+        input: value - Tensor with one element or scalar
+        input: y_axis - name of y-axis for plotting the mean (no drawing if None), str
+        """
+        accumulator = self.accumulators[key]
+        accumulator.push(value)
+        if y_axis is not None:
+            accumulator.y_axis = y_axis
+
+    def flush_metrics(self):
+        """
+        Logs statistics of accumulated values: mean for key, minimum and maximum for "<key> min" and "<key> max".
+        """
+        for key, accumulator in self.accumulators.items():
+            statistics = accumulator.flush()
+            if statistics is not None:
+                mean, low, high = statistics
+                self.log(key, mean, accumulator.y_axis)
+                self.log(key + " min", low)
+                self.log(key + " max", high)
+
     def add_message(self, message):
         """
         Stores additional information message like reloading from file.
@@ -101,9 +133,19 @@ class System(RLmodule):
             self.iterations += 1
 
             # performing iteration and logging time
+            self.cache.clear()
             start = time.time()
             self.iteration()      
             self.log("time", time.time() - start, "seconds")
+
+            # numpy -> torch conversions of this iteration, logged with other metrics
+            copied, transferred = self.mdp.bridge.flush_counters()
+            self.accumulate("bytes copied", copied)
+            self.accumulate("bytes transferred", transferred)
+
+            # accumulated metrics are transferred from device
+            if self.time_for_rare_logs():
+                self.flush_metrics()
             
             # visualizing
             start = time.time()
@@ -137,6 +179,7 @@ class System(RLmodule):
         
         # creating directory
         os.makedirs(folder_name, exist_ok=True)
+        self.flush_metrics()
 
         # storing hyperparameters        
         hp = self.hyperparameters()
@@ -176,7 +219,20 @@ class System(RLmodule):
         # logging the fact that we were reloaded
         # it is important as, for example, replay buffers do not store their memory usually
         # so reloads reflect the learning procedure.
-        self.add_message("reloaded (replay buffers are lost)")
+        if any(isinstance(module, ReplayBuffer) and not module.keeps_contents for module in self._all_modules()):
+            self.add_message("reloaded (replay buffers are lost)")
+        else:
+            self.add_message("reloaded")
+
+    def _all_modules(self, module=None):
+        '''
+        Iterates over all modules in the system recursively
+        yield: RLmodule
+        '''
+        module = self if module is None else module
+        for child in module.modules:
+            yield child
+            yield from self._all_modules(child)
 
     def hyperparameters(self):
         '''
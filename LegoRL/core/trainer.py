@@ -3,7 +3,6 @@ from LegoRL.models.model import Model
 
 import os
 import torch
-import numpy as np
 
 class Trainer(RLmodule):
     '''
@@ -56,10 +55,13 @@ class Trainer(RLmodule):
         if self.clip_gradients is not None:
             g = torch.nn.utils.clip_grad_norm_(self.full_network.parameters(), self.clip_gradients)
         self.optimizer.step()
+
+        # outputs of models computed before this step are outdated
+        self.system.cache.clear()
         
         # additional logs
         if self.clip_gradients is not None:
-            self.log(self.name + " gradient_norm", g.item(), "gradient norm")
+            self.accumulate(self.name + " gradient_norm", g, "gradient norm")
         
         if self._is_noised and self.system.time_for_rare_logs():
             self.log(self.name + " magnitude", self.average_magnitude(), "noise magnitude")
@@ -70,8 +72,9 @@ class Trainer(RLmodule):
         Returns average magnitude of the whole network
         output: float
         '''
-        mag, n_params = sum([np.array(layer.magnitude()) for layer in self.full_network.modules() if hasattr(layer, "magnitude")])
-        return mag / n_params           
+        magnitudes = [layer.magnitude() for layer in self.full_network.modules() if hasattr(layer, "magnitude")]
+        mag, n_params = sum(mag for mag, _ in magnitudes), sum(n for _, n in magnitudes)
+        return (mag / n_params).item()           
             
     def numel(self):
         '''
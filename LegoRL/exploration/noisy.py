@@ -41,7 +41,7 @@ def NoisyLinear(std_init=0.4):
         
         def magnitude(self):
             # returns summed magnitudes of noise and number of noisy parameters
-            return (self.sigma_weight.abs().sum() + self.sigma_bias.abs().sum()).detach().cpu().numpy(), self.n_params
+            return (self.sigma_weight.abs().sum() + self.sigma_bias.abs().sum()).detach(), self.n_params
     return NoisyLinear
 
 def NoisyLinearRT(std_init=0.4):
@@ -69,5 +69,5 @@ def NoisyLinearRT(std_init=0.4):
         
         def magnitude(self):
             # returns summed magnitudes of noise and number of noisy parameters
-            return self.sigmas.abs().sum().detach().cpu().numpy(), self.n_params
+            return self.sigmas.abs().sum().detach(), self.n_params
     return NoisyLinearRT
\ No newline at end of file
@@ -29,7 +29,7 @@ class Loss(RLmodule):
             loss = (self.last_batch_loss * weights).tensor.mean()
 
         loss = self.weight * loss
-        self.log(self.name, loss.detach().cpu().numpy(), f"{self.name} loss")
+        self.accumulate(self.name, loss, f"{self.name} loss")
         return loss
 
     def hyperparameters(self):
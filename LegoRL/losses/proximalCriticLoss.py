@@ -14,7 +14,7 @@ class ProximalCriticLoss(Loss):
         '''
         Calculates loss for batch based on TD-error from DQN algorithm.
         input: V
-        input: old_V - V
+        input: old_V - V, cached at collection (old_V of RolloutCollector)
         input: target - V
         output: Loss
         '''
@@ -1,4 +1,5 @@
 from LegoRL.losses.loss import Loss
+from LegoRL.representations.policy import Policy
 
 import torch
 from LegoRL.utils.namedTensorsUtils import torch_min
@@ -24,14 +25,21 @@ class ProximalLoss(Loss):
         '''
         Calculates loss for PPO surrogate
         input: Policy
-        input: old_policy - Policy
+        input: old_policy - Policy, or its log-probabilities of actions cached at collection
+                            (old_log_prob of RolloutCollector), Representation
         input: Action
         input: advantages - V
         output: Loss
         '''
+        # log-probabilities of old policy are fixed for the whole rollout, so cached ones are preferred
+        if isinstance(old_policy, Policy):
+            old_log_prob = old_policy.log_prob(actions).detach()
+        else:
+            old_log_prob = old_policy.plain.detach()
+
         # importance sampling for making an update of current policy using samples from old policy
         # the gradients to policy will flow through the numerator.
-        ratio = torch.exp(policy.log_prob(actions) - old_policy.log_prob(actions).detach())
+        ratio = torch.exp(policy.log_prob(actions) - old_log_prob)
 
         # detach advantages
         advantages = advantages.tensor.detach()
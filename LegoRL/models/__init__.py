@@ -4,7 +4,9 @@ from .model import Model
 
 from .vnetwork import VNetwork
 from .qnetwork import QNetwork, QCritic
+from .implicitQuantileNetwork import ImplicitQuantileNetwork
 from .dueling import Dueling
+from .ensemble import EnsembleModel, StackedNetwork
 
 from .forwardQnetwork import ForwardQNetwork
 
@@ -0,0 +1,71 @@
+from LegoRL.models.model import Model
+from LegoRL.representations.V import V
+from LegoRL.representations.ensemble import Ensemble
+
+import copy
+import torch
+import torch.nn as nn
+from functools import partial
+
+class StackedNetwork(nn.Module):
+    """
+    num_members copies of network with stacked weights, evaluated in one pass with batched matrix multiplications.
+    Outputs of members are concatenated in the last dimension.
+
+    Args:
+        network - nn.Module, taking input_size and output_size as constructor parameters
+        num_members - int
+        input_size - int
+        output_size - total size of output of all members, int
+    """
+    def __init__(self, network, num_members, input_size, output_size):
+        super().__init__()
+        members = [network(input_size, output_size // num_members) for _ in range(num_members)]
+        params, buffers = torch.func.stack_module_state(members)
+
+        # stacked tensors are stored flat, as their names contain dots
+        self._param_names, self._buffer_names = list(params), list(buffers)
+        self.params = nn.ParameterList([nn.Parameter(params[name]) for name in self._param_names])
+        for i, name in enumerate(self._buffer_names):
+            self.register_buffer(f"buffer{i}", buffers[name])
+
+        # stateless copy of network architecture; not a submodule, so its (meta) parameters are not registered
+        self.__dict__["base"] = copy.deepcopy(members[0]).to("meta")
+
+    def _member(self, params, buffers, inputs):
+        return torch.func.functional_call(self.base, (params, buffers), inputs)
+
+    def forward(self, *inputs):
+        params = dict(zip(self._param_names, self.params))
+        buffers = {name: getattr(self, f"buffer{i}") for i, name in enumerate(self._buffer_names)}
+        inputs = tuple(x.rename(None) if x.has_names() else x for x in inputs)
+
+        # inputs are shared by members, outputs are stacked in the first dimension
+        output = torch.func.vmap(self._member, in_dims=(0, 0, None), randomness="different")(params, buffers, inputs)
+        return output.movedim(0, -2).flatten(-2)
+
+class EnsembleModel(Model):
+    """
+    Ensemble of models with the same architecture, evaluated in one forward pass (see StackedNetwork).
+    Output representation gets "ensemble" dimension; can be combined with other models, e.g.
+        class EnsembleCritic(EnsembleModel, ForwardQNetwork)
+
+    Args:
+        num_members - number of members in ensemble, int
+
+    Provides:
+        __call__ - function, performing all members for given storage
+    """
+    def __init__(self, *args, network=nn.Linear, output=V, num_members=2, **kwargs):
+        # frozen copies are created without network for ready output representation
+        if network is not None:
+            network = partial(StackedNetwork, network, num_members)
+            output = Ensemble(output, num_members)
+        self.num_members = num_members
+        super().__init__(*args, network=network, output=output, **kwargs)
+
+    def hyperparameters(self):
+        return {"num_members": self.num_members}
+
+    def __repr__(self):
+        return f"Models {self.output_representation._default_name()} in one forward pass"
@@ -1,26 +1,34 @@
 from LegoRL.core.RLmodule import RLmodule
 from LegoRL.models.model import Model
 
+import torch
 from copy import deepcopy
 
 class HardUpdate():
+    '''
+    Copies weights and buffers of source to target network each timer iterations in one fused operation.
+    '''
     def __init__(self, timer=100):
         self.timer = timer
 
     def __call__(self, module, source):
         if module.system.iterations % self.timer == 0:
-            module.net.load_state_dict(source.net.state_dict())
+            with torch.no_grad():
+                torch._foreach_copy_(*module.paired_tensors(buffers=True))
 
     def hyperparameters(self):
         return {"timer": self.timer}
 
 class SoftUpdate():
+    '''
+    Polyak averaging of target network, target = tau * source + (1 - tau) * target, in one fused operation.
+    '''
     def __init__(self, tau=0.01):
         self.tau = tau
 
     def __call__(self, module, source):
-        for param, source_param in zip(module.net.parameters(), source.net.parameters()):
-            param.data.copy_(self.tau * source_param.data + (1 - self.tau) * param.data)
+        with torch.no_grad():
+            torch._foreach_lerp_(*module.paired_tensors(), self.tau)
 
     def hyperparameters(self):
         return {"tau": self.tau}
@@ -39,6 +47,7 @@ def Frozen(parent, source, updater=HardUpdate()):
         def __init__(self, parent, source, updater):
             self.source = source
             self.updater = updater
+            self._paired_tensors = {}
 
             if issubclass(parclass, Model):
                 super().__init__(parent, network=None, 
@@ -53,11 +62,28 @@ def Frozen(parent, source, updater=HardUpdate()):
                         setattr(self, name, Frozen(self, module, updater))
 
         def update(self):
-            if issubclass(parclass, Model):
-                self.updater(self, self.source)
-            else:
-                for module in self.modules:
-                    module.update()
+            # networks of all submodules are updated together
+            self.updater(self, self.source)
+
+        def paired_tensors(self, buffers=False):
+            '''
+            Returns tensors of networks of this module and of its source, collected once.
+            For composite modules, tensors of all frozen submodules are collected.
+            input: buffers - whether to collect buffers (e.g. running statistics) too, bool
+            output: list of Tensor, list of Tensor
+            '''
+            if buffers not in self._paired_tensors:
+                if issubclass(parclass, Model):
+                    targets, sources = list(self.net.parameters()), list(self.source.net.parameters())
+                    if buffers:
+                        targets, sources = targets + list(self.net.buffers()), sources + list(self.source.net.buffers())
+                else:
+                    targets, sources = [], []
+                    for module in self.modules:
+                        module_targets, module_sources = module.paired_tensors(buffers)
+                        targets, sources = targets + module_targets, sources + module_sources
+                self._paired_tensors[buffers] = targets, sources
+            return self._paired_tensors[buffers]
 
         def visualize(self):
             '''Deletes additional logging for this network'''
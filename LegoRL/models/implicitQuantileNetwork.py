@@ -0,0 +1,41 @@
+from LegoRL.models.qnetwork import QNetwork
+from LegoRL.representations.Q import Q
+from LegoRL.representations.quantile import ImplicitQuantile
+
+import torch
+
+class ImplicitQuantileNetwork(QNetwork):
+    """
+    Provides a model of Q-function in implicit quantile form.
+    Quantile levels are sampled uniformly on each call and passed to the network as second input,
+    so number of quantiles can be changed between calls without rebuilding the network.
+    As levels differ between calls, outputs are not reused by forward cache of the system.
+    Network must take input_size and output_size as constructor arguments and compute
+        forward(input, taus) -> (*batch_shape, atoms, output_size), taus - (*batch_shape, atoms)
+    Based on: https://arxiv.org/abs/1806.06923
+
+    Args:
+        num_quantiles - default number of sampled quantile levels, int
+
+    Provides: act, V, Q, estimate
+    """
+    def __init__(self, *args, output=ImplicitQuantile(Q), num_quantiles=8, **kwargs):
+        assert issubclass(output, Q) and "atoms" in output.rnames(), "Error: output representation must be ImplicitQuantile(Q)"
+        super().__init__(*args, output=output, **kwargs)
+        self.num_quantiles = num_quantiles
+
+    def __call__(self, states, num_quantiles=None):
+        '''
+        input: State
+        input: num_quantiles - int or None (default number is used)
+        output: Q
+        '''
+        batch_shape = states.plain.shape[:len(states.names) - len(states.rnames())]
+        taus = torch.rand(batch_shape + (num_quantiles or self.num_quantiles,), device=self.mdp.device)
+        return self.output_representation.from_linear(self.net(states.plain, taus), taus)
+
+    def hyperparameters(self):
+        return {"num_quantiles": self.num_quantiles}
+
+    def __repr__(self):
+        return f"Models {self.output_representation._default_name()} with {self.num_quantiles} sampled quantiles"
@@ -1,7 +1,7 @@
 #from LegoRL.representations.representation import Which
 from LegoRL.core.RLmodule import RLmodule
 from LegoRL.representations.standard import State, Embedding
-#from LegoRL.core.cache import cached_forward
+from LegoRL.core.cache import cached_forward
 
 import os
 import torch
@@ -60,14 +60,16 @@ class Model(RLmodule):
 
             self.net = self.net(input_numel, output_shape.numel()).to(self.mdp.device)
 
+    @cached_forward
     def __call__(self, *input, memory=None):
         '''
+        Outputs are memoized within iteration if forward cache of the system is enabled.
         input: arguments for model, Representation
         output: Representation
         '''
         if len(input) > 1 and self._unite_inputs:
                 input = tuple(data.raw_embedding().tensor for data in input)
-                input = (torch.cat(input, dim="features"),)
+                input = (torch.cat(input, dim=-1),)
         else:
             input = tuple(data.tensor for data in input)
 
@@ -2,7 +2,7 @@ from LegoRL.representations.V import V
 from LegoRL.representations.standard import Action
 
 import torch
-from LegoRL.utils.namedTensorsUtils import torch_gather
+from LegoRL.utils.namedTensorsUtils import plain_tensor, plain_align, plain_gather, plain_without
 
 def StateActionV(parclass):
     class Quality(parclass):
@@ -16,7 +16,7 @@ def StateActionV(parclass):
             Returns greedy action.
             output: Action
             '''
-            return self.mdp[Action](self.tensor.max(dim="actions").indices)
+            return self.mdp[Action](self.plain.max(dim=self.names.index("actions")).indices)
             
         def gather(self, actions):
             '''
@@ -24,7 +24,8 @@ def StateActionV(parclass):
             input: actions - Action, (*batch_shape)
             output: V (actions dimension reduced)
             '''
-            return self.construct(torch_gather(self.tensor, actions.tensor, "actions"))
+            gathered = plain_gather(self.plain, self.names, actions.plain, actions.names, "actions")
+            return self.construct(gathered, plain_without(self.names, "actions"))
         
         def value(self, policy=None):
             '''
@@ -32,9 +33,11 @@ def StateActionV(parclass):
             input: policy - None or Policy
             output: V (actions dimension reduced)
             '''
+            d, names = self.names.index("actions"), plain_without(self.names, "actions")
             if policy is None:
-                return self.construct(self.tensor.max(dim="actions").values)
-            return self.construct((self.tensor * policy.proba.align_as(self.tensor)).sum("actions"))
+                return self.construct(self.plain.max(dim=d).values, names)
+            proba = plain_align(plain_tensor(policy.proba), policy.names, self.names)
+            return self.construct((self.plain * proba).sum(d), names)
 
         def scalar(self):
             return self.value().scalar()
@@ -1,6 +1,7 @@
 from LegoRL.representations.representation import Representation
 
 import torch
+from functools import lru_cache
 
 class V(Representation):
     """
@@ -16,9 +17,9 @@ class V(Representation):
         input: Discount
         output: V (dimensions not changed)
         '''
-        rewards = rewards.tensor.align_as(self.tensor)
-        discounts = discounts.tensor.align_as(self.tensor)
-        return self.construct(rewards + self.tensor * discounts)
+        rewards = self._aligned(rewards)
+        discounts = self._aligned(discounts)
+        return self.construct(rewards + self.plain * discounts, self.names)
 
     def compare(self, target):
         '''
@@ -26,7 +27,7 @@ class V(Representation):
         input: target - V (with same dimensions)
         output: Loss
         '''
-        return self.mdp["Loss"]((target.tensor - self.tensor).pow(2))  
+        return self.mdp["Loss"]((self._aligned(target) - self.plain).pow(2))  
 
     def subtract_v(self, v):
         '''
@@ -34,7 +35,7 @@ class V(Representation):
         input: V
         output: V (dimensions not changed)
         '''
-        return self.construct(self.tensor - v.tensor.align_as(self.tensor))
+        return self.construct(self.plain - self._aligned(v), self.names)
 
     def add_v(self, v):
         '''
@@ -42,7 +43,7 @@ class V(Representation):
         input: V
         output: V (dimensions not changed)
         '''
-        return self.construct(self.tensor + v.tensor.align_as(self.tensor))
+        return self.construct(self.plain + self._aligned(v), self.names)
 
     def scalar(self):
         '''
@@ -70,18 +71,28 @@ class V(Representation):
         '''
         return {}
 
-    def construct(self, tensor):
+    def construct(self, tensor, names=None):
         '''
         Returns class corresponding to names of dimensions of given tensor.
         input: tensor - FloatTensor
+        input: names - names of tensor dimensions, tuple of str or None (tensor is named)
         output: V with dimensions as in input tensor
         '''
+        return self._construction(tensor.names if names is None else names)(tensor)
+
+    @classmethod
+    @lru_cache(maxsize=None)
+    def _construction(cls, names):
+        '''
+        Class for given names of dimensions, created once for each tuple of names.
+        input: names - tuple of str
+        output: class
+        '''
         result = V
-        for name, fabric in self.constructor().items():
-            if name in tensor.names:
+        for name, fabric in cls.constructor().items():
+            if name in names:
                 result = fabric(result)
-        ans = self.mdp[result](tensor)
-        return ans
+        return cls.mdp[result]
     
     @classmethod
     def _default_name(cls):   
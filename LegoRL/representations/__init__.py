@@ -6,6 +6,7 @@ from .V import V
 from .Q import Q
 
 from .categorical import Categorical
-from .quantile import Quantile
+from .quantile import Quantile, ImplicitQuantile
+from .ensemble import Ensemble
 
 from .standard import Embedding, Action
\ No newline at end of file
@@ -2,6 +2,7 @@ from LegoRL.representations.V import V
 
 import torch
 import torch.nn.functional as F
+from LegoRL.utils.namedTensorsUtils import plain_align, plain_without
 
 def Categorical(parclass, Vmin=-10, Vmax=10, num_atoms=51):
     """
@@ -19,18 +20,26 @@ def Categorical(parclass, Vmin=-10, Vmax=10, num_atoms=51):
     assert Vmin < Vmax, "Vmin must be less than Vmax!"
     assert issubclass(parclass, V)
     
-    support = torch.linspace(Vmin, Vmax, num_atoms).refine_names("atoms")
+    support = torch.linspace(Vmin, Vmax, num_atoms)
     delta_z = float(Vmax - Vmin) / (num_atoms - 1)
 
+    # support is moved to each device once
+    supports = {}
+    def support_on(device):
+        if device not in supports:
+            supports[device] = support.to(device)
+        return supports[device]
+
     class CategoricalValue(parclass):
         def expectation(self):
             '''
             Reduces "atoms" dimension by computing expectation
             output: V (atoms dimension reduced)
             '''
-            probabilities = F.softmax(self.tensor, dim="atoms")
-            outcomes = support.to(self.tensor.device).align_as(self.tensor)
-            return self.construct((probabilities * outcomes).sum(dim="atoms"))
+            d = self.names.index("atoms")
+            probabilities = F.softmax(self.plain, dim=d)
+            outcomes = plain_align(support_on(self.plain.device), ("atoms",), self.names)
+            return self.construct((probabilities * outcomes).sum(dim=d), plain_without(self.names, "atoms"))
 
         def one_step(self, rewards, discounts):
             '''
@@ -40,41 +49,41 @@ def Categorical(parclass, Vmin=-10, Vmax=10, num_atoms=51):
             input: Discount
             output: V (dimensions not changed)
             '''
-            distributions = F.softmax(self.tensor, dim="atoms").align_to(..., "atoms")
-            rewards = rewards.tensor.align_as(distributions).rename(None)
-            discounts = discounts.tensor.align_as(distributions).rename(None)                
-            supports = support.to(self.tensor.device).align_as(distributions).rename(None)
-
-            names = distributions.names
-            distributions = distributions.rename(None)
+            # atoms dimension is moved to the end
+            names = plain_without(self.names, "atoms") + ("atoms",)
+            distributions = plain_align(F.softmax(self.plain, dim=self.names.index("atoms")), self.names, names)
+            rewards = plain_align(rewards.plain, rewards.names, names)
+            discounts = plain_align(discounts.plain, discounts.names, names)
+            outcomes = plain_align(support_on(self.plain.device), ("atoms",), names)
             
-            Tz = rewards + discounts * supports
+            Tz = rewards + discounts * outcomes
             Tz = Tz.clamp(min=Vmin, max=Vmax)
             b  = (Tz - Vmin) / delta_z
-            l  = b.floor().long()
-            u  = b.ceil().long()
+            l  = b.floor()
+            u  = b.ceil()
 
-            numel = self.tensor.numel() // num_atoms
-            offset = torch.linspace(0, (numel - 1) * num_atoms, numel).long().view(-1, 1).to(self.tensor.device)
-            
-            proj_dist = torch.zeros_like(distributions)
-            proj_dist.view(-1).index_add_(0, (l + offset).view(-1), (distributions * (u.float() + (b.ceil() == b).float() - b)).view(-1))
-            proj_dist.view(-1).index_add_(0, (u + offset).view(-1), (distributions * (b - l.float())).view(-1))
+            # probability of each atom is split between two neighbouring cells of the grid;
+            # cells and shares do not depend on other dimensions (e.g. actions), so they are broadcasted only when added;
+            # both parts are added in one pass, cells are indexed within the last dimension, so no offsets are needed
+            cells = torch.cat([l, u], -1).long()
+            shares = torch.stack([u + (u == b).float() - b, b - l], dim=-2)
+            parts = (distributions.unsqueeze(-2) * shares).flatten(-2)
+            proj_dist = torch.zeros_like(distributions).scatter_add_(-1, cells.expand_as(parts), parts)
             proj_dist /= proj_dist.sum(-1, keepdims=True)
 
             proj_dist = proj_dist.log()                
-            proj_dist = proj_dist.refine_names(*names).align_as(self.tensor)
-            return self.construct(proj_dist)
+            return self.construct(plain_align(proj_dist, names, self.names), self.names)
 
         def compare(self, target):
             '''
             Calculates KL-divergence between target and this Categorical value.
+            Computed in log-space, so log-probabilities are not clamped.
             input: target - same dimensions
             output: Loss
             '''
-            target_distribution = F.softmax(target.tensor, dim="atoms")
-            distribution = torch.clamp(F.softmax(self.tensor, dim="atoms"), 1e-8, 1 - 1e-8)
-            loss = -(target_distribution * distribution.log()).sum("atoms")
+            d = self.names.index("atoms")
+            target_distribution = F.softmax(self._aligned(target), dim=d)
+            loss = -(target_distribution * F.log_softmax(self.plain, dim=d)).sum(d)
             return self.mdp["Loss"](loss)
 
         def greedy(self):
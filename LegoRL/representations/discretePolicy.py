@@ -14,8 +14,7 @@ class DiscretePolicy(Policy):
         Returns torch.Distribution policy
         output: torch.Categorical
         '''        
-        # PyTorch NamedTensor issues again...
-        return Categorical(logits=self.tensor.rename(None))
+        return Categorical(logits=self.plain)
 
     @property
     def proba(self):
@@ -23,7 +22,7 @@ class DiscretePolicy(Policy):
         Returns torch.Distribution policy
         output: Tensor, (*batch_shape, actions)
         '''        
-        return F.softmax(self.tensor, "actions")
+        return self._as_tensor(F.softmax(self.plain, self.names.index("actions")))
 
     @classmethod
     def uniform(cls):
@@ -31,7 +30,7 @@ class DiscretePolicy(Policy):
         Constructs uniform policy
         output: Policy
         '''
-        return cls(torch.ones(cls.mdp.num_actions, names=("actions",)).to(cls.mdp.device))
+        return cls(torch.ones(cls.mdp.num_actions).to(cls.mdp.device))
 
     @classmethod
     def rshape(cls):
@@ -0,0 +1,68 @@
+from LegoRL.representations.V import V
+
+import torch
+from LegoRL.utils.namedTensorsUtils import plain_without
+
+def Ensemble(parclass, num_members=2):
+    """
+    Ensemble of value functions.
+    Adds new dimension "ensemble" to representation tensor with num_members elements, one for each member.
+    Used for pessimistic estimates (Twin, REDQ) and uncertainty estimation.
+
+    Args:
+        num_members - number of members in ensemble, int
+    """
+    assert issubclass(parclass, V)
+
+    class EnsembleValue(parclass):
+        def min(self, subset=None):
+            '''
+            Reduces ensemble dimension by taking minimum over members.
+            input: subset - size of random subset of members, int or None (all members)
+            output: V (ensemble dimension reduced)
+            '''
+            d = self.names.index("ensemble")
+            values = self.plain
+            if subset is not None:
+                members = torch.randperm(num_members, device=values.device)[:subset]
+                values = values.index_select(d, members)
+            return self.construct(values.min(dim=d).values, plain_without(self.names, "ensemble"))
+
+        def mean(self):
+            '''
+            Reduces ensemble dimension by averaging over members.
+            output: V (ensemble dimension reduced)
+            '''
+            return self.construct(self.plain.mean(dim=self.names.index("ensemble")), plain_without(self.names, "ensemble"))
+
+        def std(self):
+            '''
+            Disagreement of members, estimation of epistemic uncertainty.
+            output: V (ensemble dimension reduced)
+            '''
+            return self.construct(self.plain.std(dim=self.names.index("ensemble")), plain_without(self.names, "ensemble"))
+
+        def greedy(self):
+            return self.mean().greedy()
+
+        def scalar(self):
+            return self.mean().scalar()
+
+        @classmethod
+        def rshape(cls):
+            return torch.Size((num_members,)) + super().rshape()
+
+        @classmethod
+        def rnames(cls):
+            return ("ensemble",) + super().rnames()
+
+        @classmethod
+        def constructor(cls):
+            dims = super().constructor()
+            dims["ensemble"] = lambda parclass: Ensemble(parclass, num_members)
+            return dims
+
+        @classmethod
+        def _default_name(cls):
+            return super()._default_name() + f' in ensemble of {num_members}'
+    return EnsembleValue
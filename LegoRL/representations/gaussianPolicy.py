@@ -14,9 +14,9 @@ class GaussianPolicy(Policy):
         Returns torch.Distribution policy
         output: torch.Normal
         '''
-        # PyTorch NamedTensor issues again...
-        mu = torch.tanh(self.tensor.align_to("musigma", ...)[0].rename(None))
-        sigma = F.softplus(self.tensor.align_to("musigma", ...)[1].rename(None))
+        d = self.names.index("musigma")
+        mu = torch.tanh(self.plain.select(d, 0))
+        sigma = F.softplus(self.plain.select(d, 1))
         
         return MultivariateNormal(mu, torch.diag_embed(sigma))
 
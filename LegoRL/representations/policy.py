@@ -29,8 +29,7 @@ class Policy(Representation):
         input: Action
         output: FloatTensor
         '''
-        #NamedTensors issue
-        component_prob = self.distribution.log_prob(actions.tensor.rename(None))
+        component_prob = self.distribution.log_prob(actions.plain)
         return component_prob
 
     def entropy(self):
@@ -1,5 +1,7 @@
 import torch
 import numpy as np
+from LegoRL.utils.namedTensorsUtils import plain_without
+from LegoRL.utils.quantileRegression import quantile_loss
 
 def Quantile(parclass, num_atoms=51):
     """
@@ -11,7 +13,7 @@ def Quantile(parclass, num_atoms=51):
     Args:
         num_atoms - number of atoms in approximation distribution, int
     """
-    tau = torch.tensor((2 * np.arange(num_atoms) + 1) / (2.0 * num_atoms), names=("atoms",))
+    tau = torch.tensor((2 * np.arange(num_atoms) + 1) / (2.0 * num_atoms), dtype=torch.float32)
 
     class QuantileValue(parclass):
         def expectation(self):
@@ -19,7 +21,7 @@ def Quantile(parclass, num_atoms=51):
             Reduces atoms dimension by computing expectation.
             output: V (atoms dimension reduced)
             '''
-            return self.construct(self.tensor.sum(dim="atoms") / num_atoms)
+            return self.construct(self.plain.sum(dim=self.names.index("atoms")) / num_atoms, plain_without(self.names, "atoms"))
 
         def compare(self, target):
             '''
@@ -27,15 +29,9 @@ def Quantile(parclass, num_atoms=51):
             input: target - V, same dimensions as this
             output: Loss
             '''
-            target = target.tensor.unflatten('atoms', [('atoms', 1),         ('atomsII', num_atoms)])
-            q      =   self.tensor.unflatten('atoms', [('atoms', num_atoms), ('atomsII', 1)])
-            
-            diff = target - q 
-            cmp = diff * (tau.to(diff.device).align_as(diff) - (diff < 0).float())        
-            
-            # mean should be taken across "atomsII" dimension.
-            # NamedTensors mean issue...
-            return self.mdp["Loss"](cmp.sum('atomsII').sum('atoms') / num_atoms)
+            d = self.names.index("atoms")
+            taus = tau.to(self.plain.device).view((1,) * d + (num_atoms,) + (1,) * (self.plain.dim() - d - 1))
+            return self.mdp["Loss"](quantile_loss(self.plain, self._aligned(target), taus, d))
 
         def greedy(self):
             return self.expectation().greedy()
@@ -65,4 +61,88 @@ def Quantile(parclass, num_atoms=51):
         @classmethod
         def _default_name(cls):    
             return super()._default_name() + f' in quantile form with {num_atoms} atoms'
-    return QuantileValue
\ No newline at end of file
+    return QuantileValue
+
+def ImplicitQuantile(parclass):
+    """
+    Implicit quantile value functions.
+    Adds new dimension to representation tensor with quantiles for sampled quantile levels (taus),
+    which are input of the network; size of this dimension is chosen for each call, so it is not part of rshape.
+    Quantile levels are kept in taus property, tensor with shape (*batch_shape, atoms) or (atoms,).
+    Based on: https://arxiv.org/abs/1806.06923
+    """
+    class ImplicitQuantileValue(parclass):
+        taus = None
+
+        @classmethod
+        def from_linear(cls, tensor, taus=None):
+            '''
+            Representation constructor from output of network for given quantile levels.
+            input: tensor - Tensor, (*batch_shape, atoms, unprocessed representation)
+            input: taus - Tensor, quantile levels, (*batch_shape, atoms) or (atoms,), or None (uniform grid)
+            output: Representation
+            '''
+            result = super().from_linear(tensor)
+            result.taus = taus
+            return result
+
+        def construct(self, tensor, names=None):
+            result = super().construct(tensor, names)
+            if "atoms" in result.names:
+                result.taus = self.taus
+            return result
+
+        def _taus(self):
+            '''
+            Quantile levels aligned with representation tensor.
+            output: Tensor
+            '''
+            d = self.names.index("atoms")
+            taus = self.taus
+            if taus is None:
+                num_atoms = self.plain.shape[d]
+                taus = (2 * torch.arange(num_atoms, device=self.plain.device) + 1) / (2.0 * num_atoms)
+            taus = taus.to(self.plain.device, self.plain.dtype)
+            return taus.view((1,) * (d + 1 - taus.dim()) + taus.shape + (1,) * (self.plain.dim() - d - 1))
+
+        def expectation(self):
+            '''
+            Reduces atoms dimension by averaging quantiles for sampled quantile levels.
+            output: V (atoms dimension reduced)
+            '''
+            return self.construct(self.plain.mean(dim=self.names.index("atoms")), plain_without(self.names, "atoms"))
+
+        def compare(self, target):
+            '''
+            Calculates quantile regression loss between target and this Quantile value.
+            input: target - V, same dimensions as this, number of atoms may differ
+            output: Loss
+            '''
+            d = self.names.index("atoms")
+            return self.mdp["Loss"](quantile_loss(self.plain, self._aligned(target), self._taus(), d))
+
+        def greedy(self):
+            return self.expectation().greedy()
+            
+        def value(self, policy=None):
+            if policy is None:
+                return self.gather(self.greedy())
+            return super().value(policy)
+
+        def scalar(self):
+            return self.expectation().scalar()
+
+        @classmethod
+        def rnames(cls):
+            return ("atoms",) + super().rnames()
+
+        @classmethod
+        def constructor(cls):
+            dims = super().constructor()
+            dims["atoms"] = ImplicitQuantile
+            return dims
+
+        @classmethod
+        def _default_name(cls):    
+            return super()._default_name() + ' in implicit quantile form'
+    return ImplicitQuantileValue
\ No newline at end of file
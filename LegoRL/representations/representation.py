@@ -1,7 +1,8 @@
-from LegoRL.utils.namedTensorsUtils import torch_unflatten, torch_index, torch_stack, torch_set_index
+from LegoRL.utils.namedTensorsUtils import plain_tensor, plain_align
 
 import torch
 import numpy as np
+from functools import lru_cache
 
 #from enum import Enum
 #Which = Enum('Which', 'current next last all')
@@ -13,7 +14,10 @@ They add additional features like:
 - handle numpy-PyTorch casts
 - shape checking and naming dimensions.
 
-We use PyTorch 1.3.0 unstable Named Tensors feature to simplify aligning procedures.
+Dimensions are named to simplify aligning procedures.
+Tensors are stored without names; names are kept as Python metadata (see names property)
+and all alignments are resolved by permute / indexing computed once for each tuple of names.
+Whether tensor property returns PyTorch Named Tensor is decided by mdp.named_tensors.
 The motivation lies in using different representations for value functions:
 Q-function  - adds "actions" dimension
 Categorical - adds "atoms" dimension
@@ -32,7 +36,9 @@ class Representation():
         data - Tensor, tuple, list or numpy
 
     Provides:
-        tensor - data in PyTorch Tensor format
+        tensor - data in PyTorch Tensor format (named if mdp.named_tensors)
+        plain - data in PyTorch Tensor format without names
+        names - names of dimensions, tuple of str
         numpy - data in Numpy format
     '''
     def __init__(self, data):
@@ -43,13 +49,13 @@ class Representation():
             data = np.array(data)
         
         # shape / names checking
-        full_name = self._parse_batch_dims(data)
+        self._names = self._parse_batch_dims(data)
         
         # storing data
         if isinstance(data, np.ndarray):
             self._numpy = data
         else:
-            self._tensor = data.refine_names(*full_name)
+            self._tensor = plain_tensor(data, self._names)
     
     @classmethod
     def from_linear(cls, tensor):
@@ -58,12 +64,20 @@ class Representation():
         input: tensor - Tensor, containing unprocessed representation in its last dimension.
         output: Representation
         '''
-        assert tensor.shape[-1] == cls.rshape().numel()
+        rshape, _ = cls._layout()
+        assert tensor.shape[-1] == rshape.numel()
 
-        tensor = tensor.refine_names(..., "features")
-        tensor = torch_unflatten(tensor, "features", zip(cls.rnames(), cls.rshape()))
-        
-        return cls(tensor)
+        tensor = plain_tensor(tensor)
+        return cls(tensor.reshape(tensor.shape[:-1] + rshape))
+
+    @classmethod
+    @lru_cache(maxsize=None)
+    def _layout(cls):
+        '''
+        Shape and names of representation, computed once for each class.
+        output: torch.Size, tuple of strings
+        '''
+        return cls.rshape(), cls.rnames()
 
     def _parse_batch_dims(self, data):
         '''
@@ -72,9 +86,9 @@ class Representation():
         input: data - Tensor or numpy array
         output: full tuple of dimension names - tuple of strings
         '''
-        assert len(self.rshape()) == 0 or data.shape[-len(self.rshape()):] == self.rshape()
+        rshape, names = self._layout()
+        assert len(rshape) == 0 or data.shape[-len(rshape):] == rshape
 
-        names = self.rnames()
         extra_dims = len(data.shape) - len(names)
         assert extra_dims <= 2, "ERROR: Weird batch shape"
 
@@ -91,19 +105,71 @@ class Representation():
             self.rollout_length = data.shape[0]
         return names
 
+    @classmethod
+    def compact(cls, data, scale=None):
+        '''
+        Representation constructor from data kept in narrow dtype (see dtypes of ReplayBuffer).
+        Data stays narrow until it is requested; tensor is cast and scaled after transfer to device.
+        input: data - numpy array
+        input: scale - float or None, multiplier restoring original values
+        output: Representation
+        '''
+        repr = cls(data)
+        repr._compact, repr._scale = repr._numpy, scale
+        del repr._numpy
+        return repr
+
     # Numpy - PyTorch translations all done here:
     @property
     def numpy(self):
         if not hasattr(self, "_numpy"):
-            self._numpy = self._tensor.detach().cpu().numpy()
+            if hasattr(self, "_compact"):
+                widen = self._scale is not None or np.issubdtype(self._compact.dtype, np.floating)
+                self._numpy = self._compact.astype(np.float32) if widen else self._compact
+                if self._scale is not None:
+                    self._numpy *= self._scale
+            else:
+                self._numpy = self._tensor.detach().cpu().numpy()
         return self._numpy
     
     @property
-    def tensor(self):
+    def plain(self):
         if not hasattr(self, "_tensor"):
-            self._tensor = self._TensorType(self._numpy)
-            self._tensor = self._tensor.refine_names(*self._parse_batch_dims(self._tensor))
+            if hasattr(self, "_compact"):
+                self._tensor = self._TensorType(self._compact)
+                if self._scale is not None:
+                    self._tensor = self._tensor * self._scale
+            else:
+                self._tensor = self._TensorType(self._numpy)
         return self._tensor
+
+    @property
+    def tensor(self):
+        if not self.mdp.named_tensors:
+            return self.plain
+        if not hasattr(self, "_named"):
+            self._named = self.plain.refine_names(*self._names)
+        return self._named
+
+    @property
+    def names(self):
+        return self._names
+
+    def _as_tensor(self, tensor):
+        '''
+        Returns tensor with same dimensions as this representation in format of tensor property.
+        input: tensor - Tensor without names
+        output: Tensor
+        '''
+        return tensor.refine_names(*self._names) if self.mdp.named_tensors else tensor
+
+    def _aligned(self, other):
+        '''
+        Returns data of other representation aligned to dimensions of this one.
+        input: other - Representation with subset of dimensions of this one
+        output: Tensor without names
+        '''
+        return plain_align(other.plain, other.names, self._names)
     
     @property
     def _TensorType(self):
@@ -112,23 +178,34 @@ class Representation():
         
     @numpy.setter
     def numpy(self, data):
+        self._names = self._parse_batch_dims(data)
         self._numpy = data
+        if hasattr(self, "_compact"):
+            del self._compact
         if hasattr(self, "_tensor"):
             assert not self._tensor.requires_grad
             del self._tensor
+        if hasattr(self, "_named"):
+            del self._named
 
     @tensor.setter
     def tensor(self, data):
-        full_name = self._parse_batch_dims(data)
-        self._tensor = data.refine_names(*full_name)
+        self._names = self._parse_batch_dims(data)
+        self._tensor = plain_tensor(data, self._names)
+        if hasattr(self, "_named"):
+            del self._named
         if hasattr(self, "_numpy"):
             del self._numpy
+        if hasattr(self, "_compact"):
+            del self._compact
 
     def remove_from_gpu(self):
         if hasattr(self, "_tensor"):
             getattr(self, "numpy")
             assert not self._tensor.requires_grad
             del self._tensor
+        if hasattr(self, "_named"):
+            del self._named
     
     # these two methods define what are dimensions of tensor and what are names.
     @classmethod
@@ -154,14 +231,77 @@ class Representation():
     def total_size(self):
         return self.batch_size * self.rollout_length
 
-    def batch(self, indices):
+    def flatten(self):
+        '''
+        Merges "timesteps" and "batch" dimensions into "batch" (view of data when possible).
+        output: Representation
+        '''
+        if "timesteps" not in self._names:
+            return self
+        if not hasattr(self, "_tensor"):
+            return type(self)(self.numpy.reshape((-1,) + self.numpy.shape[2:]))
+        return type(self)(self.plain.flatten(0, 1))
+
+    def batch(self, indices, keep_timesteps=False):
         '''
-        Returns subset by given indices
-        input: indices - numpy array, ints
+        Returns subset by given indices of transitions, i.e. positions in flattened (timesteps, batch) dimensions.
+        If keep_timesteps, indices are positions along "batch" dimension, so that whole trajectories are selected.
+        Data in numpy stays in numpy.
+        input: indices - numpy array or LongTensor (on device of data), ints
+        input: keep_timesteps - bool
         output: Representation
         '''
-        data = self.tensor.flatten(["timesteps", "batch"], "batch")
-        return type(self)(torch_index(data, indices))
+        assert "batch" in self._names, "Error: representation has no batch dimension"
+        data = self if keep_timesteps else self.flatten()
+        d = data.names.index("batch")
+        
+        if not hasattr(data, "_tensor"):
+            return type(self)(np.take(data.numpy, indices.cpu().numpy() if torch.is_tensor(indices) else indices, axis=d))
+        return type(self)(data.plain.index_select(d, torch.as_tensor(indices, device=data.plain.device)))
+
+    def split(self, size):
+        '''
+        Splits representation along "batch" dimension into chunks (views of data).
+        input: size - size of chunk, int
+        output: list of Representation
+        '''
+        d = self._names.index("batch")
+        if not hasattr(self, "_tensor"):
+            return [type(self)(chunk) for chunk in np.split(self.numpy, range(size, self.batch_size, size), axis=d)]
+        return [type(self)(chunk) for chunk in self.plain.split(size, d)]
+
+    @classmethod
+    def cat(cls, representations):
+        '''
+        Concatenates representations along "batch" dimension.
+        input: representations - list of Representation
+        output: Representation
+        '''
+        d = representations[0].names.index("batch")
+        if not any(hasattr(r, "_tensor") for r in representations):
+            return cls(np.concatenate([r.numpy for r in representations], axis=d))
+        return cls(torch.cat([r.plain for r in representations], d))
+
+    def to(self, device, non_blocking=False):
+        '''
+        Returns representation with data on given device (this one if data is already there).
+        input: device - str or torch.device
+        input: non_blocking - whether transfer may be asynchronous (for data in pinned memory), bool
+        output: Representation
+        '''
+        tensor = self.plain
+        moved = tensor.to(device, non_blocking=non_blocking)
+        return self if moved is tensor else type(self)(moved)
+
+    def pin_memory(self):
+        '''
+        Returns representation with tensor data in page-locked memory for asynchronous transfer to GPU.
+        Data in numpy is left as is, as it is staged through pinned buffers on conversion (see TensorBridge).
+        output: Representation
+        '''
+        if not hasattr(self, "_tensor") or self._tensor.device.type != "cpu" or not torch.cuda.is_available():
+            return self
+        return type(self)(self._tensor.pin_memory())
 
     def append(self, last):
         '''
@@ -169,16 +309,16 @@ class Representation():
         input: last - Representation
         output: Representation
         '''
-        if "timesteps" in self.tensor.names:
-            return type(self)(torch.cat([self.tensor, last.tensor.align_as(self.tensor)], "timesteps"))
-        return type(self)(torch_stack([self.tensor, last.tensor], 0, "timesteps"))
+        if "timesteps" in self._names:
+            return type(self)(torch.cat([self.plain, self._aligned(last)], self._names.index("timesteps")))
+        return type(self)(torch.stack([self.plain, plain_align(last.plain, last.names, self._names)]))
 
     def detach(self):
-        self.tensor = self.tensor.detach()
+        self.tensor = self.plain.detach()
         return self
 
     def clamp(self, low, high):
-        return type(self)(torch.clamp(self.tensor, low, high))
+        return type(self)(torch.clamp(self.plain, low, high))
 
     def __getitem__(self, idx):
         '''
@@ -190,10 +330,8 @@ class Representation():
             else:
                 return type(self)(self.numpy[idx])
         elif isinstance(idx, Representation):
-            return type(self)(torch_index(self.tensor, idx.tensor))
-        elif isinstance(idx, np.ndarray):
-            return type(self)(torch_index(self.tensor, idx))      
-        return type(self)(self.tensor[idx])
+            return type(self)(self.plain[idx.plain])
+        return type(self)(self.plain[idx])
 
     def __setitem__(self, idx, value):
         '''
@@ -207,10 +345,15 @@ class Representation():
                 self.numpy[idx] = value.numpy
             else:
                 self.numpy[idx] = value
-        elif isinstance(value, Representation):
-            self.tensor = torch_set_index(self.tensor, idx, value.tensor)
         else:
-            self.tensor = torch_set_index(self.tensor, idx, value)
+            if isinstance(idx, Representation):
+                idx = idx.plain
+            if isinstance(value, Representation):
+                value = value.plain
+
+            data = self.plain
+            data[idx] = value
+            self.tensor = data
 
     def __iadd__(self, other):
         '''
@@ -222,9 +365,9 @@ class Representation():
             else:
                 self.numpy += other
         elif isinstance(other, Representation):
-            self.tensor += other.tensor
+            self.tensor = self.plain.add_(self._aligned(other))
         else:
-            self.tensor += other
+            self.tensor = self.plain.add_(other)
         return self
 
     def __imul__(self, other):
@@ -237,9 +380,9 @@ class Representation():
             else:
                 self.numpy *= other
         elif isinstance(other, Representation):
-            self.tensor *= other.tensor
+            self.tensor = self.plain.mul_(self._aligned(other))
         else:
-            self.tensor *= other
+            self.tensor = self.plain.mul_(other)
         return self
 
     def __mul__(self, other):
@@ -252,9 +395,9 @@ class Representation():
             else:
                 return type(self)(self.numpy * other)
         elif isinstance(other, Representation):
-            return type(self)(self.tensor * other.tensor.align_as(self.tensor))
+            return type(self)(self.plain * self._aligned(other))
         else:
-            return type(self)(self.tensor * other)
+            return type(self)(self.plain * other)
         return self
 
     def __add__(self, other):
@@ -267,9 +410,9 @@ class Representation():
             else:
                 return type(self)(self.numpy + other)
         elif isinstance(other, Representation):
-            return type(self)(self.tensor + other.tensor.align_as(self.tensor))
+            return type(self)(self.plain + self._aligned(other))
         else:
-            return type(self)(self.tensor + other)
+            return type(self)(self.plain + other)
         return self
 
     def __sub__(self, other):
@@ -282,9 +425,9 @@ class Representation():
             else:
                 return type(self)(self.numpy - other)
         elif isinstance(other, Representation):
-            return type(self)(self.tensor - other.tensor.align_as(self.tensor))
+            return type(self)(self.plain - self._aligned(other))
         else:
-            return type(self)(self.tensor - other)
+            return type(self)(self.plain - other)
         return self
 
     __rmul__ = __mul__
@@ -296,4 +439,4 @@ class Representation():
         return cls.__name__
 
     def __repr__(self):
-        return f"{self._default_name()} {self.numpy.shape}"
\ No newline at end of file
+        return f"{self._default_name()} {self.numpy.shape}"
\ No newline at end of file
@@ -1,6 +1,7 @@
 from LegoRL.representations.representation import Representation
 
 import torch
+from LegoRL.utils.namedTensorsUtils import plain_tensor, plain_flatten
 
 class State(Representation):
     '''
@@ -15,7 +16,7 @@ class State(Representation):
         return tuple("observationI" + "I"*k for k in range(len(cls.mdp.observation_shape)))
 
     def raw_embedding(self):
-        return self.mdp[Embedding(self.rshape().numel())](self.tensor.rename(...).flatten(list(self.rnames()), "features"))
+        return self.mdp[Embedding(self.rshape().numel())](plain_flatten(self.plain, len(self.rnames())))
     
     #def compare(self, other):
     #    return self.raw_embedding().compare(other.raw_embedding())
@@ -37,8 +38,8 @@ class Action(Representation):
         return tuple("actionI" + "I"*k for k in range(len(cls.mdp.action_shape)))
 
     def raw_embedding(self):
-        preprocess = self.mdp.action_preprocessing(self.tensor)
-        return self.mdp[Embedding(self.rshape().numel())](preprocess.rename(...).flatten(list(self.rnames()), "features"))
+        preprocess = plain_tensor(self.mdp.action_preprocessing(self.plain))
+        return self.mdp[Embedding(self.rshape().numel())](plain_flatten(preprocess, len(self.rnames())))
 
     @property
     def _TensorType(self):
@@ -61,7 +62,7 @@ class Reward(Representation):
         return tuple()
 
     def compare(self, other):
-       return self.mdp["Loss"]((self.tensor - other.tensor)**2)
+       return self.mdp["Loss"]((self.plain - self._aligned(other))**2)
 
     @classmethod
     def _default_name(cls):   
@@ -121,8 +122,8 @@ def Embedding(size=0, emb_name="Embedding"):
             return ("features",) if cls.embedding_size else tuple()
 
         def compare(self, other):
-            cmp = (self.tensor - other.tensor)**2
-            return self.mdp["Loss"](cmp.sum(dim="features") if self.embedding_size else cmp)
+            cmp = (self.plain - self._aligned(other))**2
+            return self.mdp["Loss"](cmp.sum(dim=self.names.index("features")) if self.embedding_size else cmp)
 
         # TODO: error, for loss it is not working
         @classmethod
@@ -5,6 +5,7 @@ from copy import copy
 class NstepLatency(RLmodule): 
     """
     Stores transitions more than on one step.
+    See also n_steps of Sampler, which computes n-step transitions from replay when batch is sampled.
     
     Args:
         n_steps - N steps, int
@@ -1,30 +1,36 @@
 from LegoRL.core.RLmodule import RLmodule
 
-import numpy as np
-from torch.utils.data.sampler import BatchSampler, SubsetRandomSampler
+import torch
 
 class EpochedRollout(RLmodule):
     """
     Performs several epochs through collected rollout.
     Used for "reusing" samples in policy gradients algorithms.
     Based on: https://arxiv.org/abs/1707.06347
+
+    Rollout is flattened once when it is set. On each epoch one permutation is drawn
+    and data is reordered by it once; mini-batches are then views of consecutive slices.
+    With shuffle_trajectories, whole trajectories of environments are shuffled instead of transitions
+    (for recurrent policies); mini-batches then keep "timesteps" dimension.
     
     Args:
         epochs - number of epochs to run through rollout on each update
-        batch_size - size of mini-batch to select without replacement on each gradient ascent step   
+        batch_size - size of mini-batch to select without replacement on each gradient ascent step
+                     (number of trajectories if shuffle_trajectories)
+        shuffle_trajectories - whether to shuffle whole trajectories, bool
 
     Provides: sample
     """
-    def __init__(self, sys, epochs = 3, batch_size=32):
+    def __init__(self, sys, epochs = 3, batch_size=32, shuffle_trajectories=False):
         super().__init__(sys)
 
         self.epochs = epochs
         self.batch_size = batch_size
+        self.shuffle_trajectories = shuffle_trajectories
 
-        self._sampler_idx = 0
         self._epochs_cnt = 0
         self.data = None
-        self._sampler = None
+        self._minibatches = []
 
     def new_dataset(self, storage):
         '''
@@ -32,9 +38,22 @@ class EpochedRollout(RLmodule):
         input: Storage
         '''
         assert self.data is None
-        self.data = storage
+        self.data = storage if self.shuffle_trajectories else storage.flatten()
         self._epochs_cnt = 0
-        self._sampler = None
+        self._minibatches = []
+
+    def _epoch(self):
+        '''
+        Reorders data by new permutation and splits it into mini-batches.
+        output: list of Storage, in reversed order
+        '''
+        size = next(iter(self.data.values())).batch_size
+        assert size >= self.batch_size, "Error: rollout is smaller than mini-batch"
+
+        # incomplete last mini-batch is dropped
+        permutation = torch.randperm(size, device=self.mdp.device)[:size - size % self.batch_size]
+        shuffled = self.data.index(permutation, keep_timesteps=self.shuffle_trajectories)
+        return shuffled.split(self.batch_size)[::-1]
 
     def sample_next(self):
         '''
@@ -43,20 +62,15 @@ class EpochedRollout(RLmodule):
         if self.data is None:
             return None
 
-        # if we do not have sampler yet
-        if self._sampler is None:
-            self._sampler_idx = 0
-            self._sampler = list(BatchSampler(SubsetRandomSampler(range(self.data.total_size())), self.batch_size, drop_last=True))
+        # if epoch is started
+        if len(self._minibatches) == 0:
+            self._minibatches = self._epoch()
                 
         # next batch
-        indices = np.array(self._sampler[self._sampler_idx])
-        self._sampler_idx += 1
-        
-        sample = self.data.batch(indices)
-
-        # if sampler ended, epoch is finished
-        if self._sampler_idx >= len(self._sampler):
-            self._sampler = None
+        sample = self._minibatches.pop()
+
+        # if mini-batches ended, epoch is finished
+        if len(self._minibatches) == 0:
             self._epochs_cnt += 1
 
             # if epochs ended, rollout is finished
@@ -67,7 +81,7 @@ class EpochedRollout(RLmodule):
         return sample
 
     def hyperparameters(self):
-        return {"epochs": self.epochs, "batch_size": self.batch_size}
+        return {"epochs": self.epochs, "batch_size": self.batch_size, "shuffle_trajectories": self.shuffle_trajectories}
 
     def __repr__(self):
         return f"Performs {self.epochs} epoches with batches of size {self.batch_size} on provided dataset"
\ No newline at end of file
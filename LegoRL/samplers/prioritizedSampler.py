@@ -1,6 +1,7 @@
 from LegoRL.core.RLmodule import RLmodule
 from LegoRL.samplers.sampler import Sampler
 
+import threading
 import numpy as np
 
 class SumTree():
@@ -20,6 +21,7 @@ class SumTree():
     def __init__(self, capacity):
         self.capacity = capacity  # for all priority values
         self.tree = np.zeros(2 * capacity - 1)
+        self._depth = int(np.ceil(np.log2(capacity))) if capacity > 1 else 0   # depth of the deepest leaves
         # [--------------parent nodes-------------][-------leaves to record priority-------]
         #             size: capacity - 1                       size: capacity
 
@@ -58,6 +60,61 @@ class SumTree():
                     parent_idx = cr_idx
 
         return leaf_idx - (self.capacity - 1)
+
+    def update_many(self, idxs, ps):
+        """
+        Batched version of update: sets leaves and recomputes their ancestors level by level.
+        If index is repeated, the last priority is used.
+        input: idxs - numpy array of ints, ids of leaves to update
+        input: ps - numpy array of floats, new priority values
+        """
+        idxs = np.asarray(idxs, dtype=np.int64)
+        assert (idxs < self.capacity).all(), "SumTree overflow"
+
+        nodes = idxs + self.capacity - 1
+        self.tree[nodes] = ps
+        
+        # leaves lie on at most two neighbouring levels; the shallower ones reach the root earlier
+        # and then recompute it on each step, so every node is finally computed after its children
+        for _ in range(self._depth):
+            nodes = np.maximum(nodes - 1, 0) // 2
+            self.tree[nodes] = self.tree[2 * nodes + 1] + self.tree[2 * nodes + 2]
+
+    def get_leaves(self, values):
+        """
+        Batched version of get_leaf: all queries descend the tree simultaneously.
+        input: values - numpy array of floats, cumulative priorities
+        output: numpy array of ints, selected indices
+        """
+        values = np.array(values, dtype=self.tree.dtype)
+        nodes = np.zeros(len(values), dtype=np.int64)
+
+        def descend(nodes, values):
+            cl_idx = 2 * nodes + 1
+            left = self.tree[cl_idx]
+            go_right = (values > left) & (self.tree[cl_idx + 1] != 0.0)
+            return cl_idx + go_right, values - np.where(go_right, left, 0)
+
+        # all nodes above the shallowest leaves are internal
+        for _ in range(int(np.log2(self.capacity))):
+            nodes, values = descend(nodes, values)
+
+        # when capacity is not a power of two, part of leaves is one level deeper
+        internal = nodes < self.capacity - 1
+        if internal.any():
+            nodes[internal], _ = descend(nodes[internal], values[internal])
+
+        return nodes - (self.capacity - 1)
+
+    def sample(self, batch_size):
+        """
+        Stratified sampling: total priority is split into batch_size equal segments,
+        one index is drawn from each.
+        input: batch_size - int
+        output: numpy array of ints, selected indices
+        """
+        segment = self.total_p / batch_size
+        return self.get_leaves((np.arange(batch_size) + np.random.uniform(size=batch_size)) * segment)
         
     def __getitem__(self, indices):
         return self.tree[indices + self.capacity - 1]
@@ -66,18 +123,57 @@ class SumTree():
     def total_p(self):
         return self.tree[0]  # the root is sum of all priorities
 
+class MinTree():
+    """
+    Stores the priorities in min-segment tree: each node keeps minimum of its subtree.
+    Layout is the same as in SumTree; empty leaves are +inf.
+    Provides minimum priority over all stored transitions in O(1) with O(log n) updates.
+    """
+
+    def __init__(self, capacity):
+        self.capacity = capacity
+        self.tree = np.full(2 * capacity - 1, np.inf)
+        self._depth = int(np.ceil(np.log2(capacity))) if capacity > 1 else 0
+
+    def update_many(self, idxs, ps):
+        """
+        Sets leaves and recomputes their ancestors level by level (see SumTree.update_many).
+        input: idxs - numpy array of ints, ids of leaves to update
+        input: ps - numpy array of floats, new priority values
+        """
+        idxs = np.asarray(idxs, dtype=np.int64)
+        assert (idxs < self.capacity).all(), "MinTree overflow"
+
+        nodes = idxs + self.capacity - 1
+        self.tree[nodes] = ps
+        for _ in range(self._depth):
+            nodes = np.maximum(nodes - 1, 0) // 2
+            self.tree[nodes] = np.minimum(self.tree[2 * nodes + 1], self.tree[2 * nodes + 2])
+
+    @property
+    def min_p(self):
+        return self.tree[0]  # the root is minimum of all priorities
+
 class PrioritizedSampler(Sampler):
     """
     Prioritized sampler.
     Based on: https://arxiv.org/abs/1511.05952
 
+    When batches are prefetched (see Sampler), they are drawn with priorities known at that moment.
+    Batch is dropped if priorities were updated more than max_staleness times since it was drawn.
+    Updates of priorities for slots overwritten by new transitions after the batch was drawn are ignored.
+
+    Batch is provided with priorities of its transitions and with minimum priority in the whole buffer,
+    which is used by SamplerBiasCorrection to normalize weights.
+
     Args:
         clip_priorities - float or None, clipping priorities as suggested in original paper
         rp_alpha - smoothing of priorities
+        max_staleness - int or None, number of priority updates prefetched batch may lag behind (None - any)
 
     Provides: sample, update_priorities
     """
-    def __init__(self, par, replay, clip_priorities=1, rp_alpha=0.6, *args, **kwargs):
+    def __init__(self, par, replay, clip_priorities=1, rp_alpha=0.6, max_staleness=None, *args, **kwargs):
         super().__init__(par, replay, *args, **kwargs)
         
         self._previous_buffer_pos = 0        
@@ -85,22 +181,46 @@ class PrioritizedSampler(Sampler):
         self.clip_priorities = clip_priorities
         self.rp_alpha = rp_alpha
         self.priorities = SumTree(self.replay.capacity)
+        self.min_priorities = MinTree(self.replay.capacity)
+
+        # tree is shared with background thread
+        self.max_staleness = max_staleness
+        self._lock = threading.Lock()
+        self._updates = 0                                            # number of update_priorities calls
+        self._expansions = 0                                         # number of expand calls
+        self._expanded_at = np.zeros(self.replay.capacity, dtype=np.int64)   # when slot was last expanded
+        self._drawn_at = 0                                           # _expansions when returned batch was drawn
+
+    def _draw(self):
+        with self._lock:
+            # sample batch_size indices
+            batch_indices = self.priorities.sample(self.batch_size)
+            priorities = self.priorities[batch_indices]
+            min_priority = self.min_priorities.min_p
+            tag = (self._updates, self._expansions)
+        
+        # get transitions with these indices
+        sample = self._gather(batch_indices)
+        sample.priorities = priorities
+        sample.indices = batch_indices
+        sample.min_priority = min_priority
+        return tag, sample
+
+    def _fresh(self, tag):
+        updates, expansions = tag
+        if self.max_staleness is not None and self._updates - updates > self.max_staleness:
+            return False
+        self._drawn_at = expansions
+        return True
 
     def sample(self):
         '''
         Samples batch using priorities.
         output: Storage
         '''
-        if len(self.replay) < self.cold_start:
-            return None
-
-        # sample batch_size indices
-        batch_indices = np.array([self.priorities.get_leaf(np.random.uniform(0, self.priorities.total_p)) for _ in range(self.batch_size)])
-        
-        # get transitions with these indices
-        self._sample = self.replay.at(batch_indices)
-        self._sample.priorities = self.priorities[batch_indices]
-        self._sample.indices = batch_indices
+        if not self.prefetch:
+            self._drawn_at = self._expansions
+        self._sample = super().sample()
         return self._sample
 
     def expand(self, indices):
@@ -108,8 +228,11 @@ class PrioritizedSampler(Sampler):
         Expand priorities with max priority
         input: indices - numpy array, int
         '''
-        for idx in indices:
-            self.priorities.update(idx, self.max_priority)
+        with self._lock:
+            self._expansions += 1
+            self._expanded_at[indices] = self._expansions
+            self.priorities.update_many(indices, np.full(len(indices), self.max_priority))
+            self.min_priorities.update_many(indices, np.full(len(indices), self.max_priority))
 
     def update_priorities(self, indices, new_priorities):
         '''
@@ -118,14 +241,20 @@ class PrioritizedSampler(Sampler):
         input: new_priorities - Loss
         '''
         new_priorities = (new_priorities.numpy ** self.rp_alpha).clip(min=1e-5, max=self.clip_priorities)
-        for i, v in zip(indices, new_priorities):
-            self.priorities.update(i, v)
+
+        with self._lock:
+            # slots overwritten after the batch was drawn keep priorities of new transitions
+            indices = np.asarray(indices)
+            kept = self._expanded_at[indices] <= self._drawn_at
+            self.priorities.update_many(indices[kept], new_priorities[kept])
+            self.min_priorities.update_many(indices[kept], new_priorities[kept])
+            self._updates += 1
         
         # update max priority for new transitions
         self.max_priority = max(self.max_priority, new_priorities.max())
 
     def hyperparameters(self):
-        return {"clip_priorities": self.clip_priorities, "rp_alpha": self.rp_alpha}
+        return {"clip_priorities": self.clip_priorities, "rp_alpha": self.rp_alpha, "max_staleness": self.max_staleness}
         
     def __repr__(self):
         return f"Samples mini-batch from <{self.replay.name}> using priorities"
\ No newline at end of file
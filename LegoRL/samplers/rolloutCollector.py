@@ -1,38 +1,107 @@
 from LegoRL.core.RLmodule import RLmodule
 from LegoRL.buffers.storage import Storage
+from LegoRL.representations.representation import Representation
+
+import torch
+import numpy as np
 
 class RolloutCollector(RLmodule):
     """
     Collects rollouts of given length from runner.
     Based on: https://arxiv.org/abs/1312.5602
+
+    On the first step of each rollout, a buffer of shape (rollout_length, *shape of step) is allocated for each key
+    and steps are written into it in place, so the collected rollout is returned without stacking.
+    Data given as tensors (i.e. outputs of networks) is kept as tensors on its device, gradients are preserved;
+    data given as numpy arrays is kept in numpy.
+
+    With cache_old, values fixed for the whole rollout are computed once when it is finished (for PPO losses);
+    this is an extra pass over the rollout, so it is disabled by default:
+        - "old_log_prob" - log-probabilities of "actions" under "policy", if both keys are collected;
+        - "old_V" - detached copy of "V", if it is collected.
     
     Args:
         rollout_length - length of rollout to collect on each iteration, int        
+        cache_old - whether to add old_log_prob and old_V to finished rollouts, bool
 
     Provides: sample
     """
-    def __init__(self, sys, rollout_length = 5):
+    def __init__(self, sys, rollout_length = 5, cache_old=False):
         super().__init__(sys)
 
         self.rollout_length = rollout_length
-        self._rollout = []
+        self.cache_old = cache_old
+        self._buffers = None
+        self._types = None
+        self._step = 0
+
+    def _allocate(self, storage):
+        '''
+        Creates buffers for new rollout by example of its first step.
+        input: Storage
+        output: dict <str, Tensor or numpy array>
+        '''
+        buffers = {}
+        for key, data in storage.items():
+            if isinstance(data, Representation) and hasattr(data, "_tensor"):
+                tensor = data.plain
+                buffers[key] = torch.empty((self.rollout_length,) + tuple(tensor.shape), dtype=tensor.dtype, device=tensor.device)
+            else:
+                array = data.numpy if isinstance(data, Representation) else np.asarray(data)
+                buffers[key] = np.empty((self.rollout_length,) + array.shape, dtype=array.dtype)
+        return buffers
 
     def add(self, storage):
         """
         Adds transitions from runner to rollout and creates a sample if desired length is reached.
         """
-        self._rollout.append(storage)
-        assert len(self._rollout) <= self.rollout_length        
+        if self._step == 0:
+            self._buffers = self._allocate(storage)
+            self._types = {key: type(data) for key, data in storage.items()}
+        assert storage.keys() == self._buffers.keys(), "Error: keys of transitions changed during rollout"
+
+        for key, data in storage.items():
+            buffer = self._buffers[key]
+            if isinstance(buffer, torch.Tensor):
+                buffer[self._step] = data.plain
+            else:
+                buffer[self._step] = data.numpy if isinstance(data, Representation) else data
+        self._step += 1
         
-        if len(self._rollout) == self.rollout_length:
-            dataset = Storage.from_list(self._rollout)
-            self._rollout = []
+        if self._step == self.rollout_length:
+            dataset = Storage({key: self._wrap(key, buffer) for key, buffer in self._buffers.items()})
+            if self.cache_old:
+                self._cache_old(dataset)
+            self._buffers = None
+            self._step = 0
             return dataset
         
         return None
 
+    def _wrap(self, key, buffer):
+        '''
+        Wraps filled buffer into representation of its key.
+        input: key - str
+        input: buffer - Tensor or numpy array
+        output: Representation or numpy array
+        '''
+        if not issubclass(self._types[key], Representation):
+            return buffer
+        return self._types[key](buffer)
+
+    def _cache_old(self, dataset):
+        '''
+        Adds values of old policy and critic, computed for the whole rollout at once.
+        input: dataset - Storage
+        '''
+        with torch.no_grad():
+            if "policy" in dataset and "actions" in dataset:
+                dataset.old_log_prob = self.mdp["Log Probability"](dataset.policy.log_prob(dataset.actions).detach())
+            if "V" in dataset:
+                dataset.old_V = type(dataset.V)(dataset.V.plain.detach())
+
     def hyperparameters(self):
         return {"rollout_length": self.rollout_length}
 
     def __repr__(self):
-        return f"Collects rollouts of length {self.rollout_length}"
\ No newline at end of file
+        return f"Collects rollouts of length {self.rollout_length}"
@@ -1,38 +1,134 @@
 from LegoRL.core.RLmodule import RLmodule
 
+import queue
+import threading
+import numpy as np
 from numpy.random import randint
 
 class Sampler(RLmodule):
     """
     Basic uniform mini-batch sampling from replay buffer.
     Based on: https://arxiv.org/abs/1312.5602
-    
+
+    With prefetch > 0, batches are drawn by a background thread and kept in a bounded queue
+    already converted to tensors, so sample only takes the next one.
+
+    With n_steps > 1, rewards, discounts and next_states of sampled transitions are substituted
+    with n-step ones using episode index of replay (see ReplayBuffer.nstep_at).
+    If list of values is given, n is chosen randomly for each transition;
+    targets need no changes, as discounts already contain gamma^n.
+
     Args:
         replay - ReplayBuffer
         batch_size - size of sampled batches, int
         cold_start - size of buffer before providing samples, int
+        prefetch - number of batches prepared in advance, int (0 - no background thread)
+        n_steps - number of steps for returns, int or list of ints
 
-    Provides: sample
+    Provides: sample, close
     """
-    def __init__(self, par, replay, batch_size=32, cold_start=100):
+    def __init__(self, par, replay, batch_size=32, cold_start=100, prefetch=0, n_steps=1):
         super().__init__(par)
 
         assert cold_start >= batch_size, "Batch size must be smaller than cold_start!"
         self.replay = replay
         self.batch_size = batch_size
         self.cold_start = cold_start
+        self.n_steps = n_steps
+
+        self.prefetch = prefetch
+        self._queue = None
+        self._worker = None
+        self._stop = threading.Event()
+
+    def _draw(self):
+        '''
+        Draws new mini-batch from replay.
+        output: tag of batch (see _fresh), Storage
+        '''
+        indices = randint(0, len(self.replay), self.batch_size)
+        return None, self._gather(indices)
+
+    def _gather(self, indices):
+        '''
+        Gets transitions on given indices from replay.
+        input: indices - numpy array of ints
+        output: Storage
+        '''
+        if np.isscalar(self.n_steps):
+            if self.n_steps == 1:
+                return self.replay.at(indices)
+            return self.replay.nstep_at(indices, self.n_steps)
+        return self.replay.nstep_at(indices, np.random.choice(self.n_steps, len(indices)))
+
+    def _fresh(self, tag):
+        '''
+        Decides whether prefetched batch may still be used.
+        input: tag - tag returned by _draw with this batch
+        output: bool
+        '''
+        return True
+
+    def _prefetching(self):
+        '''
+        Body of background thread: fills the queue until close is called.
+        Exceptions are passed through the queue to be raised in sample.
+        '''
+        while not self._stop.is_set():
+            try:
+                tag, batch = self._draw()
+
+                # numpy -> torch conversion and transfer are done in the background
+                item = (tag, batch.to(self.mdp.device))
+            except Exception as e:
+                item = (None, e)
+
+            while not self._stop.is_set():
+                try:
+                    self._queue.put(item, timeout=0.1)
+                    break
+                except queue.Full:
+                    pass
+
+            if isinstance(item[1], Exception):
+                return
 
     def sample(self):
         """
-        Generates a new mini-batch into self._sample.
+        Generates a new mini-batch.
         output: Storage
         """
-        if len(self.replay) >= self.cold_start:
-            indices = randint(0, len(self.replay), self.batch_size)
-            return self.replay.at(indices)
+        if len(self.replay) < self.cold_start:
+            return None
+
+        if not self.prefetch:
+            return self._draw()[1]
+
+        if self._worker is None:
+            self._stop.clear()
+            self._queue = queue.Queue(maxsize=self.prefetch)
+            self._worker = threading.Thread(target=self._prefetching, daemon=True)
+            self._worker.start()
+
+        while True:
+            tag, batch = self._queue.get()
+            if isinstance(batch, Exception):
+                self._worker = None
+                raise batch
+            if self._fresh(tag):
+                return batch
+
+    def close(self):
+        '''Stops background thread; it is restarted on next sample.'''
+        if self._worker is not None:
+            self._stop.set()
+            self._worker.join()
+            self._worker = None
 
     def hyperparameters(self):
-        return {"batch_size": self.batch_size, "cold_start": self.cold_start}
+        return {"batch_size": self.batch_size, "cold_start": self.cold_start, "n_steps": self.n_steps}
 
     def __repr__(self):
-        return f"Samples mini-batches uniformly"
\ No newline at end of file
+        if self.prefetch:
+            return f"Samples mini-batches uniformly, preparing {self.prefetch} in background"
+        return f"Samples mini-batches uniformly"
@@ -19,17 +19,21 @@ class SamplerBiasCorrection(RLmodule):
         self.hyperparameters = lambda: {"rp_beta_start": rp_beta_start, "rp_beta_iterations": rp_beta_iterations}
         self.rp_beta = lambda: min(1.0, rp_beta_start + self.system.iterations * (1.0 - rp_beta_start) / rp_beta_iterations)
 
-    def __call__(self, priorities):
+    def __call__(self, priorities, min_priority=None):
         '''
         Returns a sample of batches.
         input: priorities - Loss
+        input: min_priority - float, minimum priority in the whole buffer (if None, minimum in batch is used)
         output: Weights
         '''
+        if min_priority is None:
+            min_priority = priorities.min()
+
         # calculating importance sampling weights to evade bias
         # these weights are annealed to be more like uniform at the beginning of learning
-        weights  = (priorities) ** (-self.rp_beta())
-        # these weights are normalized as proposed in the original article to make loss function scale more stable.
-        weights /= priorities.min() ** (-self.rp_beta())
+        # they are normalized by the maximum weight over the buffer as proposed in the original article
+        # to make loss function scale more stable; so all weights are not greater than 1.
+        weights = (priorities / min_priority) ** (-self.rp_beta())
 
         # logs
         self.log("mean weight", np.mean(weights), "weights")
@@ -37,4 +41,4 @@ class SamplerBiasCorrection(RLmodule):
         return self.mdp["Weights"](weights)
 
     def __repr__(self):
-        return f"Adds weights to correct bias"
\ No newline at end of file
+        return f"Adds weights to correct bias"
\ No newline at end of file
@@ -1,5 +1,6 @@
 from LegoRL.core.RLmodule import RLmodule
 from LegoRL.buffers.storage import stack
+from LegoRL.utils.returns import gae_advantages
 
 import torch
 
@@ -7,6 +8,9 @@ class GAE(RLmodule):
     """
     Generalized Advantage Estimation (GAE) upgrade of A2C.
     Based on: https://arxiv.org/abs/1506.02438
+
+    For scalar V, whole rollout is processed by reverse scan over plain tensors (see utils.returns);
+    other representations are processed step by step.
     
     Args:
         tau - float, from 0 to 1
@@ -27,6 +31,10 @@ class GAE(RLmodule):
         output: V
         '''
         with torch.no_grad():
+            if len(values.rnames()) == 0 and len(last_V.rnames()) == 0:
+                advantages = gae_advantages(values._aligned(rewards), values.plain, values._aligned(discounts), last_V.plain, self.tau)
+                return values.construct(advantages, values.names)
+
             returns = []
             gae = 0
             next_values = last_V
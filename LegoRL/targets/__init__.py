@@ -4,5 +4,9 @@ from .twin import Twin
 
 from .maxtrace import MaxTrace
 from .GAE import GAE
+from .tdlambda import TDLambda
+
+from .vtrace import VTrace
+from .retrace import Retrace
 
 from .advantageNormalizer import AdvantageNormalizer
\ No newline at end of file
@@ -1,5 +1,7 @@
 from LegoRL.core.RLmodule import RLmodule
 from LegoRL.buffers.storage import stack
+from LegoRL.utils.returns import maxtrace_returns
+from LegoRL.utils.namedTensorsUtils import plain_align
 
 import torch
 
@@ -7,6 +9,9 @@ class MaxTrace(RLmodule):
     """
     MaxTrace return estimator.
     Q(s, a) ~ r(s') + r(s'') + ... V(s_{last})
+
+    For scalar V, whole rollout is processed by reverse scan over plain tensors (see utils.returns);
+    other representations are processed step by step.
     """
     def __call__(self, rewards, discounts, last_V):
         '''
@@ -16,6 +21,12 @@ class MaxTrace(RLmodule):
         input: V
         output: V
         '''
+        if len(last_V.rnames()) == 0:
+            names = ("timesteps",) + last_V.names
+            rewards = plain_align(rewards.plain, rewards.names, names)
+            discounts = plain_align(discounts.plain, discounts.names, names)
+            return last_V.construct(maxtrace_returns(rewards, discounts, last_V.plain), names)
+
         returns = [last_V]
         for step in reversed(range(rewards.rollout_length)):
             returns.append(returns[-1].one_step(rewards[step], discounts[step]))
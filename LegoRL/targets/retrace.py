@@ -0,0 +1,46 @@
+from LegoRL.core.RLmodule import RLmodule
+from LegoRL.targets.vtrace import importance_ratios
+from LegoRL.utils.returns import retrace
+
+import torch
+
+class Retrace(RLmodule):
+    """
+    Retrace off-policy targets for Q-function of taken actions with traces c = lambda * min(1, ratio).
+    Whole rollout is processed by reverse scan (see utils.returns).
+    Expected values under current policy are given by user: Q.value(policy) for DiscretePolicy
+    or critic V for GaussianPolicy.
+    Based on: https://arxiv.org/abs/1606.02647
+    
+    Args:
+        lambd - float, from 0 to 1
+    """
+    def __init__(self, sys, lambd=1.):
+        super().__init__(sys)
+        self.lambd = lambd
+
+    def __call__(self, rewards, q_values, values, discounts, last_V, policy, actions, behaviour):
+        '''
+        Calculates Retrace targets.
+        input: Reward
+        input: q_values - V, Q of taken actions
+        input: values - V, expectation of Q under current policy
+        input: Discount
+        input: V
+        input: policy - Policy, current one
+        input: Action
+        input: behaviour - Policy of actors or old_log_prob from rollout
+        output: V
+        '''
+        assert len(q_values.rnames()) == 0 and len(last_V.rnames()) == 0, "Error: Retrace supports scalar V only"
+        with torch.no_grad():
+            ratios = importance_ratios(policy, actions, behaviour)
+            targets = retrace(q_values._aligned(rewards), q_values.plain, q_values._aligned(values), q_values._aligned(discounts),
+                              last_V.plain, ratios, self.lambd)
+            return q_values.construct(targets, q_values.names)
+
+    def hyperparameters(self):
+        return {"Retrace lambda": self.lambd}
+
+    def __repr__(self):
+        return f"Estimates Retrace targets"
@@ -0,0 +1,37 @@
+from LegoRL.core.RLmodule import RLmodule
+from LegoRL.utils.returns import lambda_returns
+
+import torch
+
+class TDLambda(RLmodule):
+    """
+    TD(lambda) return estimator:
+    G_t = r_t + gamma * ((1 - lambda) V(s_{t+1}) + lambda G_{t+1})
+    Computed for whole rollout by reverse scan (see utils.returns); supports scalar V only.
+    
+    Args:
+        lambd - float, from 0 to 1 (0 - one-step returns, 1 - MaxTrace)
+    """
+    def __init__(self, sys, lambd=0.95):
+        super().__init__(sys)
+        self.lambd = lambd
+
+    def __call__(self, rewards, values, discounts, last_V):
+        '''
+        Calculates TD(lambda) returns.
+        input: Reward
+        input: V
+        input: Discount
+        input: V
+        output: V
+        '''
+        assert len(values.rnames()) == 0 and len(last_V.rnames()) == 0, "Error: TD(lambda) supports scalar V only"
+        with torch.no_grad():
+            returns = lambda_returns(values._aligned(rewards), values.plain, values._aligned(discounts), last_V.plain, self.lambd)
+            return values.construct(returns, values.names)
+
+    def hyperparameters(self):
+        return {"TD lambda": self.lambd}
+
+    def __repr__(self):
+        return f"Estimates TD(lambda) returns"
@@ -5,15 +5,28 @@ from LegoRL.utils.namedTensorsUtils import torch_min
 
 class Twin(RLmodule):
     """
-    TODO
+    Pessimistic value estimation: minimum of two value functions or over members of ensemble.
+    Based on: https://arxiv.org/abs/1802.09477, https://arxiv.org/abs/2101.05982 (random subset)
+
+    Args:
+        subset - size of random subset of ensemble members, int or None (all members)
     """
-    def __call__(self, V1, V2):
+    def __init__(self, par, subset=None):
+        super().__init__(par)
+        self.subset = subset
+
+    def __call__(self, V1, V2=None):
         '''
-        input: V1
-        input: V2
+        input: V1 - V or V with "ensemble" dimension
+        input: V2 - V or None (V1 is ensemble)
         output: V
         '''
+        if V2 is None:
+            return V1.min(self.subset)
         return type(V1)(torch_min(V1.tensor, V2.tensor))
 
+    def hyperparameters(self):
+        return {"subset": self.subset}
+
     def __repr__(self):
-        return f"Ensembles two value functions by taking minimum"
+        return f"Ensembles value functions by taking minimum"
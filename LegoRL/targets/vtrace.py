@@ -0,0 +1,63 @@
+from LegoRL.core.RLmodule import RLmodule
+from LegoRL.representations.policy import Policy
+from LegoRL.utils.returns import vtrace
+
+import torch
+
+def importance_ratios(policy, actions, behaviour):
+    '''
+    Computes pi(a|s) / mu(a|s) for taken actions.
+    input: policy - Policy, current one
+    input: actions - Action
+    input: behaviour - Policy of actors, or its log-probabilities of actions stored in rollout
+                       (old_log_prob of RolloutCollector), Representation
+    output: Tensor
+    '''
+    behaviour_log_prob = behaviour.log_prob(actions) if isinstance(behaviour, Policy) else behaviour.plain
+    return torch.exp(policy.log_prob(actions) - behaviour_log_prob)
+
+class VTrace(RLmodule):
+    """
+    V-trace off-policy correction of n-step returns with truncated importance ratios,
+    allowing actors to collect data with stale weights.
+    Whole rollout is processed by reverse scan (see utils.returns); supports scalar V only.
+    Based on: https://arxiv.org/abs/1802.01561
+    
+    Args:
+        rho_max - truncation level of ratios in temporal differences, float
+        c_max - truncation level of traces, float
+        lambd - float, from 0 to 1
+
+    Provides: __call__ - value targets and policy gradient advantages
+    """
+    def __init__(self, sys, rho_max=1., c_max=1., lambd=1.):
+        super().__init__(sys)
+        self.rho_max = rho_max
+        self.c_max = c_max
+        self.lambd = lambd
+
+    def __call__(self, rewards, values, discounts, last_V, policy, actions, behaviour):
+        '''
+        Calculates V-trace targets.
+        input: Reward
+        input: V
+        input: Discount
+        input: V
+        input: policy - Policy, current one
+        input: Action
+        input: behaviour - Policy of actors or old_log_prob from rollout
+        output: V - targets for critic
+        output: V - advantages for actor
+        '''
+        assert len(values.rnames()) == 0 and len(last_V.rnames()) == 0, "Error: V-trace supports scalar V only"
+        with torch.no_grad():
+            ratios = importance_ratios(policy, actions, behaviour)
+            targets, advantages = vtrace(values._aligned(rewards), values.plain, values._aligned(discounts), last_V.plain,
+                                         ratios, self.rho_max, self.c_max, self.lambd)
+            return values.construct(targets, values.names), values.construct(advantages, values.names)
+
+    def hyperparameters(self):
+        return {"V-trace rho_max": self.rho_max, "V-trace c_max": self.c_max, "V-trace lambda": self.lambd}
+
+    def __repr__(self):
+        return f"Estimates V-trace targets with ratios truncated at {self.rho_max} and traces at {self.c_max}"
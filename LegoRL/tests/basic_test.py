@@ -1,7 +1,10 @@
 import pytest
 
+import os
+
 import gym
 import gym.spaces
+import torch
 import numpy as np
 
 class DummyEnv():
@@ -51,6 +54,372 @@ def test_buffers():
     assert idx == [3, 0, 1]
     assert replay.at([1])["b"].numpy == np.array([5])
 
+    # wraparound with more transitions than capacity
+    data = Storage(b = system.mdp[Reward]([0.5, 1.5, 2.5, 3.5, 4.5]), c = system.mdp[State](np.zeros((5, 7, 4))), d = system.mdp[Discount]([0, 0, 0, 0, 0]))
+    idx = replay.store(data)
+    assert idx == [2, 3, 0, 1, 2]
+    assert (replay.at([3, 0, 1, 2])["b"].numpy == np.array([1.5, 2.5, 3.5, 4.5])).all()
+
+def test_storage_batching():
+    env = DummyEnv()
+    system = System(env)
+    rollout = Storage(rewards = system.mdp[Reward](np.arange(12.).reshape(3, 4)),
+                      V = system.mdp[V](torch.arange(12.).view(3, 4)))
+
+    batch = rollout.index(np.array([5, 0, 11]))
+    assert not hasattr(batch.rewards, "_tensor")
+    assert (batch.rewards.numpy == [5, 0, 11]).all() and batch.V.tensor.tolist() == [5, 0, 11]
+    assert batch.V.names == ("batch",)
+
+    chunks = batch.split(2)
+    assert [chunk.total_size() for chunk in chunks] == [2, 1]
+    joined = Storage.cat(chunks)
+    assert (joined.rewards.numpy == batch.rewards.numpy).all() and torch.equal(joined.V.tensor, batch.V.tensor)
+
+    moved = joined.pin_memory().to("cpu")
+    assert moved.V is joined.V or torch.equal(moved.V.tensor, joined.V.tensor)
+    assert torch.equal(moved.rewards.plain, torch.tensor([5., 0., 11.]))
+
+def test_compact_buffer():
+    env = DummyEnv()
+    system = System(env)
+    data = Storage(states = system.mdp[State](np.random.rand(5, 7, 4)), actions = system.mdp[Action]([0, 1, 4, 2, 3]),
+                   rewards = system.mdp[Reward]([0.5, 1, -1, 0, 2]), is_start = system.mdp[Flag]([True, False, False, True, False]))
+
+    full, compact = ReplayBuffer(system, capacity=8), ReplayBuffer(system, capacity=8, dtypes="compact")
+    full.store(data)
+    compact.store(data)
+    assert compact._buffer["states"].dtype == np.uint8
+    assert compact._buffer["actions"].dtype == np.int8
+    assert compact._buffer["rewards"].dtype == np.float16
+    assert sum(column.nbytes for column in compact._buffer.values()) * 4 < sum(column.nbytes for column in full._buffer.values())
+
+    # narrow data is cast and scaled only when requested
+    batch = compact.at([3, 0, 2])
+    assert batch.states._compact.dtype == np.uint8
+    assert np.allclose(batch.states.tensor.rename(None).cpu().numpy(), data.states.numpy[[3, 0, 2]], atol=1 / 255)
+    assert np.allclose(batch.states.numpy, data.states.numpy[[3, 0, 2]], atol=1 / 255)
+    for key in ["actions", "rewards", "is_start"]:
+        assert (batch[key].numpy == full.at([3, 0, 2])[key].numpy).all()
+
+def test_episode_index():
+    env = DummyEnv()
+    system = System(env)
+    replay = ReplayBuffer(system, capacity=12)
+
+    # two environments; the first one restarts after 3 steps, the second one plays one long episode
+    is_start = [[1, 1], [0, 0], [0, 0], [1, 0], [0, 0], [0, 0], [0, 0]]
+    for t, start in enumerate(is_start):
+        replay.store(Storage(rewards = system.mdp[Reward]([t, 10 * t]), is_start = system.mdp[Flag](np.array(start, dtype=bool)),
+                             discounts = system.mdp[Discount]([0.5, 0.5])))
+
+    # slots 0, 1 were overwritten by the last store
+    assert (replay.episodes([2, 4, 6, 0]) == [0, 0, 2, 2]).all()
+    first, last = replay.episode_bounds(np.array([4, 3, 8]))
+    assert (first == [2, 3, 6]).all() and (last == [4, 1, 0]).all()
+
+    data, valid = replay.sequences(np.array([2, 8, 11]), 3)
+    assert data.rewards.numpy.shape == (3, 3)
+    assert (valid == [[1, 1, 1], [1, 1, 1], [0, 1, 0]]).all()
+    assert (data.rewards.numpy == [[1, 4, 50], [2, 5, 60], [2, 6, 60]]).all()
+
+    returns, ended = replay.returns_to_go(np.array([2, 8, 3]))
+    assert np.allclose(returns, [1 + 0.5 * 2, 4 + 0.5 * 5 + 0.25 * 6, 10 + 0.5 * 20 + 0.25 * 30 + 0.125 * 40 + 0.0625 * 50 + 0.03125 * 60])
+    assert (ended == [True, False, False]).all()
+    returns, _ = replay.returns_to_go(np.array([8]), gamma=1, max_length=2)
+    assert returns == [9]
+
+def test_nstep_sampling():
+    env = DummyEnv()
+    system = System(env)
+    n, num_envs = 3, 2
+    replay, latency_replay = ReplayBuffer(system, capacity=100), ReplayBuffer(system, capacity=100)
+    latency = NstepLatency(system, n_steps=n)
+
+    rng = np.random.RandomState(0)
+    is_start = np.ones(num_envs, dtype=bool)
+    for t in range(30):
+        done = rng.rand(num_envs) < 0.2
+        data = Storage(states = system.mdp[State](np.full((num_envs, 7, 4), t)), is_start = system.mdp[Flag](is_start),
+                       rewards = system.mdp[Reward](rng.rand(num_envs)), next_states = system.mdp[State](np.full((num_envs, 7, 4), t + 1)),
+                       discounts = system.mdp[Discount](0.9 * (1 - done)))
+        replay.store(data)
+        delayed = latency.add(data)
+        if delayed is not None:
+            latency_replay.store(delayed)
+        is_start = done
+
+    # the same transitions are stored n - 1 stores later
+    indices = np.arange(len(latency_replay))
+    expected, sampled = latency_replay.at(indices), replay.nstep_at(indices, n)
+    assert np.allclose(sampled.rewards.numpy, expected.rewards.numpy)
+    assert np.allclose(sampled.discounts.numpy, expected.discounts.numpy)
+    bootstrapped = expected.discounts.numpy > 0
+    assert (sampled.next_states.numpy[bootstrapped] == expected.next_states.numpy[bootstrapped]).all()
+
+    # mix of n; one-step transitions are left as they are
+    sampler = Sampler(system, replay, batch_size=8, cold_start=8, n_steps=[1, n])
+    assert sampler.sample().rewards.numpy.shape == (8,)
+    assert np.allclose(replay.nstep_at(indices, 1).rewards.numpy, replay.at(indices).rewards.numpy)
+
+def test_buffer_checkpoint(tmp_path):
+    env = DummyEnv()
+    system = System(env, folder_name=str(tmp_path))
+    replay = ReplayBuffer(system, capacity=10, chunk_size=4)
+    path = os.path.join(str(tmp_path), replay.name)
+
+    data = Storage(b = system.mdp[Reward]([3., 4., 5., 6.]), c = system.mdp[State](np.ones((4, 7, 4))))
+    replay.store(data)
+    system.save()
+    assert sorted(os.listdir(path)) == ["chunk0.npz", "meta"]
+
+    # only the changed chunks are written again
+    modified = os.stat(os.path.join(path, "chunk0.npz")).st_mtime_ns
+    replay.store(Storage(b = system.mdp[Reward]([3., 4., 5.]), c = system.mdp[State](np.ones((3, 7, 4)))))
+    system.save()
+    assert os.stat(os.path.join(path, "chunk0.npz")).st_mtime_ns == modified
+    assert sorted(os.listdir(path)) == ["chunk0.npz", "chunk1.npz", "meta"]
+
+    system = System(DummyEnv(), folder_name=str(tmp_path))
+    replay = ReplayBuffer(system, capacity=10, chunk_size=4)
+    system.load()
+    assert len(replay) == 7
+    assert (replay.at(np.arange(7))["b"].numpy == np.array([3, 4, 5, 6, 3, 4, 5])).all()
+    assert replay.at([5])["c"].numpy.shape == (1, 7, 4)
+
+    # new run with other chunk size replaces chunks of the previous one
+    system = System(DummyEnv(), folder_name=str(tmp_path))
+    replay = ReplayBuffer(system, capacity=10, chunk_size=8)
+    replay.store(Storage(b = system.mdp[Reward]([1., 2.]), c = system.mdp[State](np.zeros((2, 7, 4)))))
+    system.save()
+    assert sorted(os.listdir(path)) == ["chunk0.npz", "meta"]
+
+    system = System(DummyEnv(), folder_name=str(tmp_path))
+    replay = ReplayBuffer(system, capacity=10, chunk_size=4)
+    system.load()
+    assert len(replay) == 2
+    assert (replay.at([0, 1])["b"].numpy == np.array([1, 2])).all()
+
+    # stored buffer of other capacity is rejected before anything is read
+    system = System(DummyEnv(), folder_name=str(tmp_path))
+    replay = ReplayBuffer(system, capacity=20, chunk_size=4)
+    with pytest.raises(AssertionError):
+        system.load()
+    assert len(replay) == 0 and replay._types is None
+
+def test_memmap_buffer(tmp_path):
+    env = DummyEnv()
+    system = System(env, folder_name=str(tmp_path))
+    replay = MemmapReplayBuffer(system, capacity=4)
+
+    data = Storage(b = system.mdp[Reward]([3, 4, 5]), c = system.mdp[State](np.ones((3, 7, 4))))
+    replay.store(data)
+    replay.store(data)
+    assert len(replay) == 4
+    assert (replay.at([0, 1])["b"].numpy == np.array([4, 5])).all()
+    system.save()
+
+    # reloaded system reattaches to files on disk
+    system = System(DummyEnv(), folder_name=str(tmp_path))
+    replay = MemmapReplayBuffer(system, capacity=4)
+    system.load()
+    assert len(replay) == 4
+    assert (replay.at([0, 1, 2, 3])["b"].numpy == np.array([4, 5, 5, 3])).all()
+    assert replay.at([2])["c"].numpy.shape == (1, 7, 4)
+    assert system.reload_messages[-1].endswith("reloaded")
+
+def test_memmap_buffer_folders(tmp_path):
+    # data of buffer is kept in its own folder, scheme is stored in folder of the system
+    data_folder, run_folder = str(tmp_path / "data"), str(tmp_path / "run")
+    system = System(DummyEnv(), folder_name=run_folder)
+    replay = MemmapReplayBuffer(system, capacity=4, folder_name=data_folder)
+    replay.store(Storage(b = system.mdp[Reward]([3, 4, 5])))
+    system.save()
+    assert os.path.exists(os.path.join(data_folder, replay.name, "b.npy"))
+    assert os.path.exists(os.path.join(run_folder, replay.name, "scheme"))
+
+    system = System(DummyEnv(), folder_name=run_folder)
+    replay = MemmapReplayBuffer(system, capacity=4, folder_name=data_folder)
+    system.load()
+    assert (replay.at([0, 1, 2])["b"].numpy == np.array([3, 4, 5])).all()
+
+    # snapshot in another folder refers to the same data
+    system.save(str(tmp_path / "snapshot"))
+    system = System(DummyEnv(), folder_name=run_folder)
+    replay = MemmapReplayBuffer(system, capacity=4)
+    system.load(str(tmp_path / "snapshot"))
+    assert len(replay) == 3
+    assert (replay.at([0, 1, 2])["b"].numpy == np.array([3, 4, 5])).all()
+
+    # missing scheme is reported, not raised
+    system = System(DummyEnv(), folder_name=str(tmp_path / "empty"))
+    replay = MemmapReplayBuffer(system, capacity=4)
+    system.save()
+    os.remove(os.path.join(str(tmp_path / "empty"), replay.name, "scheme"))
+    system.load()
+    assert len(replay) == 0
+    assert any("has not found stored transitions" in message for message in system.reload_messages)
+
+def test_frame_buffer():
+    env = DummyEnv()
+    system = System(env)
+    k, num_envs = 4, 2
+
+    replay = ReplayBuffer(system, capacity=30)
+    frame_replay = FrameReplayBuffer(system, capacity=30, frame_stack=k, stack_axis=1)
+
+    # imitating FrameStack: observation (7, 4) consists of 4 frames (7, 1)
+    rng = np.random.RandomState(0)
+    new_frames = lambda: [[rng.rand(7, 1)] * k for _ in range(num_envs)]
+    stacks = new_frames()
+    is_start = np.ones(num_envs, dtype=bool)
+    for t in range(50):
+        states = np.array([np.concatenate(s, axis=1) for s in stacks])
+        done = rng.rand(num_envs) < 0.2
+        for e in range(num_envs):
+            stacks[e] = new_frames()[e] if done[e] else stacks[e][1:] + [rng.rand(7, 1)]
+        next_states = np.array([np.concatenate(s, axis=1) for s in stacks])
+
+        data = Storage(states = system.mdp[State](states), is_start = system.mdp[Flag](is_start),
+                       rewards = system.mdp[Reward](rng.rand(num_envs)),
+                       next_states = system.mdp[State](next_states), discounts = system.mdp[Discount](1 - done))
+        assert replay.store(data) == frame_replay.store(data)
+        is_start = done
+
+    # the oldest steps of environments may have lost their history
+    indices = np.arange(30)[frame_replay._buffer["stamp"] >= 50 - 30 // num_envs + k - 1]
+    full, deduplicated = replay.at(indices), frame_replay.at(indices)
+    for key in ["states", "next_states", "rewards", "discounts"]:
+        assert (full[key].numpy == deduplicated[key].numpy).all()
+
+def _produce(writer, value):
+    # spawned process can not receive the system, so representations are created with its own MDP
+    from LegoRL.core.mdp_config import MDPconfig
+    mdp = MDPconfig(DummyEnv())
+    for _ in range(10):
+        writer.store(Storage(b = mdp[Reward](np.full(3, value)), c = mdp[State](np.full((3, 7, 4), value))))
+
+@pytest.mark.parametrize("start_method", ["fork", "spawn"])
+def test_shared_buffer(start_method):
+    import multiprocessing as mp
+
+    env = DummyEnv()
+    system = System(env)
+    replay = SharedReplayBuffer(system, capacity=50, start_method=start_method)
+    replay.allocate(Storage(b = system.mdp[Reward]([0.]), c = system.mdp[State](np.zeros((1, 7, 4)))))
+
+    producers = [mp.get_context(start_method).Process(target=_produce, args=(replay.writer(), float(value))) for value in [1, 2]]
+    for producer in producers:
+        producer.start()
+    for producer in producers:
+        producer.join()
+    assert all(producer.exitcode == 0 for producer in producers)
+
+    assert len(replay) == 50
+    data = replay.at(np.arange(50))
+    assert sorted(set(data["b"].numpy.tolist())) == [1, 2]
+    assert (data["c"].numpy == data["b"].numpy[:, None, None]).all()
+    replay.close()
+
+def test_shared_buffer_timeout():
+    env = DummyEnv()
+    system = System(env)
+    replay = SharedReplayBuffer(system, capacity=10, commit_timeout=0.1)
+    replay.store(Storage(b = system.mdp[Reward]([1., 2.])))
+
+    # producer died after reserving slots: others fail instead of waiting forever
+    writer = replay.writer()
+    writer.reserved.value += 3
+    with pytest.raises(TimeoutError):
+        writer.store(Storage(b = system.mdp[Reward]([3.])))
+    assert len(replay) == 2
+
+    # producer died while writing slot: readers fail instead of waiting forever
+    writer.versions[1] += 1
+    assert replay.at([0])["b"].numpy.tolist() == [1.]
+    with pytest.raises(TimeoutError):
+        replay.at([0, 1])
+    replay.close()
+
+def test_shared_buffer_episodes():
+    env = DummyEnv()
+    system = System(env)
+    replay = SharedReplayBuffer(system, capacity=10)
+    replay.store(Storage(b = system.mdp[Reward]([1., 2.]), rewards = system.mdp[Reward]([1., 2.]),
+                         discounts = system.mdp[Discount]([0.9, 0.9]), next_states = system.mdp[State](np.zeros((2, 7, 4)))))
+
+    # single steps do not need episode index
+    assert replay.nstep_at(np.array([0, 1]), 1)["rewards"].numpy.tolist() == [1., 2.]
+    for query in [lambda: replay.nstep_at(np.array([0]), 3), lambda: replay.returns_to_go(np.array([0])),
+                  lambda: replay.sequences(np.array([0]), 2), lambda: replay.episode_bounds(np.array([0]))]:
+        with pytest.raises(Exception, match="episode index"):
+            query()
+    replay.close()
+
+def test_sumtree():
+    from LegoRL.samplers.prioritizedSampler import SumTree
+
+    for capacity in [1, 2, 7, 16, 100]:
+        scalar, batched = SumTree(capacity), SumTree(capacity)
+        for _ in range(5):
+            idxs = np.random.randint(0, capacity, 10)
+            ps = np.random.uniform(size=10)
+            for i, p in zip(idxs, ps):
+                scalar.update(i, p)
+            batched.update_many(idxs, ps)
+            assert np.allclose(scalar.tree, batched.tree)
+
+        values = np.random.uniform(0, scalar.total_p, 50)
+        assert (batched.get_leaves(values) == [scalar.get_leaf(v) for v in values]).all()
+        assert batched.sample(8).shape == (8,)
+
+def test_min_priority():
+    env = DummyEnv()
+    system = System(env)
+    replay = ReplayBuffer(system, capacity=7)
+    idx = replay.store(Storage(b = system.mdp[Reward](np.arange(5.)), c = system.mdp[State](np.zeros((5, 7, 4)))))
+
+    sampler = PrioritizedSampler(system, replay, batch_size=4, cold_start=4, rp_alpha=1)
+    sampler.expand(idx)
+    sampler.sample()
+    sampler.update_priorities([1, 3], system.mdp[Reward]([0.5, 0.25]))
+    assert sampler.min_priorities.min_p == 0.25
+
+    # weights are normalized by the minimum priority in the whole buffer
+    batch = sampler.sample()
+    assert batch.min_priority == 0.25
+    weights = SamplerBiasCorrection(system, rp_beta_start=1)(batch.priorities, batch.min_priority)
+    assert np.allclose(weights.numpy, 0.25 / batch.priorities)
+
+def test_prefetch_sampler():
+    env = DummyEnv()
+    system = System(env)
+    replay = ReplayBuffer(system, capacity=20)
+    idx = replay.store(Storage(b = system.mdp[Reward](np.arange(10.)), c = system.mdp[State](np.zeros((10, 7, 4)))))
+
+    sampler = Sampler(system, replay, batch_size=4, cold_start=4, prefetch=2)
+    for _ in range(5):
+        batch = sampler.sample()
+        assert hasattr(batch["b"], "_tensor")
+        assert batch["b"].numpy.shape == (4,)
+    sampler.close()
+
+    sampler = PrioritizedSampler(system, replay, batch_size=4, cold_start=4, prefetch=2, max_staleness=0)
+    sampler.expand(idx)
+    batch = sampler.sample()
+    sampler.update_priorities(batch.indices, system.mdp[Reward](np.full(4, 0.5)))
+
+    # batches drawn before the update are dropped
+    batch = sampler.sample()
+    assert sampler._drawn_at == 1
+    assert np.allclose(batch.priorities, [sampler.priorities[i] for i in batch.indices])
+
+    # slots overwritten after the batch was drawn keep max priority
+    sampler.expand(batch.indices)
+    sampler.update_priorities(batch.indices, system.mdp[Reward](np.full(4, 0.1)))
+    assert (sampler.priorities[batch.indices] == sampler.max_priority).all()
+    sampler.close()
+
 def test_exploration1():
     env = DummyEnv()
     system = System(env)
@@ -129,3 +498,420 @@ def test_runner():
                                             system.mdp.gamma * transition2.rewards.numpy +
                                             (system.mdp.gamma**2) * transition3.rewards.numpy, atol=1e-2)
     assert np.allclose(latent.discounts.numpy, system.mdp.gamma**3, atol=1e-3)
+
+def test_rollout_collector():
+    env = DummyEnv()
+    system = System(env, gamma=0.9)
+    runner = Runner(system)
+    collector = RolloutCollector(system, rollout_length=3, cache_old=True)
+
+    weight = torch.ones(1, requires_grad=True)
+    for t in range(3):
+        transition = runner.step(system.mdp[Action](np.array([2])))
+        transition.update(V = system.mdp[Reward](weight * t), policy = system.mdp[DiscretePolicy](torch.randn(1, 5)))
+        rollout = collector.add(transition)
+    
+    # numpy data stays in numpy, tensors keep gradients
+    assert not hasattr(rollout.states, "_tensor")
+    assert rollout.states.numpy.shape == (3, 1, 7, 4)
+    assert rollout.rewards.rollout_length == 3
+    assert rollout.V.tensor.names == ("timesteps", "batch")
+    rollout.V.tensor.sum().backward()
+    assert weight.grad.item() == 3
+
+    # values of old policy and critic are cached once for the whole rollout
+    assert rollout.old_log_prob.names == ("timesteps", "batch") and not rollout.old_V.plain.requires_grad
+    loss = ProximalLoss(system)
+    policy, advantages = system.mdp[DiscretePolicy](torch.randn(3, 1, 5)), system.mdp[V](torch.ones(3, 1))
+    assert torch.equal(loss.batch_loss(policy, rollout.policy, rollout.actions, advantages).plain,
+                       loss.batch_loss(policy, rollout.old_log_prob, rollout.actions, advantages).plain)
+
+def test_epoched_rollout():
+    env = DummyEnv()
+    system = System(env)
+    rollout = Storage(rewards = system.mdp[Reward](np.arange(12.).reshape(4, 3)),
+                      V = system.mdp[V](torch.arange(12.).view(4, 3)))
+
+    epoched = EpochedRollout(system, epochs=2, batch_size=4)
+    epoched.new_dataset(rollout)
+    for epoch in range(2):
+        seen = []
+        for _ in range(3):
+            batch = epoched.sample_next()
+            assert batch.V.names == ("batch",) and (batch.rewards.numpy == batch.V.tensor.numpy()).all()
+            seen += batch.rewards.numpy.tolist()
+        assert sorted(seen) == list(range(12))
+    assert epoched.sample_next() is None
+
+    # trajectories are shuffled as a whole; incomplete mini-batch is dropped
+    epoched = EpochedRollout(system, epochs=1, batch_size=2, shuffle_trajectories=True)
+    epoched.new_dataset(rollout)
+    batch = epoched.sample_next()
+    assert batch.V.names == ("timesteps", "batch") and batch.rewards.numpy.shape == (4, 2)
+    assert (batch.rewards.numpy % 3 == batch.rewards.numpy[0] % 3).all()
+    assert epoched.sample_next() is None
+
+def test_returns():
+    from LegoRL.buffers.storage import stack
+
+    env = DummyEnv()
+    system = System(env)
+    rng = np.random.RandomState(0)
+    rewards = system.mdp[Reward](rng.randn(50, 8))
+    discounts = system.mdp[Discount](0.9 * (rng.rand(50, 8) > 0.1))
+    values, last_V = system.mdp[V](torch.randn(50, 8)), system.mdp[V](torch.randn(8))
+
+    # step-by-step loops over representations
+    gae, advantages, returns, next_values = 0, [], [last_V], last_V
+    for step in reversed(range(50)):
+        advantage = next_values.one_step(rewards[step], discounts[step]).subtract_v(values[step])
+        next_values = values[step]
+        gae = advantage + gae * discounts[step] * 0.95
+        advantages.append(gae)
+        returns.append(returns[-1].one_step(rewards[step], discounts[step]))
+    expected_gae, expected_maxtrace = stack(advantages[::-1]), stack(returns[-1:0:-1])
+
+    # reverse scan is bitwise identical
+    assert torch.equal(GAE(system, tau=0.95)(rewards, values, discounts, last_V).tensor, expected_gae.tensor)
+    assert torch.equal(MaxTrace(system)(rewards, discounts, last_V).tensor, expected_maxtrace.tensor)
+
+    lambda_returns = TDLambda(system, lambd=0.95)(rewards, values, discounts, last_V)
+    assert torch.allclose(lambda_returns.plain, (expected_gae + values).plain, atol=1e-5)
+    assert torch.allclose(TDLambda(system, lambd=1)(rewards, values, discounts, last_V).plain, expected_maxtrace.plain, atol=1e-5)
+
+def test_off_policy_targets():
+    env = DummyEnv()
+    system = System(env)
+    rng = np.random.RandomState(0)
+    rewards = system.mdp[Reward](rng.randn(6, 3))
+    discounts = system.mdp[Discount](0.9 * (rng.rand(6, 3) > 0.2))
+    values, last_V = system.mdp[V](torch.randn(6, 3)), system.mdp[V](torch.randn(3))
+    actions = system.mdp[Action](rng.randint(0, 5, (6, 3)))
+    policy, behaviour = system.mdp[DiscretePolicy](torch.randn(6, 3, 5)), system.mdp[DiscretePolicy](torch.randn(6, 3, 5))
+    maxtrace = MaxTrace(system)(rewards, discounts, last_V).plain
+
+    # on-policy V-trace and Retrace are n-step returns
+    targets, advantages = VTrace(system)(rewards, values, discounts, last_V, policy, actions, policy)
+    assert torch.allclose(targets.plain, maxtrace, atol=1e-5)
+    assert torch.allclose(Retrace(system)(rewards, values, values, discounts, last_V, policy, actions, policy).plain, maxtrace, atol=1e-5)
+
+    # step-by-step definition with truncated ratios
+    ratios = torch.exp(policy.log_prob(actions) - behaviour.log_prob(actions)).numpy()
+    r, d, v = rewards.numpy, discounts.numpy, np.concatenate([values.plain.numpy(), last_V.plain.numpy()[None]])
+    expected, correction = np.zeros((6, 3)), np.zeros(3)
+    for t in reversed(range(6)):
+        correction = np.minimum(ratios[t], 1) * (r[t] + d[t] * v[t + 1] - v[t]) + d[t] * np.minimum(ratios[t], 0.8) * correction
+        expected[t] = v[t] + correction
+
+    behaviour_log_prob = system.mdp["Log Probability"](behaviour.log_prob(actions))
+    targets, advantages = VTrace(system, c_max=0.8)(rewards, values, discounts, last_V, policy, actions, behaviour_log_prob)
+    assert np.allclose(targets.numpy, expected, atol=1e-5)
+    assert targets.names == advantages.names == ("timesteps", "batch")
+
+    # continuous policies are supported through Policy.log_prob
+    class VectorActionEnv(DummyEnv):
+        def __init__(self):
+            super().__init__()
+            self.action_space = gym.spaces.Box(low=-np.ones(2), high=np.ones(2))
+
+    cont = System(VectorActionEnv())
+    gaussian = cont.mdp[GaussianPolicy](torch.randn(6, 3, 2, 2))
+    cont_actions = cont.mdp[Action](rng.rand(6, 3, 2))
+    targets = Retrace(cont, lambd=0.9)(rewards, values, values, discounts, last_V, gaussian, cont_actions, gaussian)
+    assert targets.plain.shape == (6, 3)
+
+def test_categorical_projection():
+    from LegoRL.tests.benchmark_categorical import reference_one_step, reference_compare
+
+    env = DummyEnv()
+    system = System(env)
+    rng = np.random.RandomState(0)
+    q = system.mdp[Categorical(Q, -2, 2, 11)].from_linear(torch.randn(16, 11 * 5))
+    actions = system.mdp[Action](rng.randint(0, 5, 16))
+    rewards = system.mdp[Reward](rng.randn(16))
+    discounts = system.mdp[Discount](0.9 * (rng.rand(16) > 0.2))
+
+    # single pass projection is identical to the previous one
+    v = q.gather(actions)
+    projected = v.one_step(rewards, discounts)
+    assert torch.equal(projected.plain, reference_one_step(v.plain, rewards.plain, discounts.plain, -2, 2))
+    assert torch.allclose(v.compare(projected).plain, reference_compare(v.plain, projected.plain), atol=1e-5)
+
+    # projection of all actions at once
+    full = q.one_step(rewards, discounts)
+    assert full.names == q.names
+    assert torch.allclose(full.gather(actions).plain, projected.plain)
+
+class FlatNet(torch.nn.Linear):
+    def forward(self, states):
+        return super().forward(states.rename(None).flatten(1))
+
+def test_forward_cache():
+    env = DummyEnv()
+    system = System(env, forward_cache=True)
+    network = QNetwork(system, network=FlatNet)
+    trainer = Trainer(system, models=network)
+    states, next_states = system.mdp[State](np.random.rand(6, 7, 4)), system.mdp[State](np.random.rand(6, 7, 4))
+
+    # same input and parameters: output is reused, also in no_grad mode
+    q = network(states)
+    with torch.no_grad():
+        assert torch.equal(network(states).plain, q.plain)
+    assert system.cache.hits == 1 and network(states).plain.requires_grad
+    network(states).detach()
+    assert network(states).plain.requires_grad
+
+    # output without gradients is not reused when gradients are required
+    with torch.no_grad():
+        network(next_states)
+    assert network(next_states).plain.requires_grad
+
+    # optimization step invalidates the cache
+    trainer.optimize(network(states).plain.sum())
+    misses = system.cache.misses
+    assert not torch.equal(network(states).plain, q.plain) and system.cache.misses == misses + 1
+
+    # one batched forward pass for states and next_states
+    q, next_q = system.cache.prefetch(network, states, next_states)
+    hits = system.cache.hits
+    assert torch.equal(network(states).plain, q.plain) and torch.equal(network(next_states).plain, next_q.plain)
+    assert system.cache.hits == hits + 2
+
+    # in-place changes of returned output do not affect later calls
+    changed = network(states)
+    changed += 1
+    changed[0] = 0
+    assert torch.equal(network(states).plain, q.plain) and system.cache.hits == hits + 4
+    assert torch.allclose(next_q.plain, FlatNet.forward(network.net, next_states.tensor))
+
+    # parameters changed in-place outside of trainer
+    with torch.no_grad():
+        network.net.bias.add_(1)
+    assert torch.allclose(network(states).plain, q.plain + 1)
+
+    system.iteration = lambda: None
+    system.run()
+    assert not system.cache._entries
+
+def test_metrics():
+    env = DummyEnv()
+    system = System(env, rare_logs_timer=2)
+    network = VNetwork(system, network=FlatNet)
+    loss = CriticLoss(system)
+    trainer = Trainer(system, models=network, clip_gradients=10)
+    states = system.mdp[State](np.random.rand(6, 7, 4))
+
+    losses = []
+    def iteration():
+        for target in [0., 1.]:
+            value = loss(network(states), system.mdp[V](torch.full((6,), target)))
+            losses.append(value.item())
+            trainer.optimize(value)
+    system.iteration = iteration
+
+    # values are accumulated and logged only on rare logs iterations
+    system.run()
+    assert loss.name not in system.logger and system.accumulators[loss.name].count == 2
+    system.run()
+    assert system.logger[loss.name] == pytest.approx([np.mean(losses)])
+    assert system.logger[loss.name + " min"] == pytest.approx([min(losses)])
+    assert system.logger[loss.name + " max"] == pytest.approx([max(losses)])
+    assert system.logger_labels[loss.name] == ("training iteration", f"{loss.name} loss")
+    assert system.logger_times[loss.name] == [2] and len(system.logger[trainer.name + " gradient_norm"]) == 1
+    assert system.accumulators[loss.name].count == 0
+
+@pytest.mark.parametrize("device", ["cpu"] + (["cuda"] if torch.cuda.is_available() else []))
+def test_metric_devices(device):
+    from LegoRL.core.metrics import MetricAccumulator
+
+    # numbers and tensors from any device are accumulated together
+    accumulator = MetricAccumulator()
+    for value in [1., torch.tensor(3., device=device), 2, torch.tensor([5.]), torch.tensor(0., device=device)]:
+        accumulator.push(value)
+    assert accumulator.flush() == pytest.approx((2.2, 0., 5.))
+    assert accumulator.flush() is None
+
+class TwoHeads(RLmodule):
+    def __init__(self, par):
+        super().__init__(par)
+        self.q_head = QNetwork(self, network=FlatNet)
+        self.v_head = VNetwork(self, network=FlatNet)
+
+def test_target_updates():
+    env = DummyEnv()
+    system = System(env)
+    online = TwoHeads(system)
+    soft, hard = Frozen(system, online, SoftUpdate(tau=0.1)), Frozen(system, online, HardUpdate(timer=2))
+    parameters = lambda module: list(module.q_head.net.parameters()) + list(module.v_head.net.parameters())
+    
+    # networks of all submodules are updated together
+    targets, sources = soft.paired_tensors()
+    assert all(a is b for a, b in zip(targets + sources, parameters(soft) + parameters(online))) and len(targets) == 4
+    previous = [param.clone() for param in parameters(soft)]
+    with torch.no_grad():
+        for param in parameters(online):
+            param.add_(1)
+    soft.update()
+    for param, old, source in zip(parameters(soft), previous, parameters(online)):
+        assert torch.allclose(param, 0.1 * source + 0.9 * old)
+
+    system.iterations = 1
+    hard.update()
+    assert not torch.equal(parameters(hard)[0], parameters(online)[0])
+    system.iterations = 2
+    hard.update()
+    assert all(torch.equal(param, source) for param, source in zip(parameters(hard), parameters(online)))
+
+class EnsembleCritic(EnsembleModel, ForwardQNetwork):
+    pass
+
+def test_ensemble_model():
+    env = DummyContEnv()
+    system = System(env)
+    critic = EnsembleCritic(system, num_members=5)
+    target_critic = Frozen(system, critic)
+    trainer = Trainer(system, models=critic)
+    states, actions = system.mdp[State](np.random.rand(6, 7, 4)), system.mdp[Action](np.random.rand(6, 7, 4))
+
+    # all members in one forward pass
+    V = critic.Q(states, actions)
+    assert V.names == ("batch", "ensemble") and V.plain.shape == (6, 5)
+    inputs = torch.cat([states.raw_embedding().plain, actions.raw_embedding().plain], dim=-1)
+    weight, bias = critic.net.params
+    for k in range(5):
+        assert torch.allclose(V.plain[:, k], torch.nn.functional.linear(inputs, weight[k], bias[k])[:, 0], atol=1e-6)
+    assert torch.allclose(target_critic.Q(states, actions).plain, V.plain)
+
+    # reductions
+    assert torch.equal(Twin(system)(V).plain, V.plain.min(1).values)
+    assert (Twin(system, subset=2)(V).plain >= V.plain.min(1).values).all()
+    assert V.mean().names == ("batch",) and V.std().plain.shape == (6,)
+    assert V.one_step(system.mdp[Reward](np.ones(6)), system.mdp[Discount](np.full(6, 0.9))).names == V.names
+
+    # members are trained together
+    trainer.optimize(V.compare(V.mean().detach()).plain.mean())
+    assert not torch.allclose(critic.Q(states, actions).plain, V.plain)
+    target_critic.update()
+
+class ImplicitNet(torch.nn.Module):
+    def __init__(self, input_size, output_size):
+        super().__init__()
+        self.features = torch.nn.Linear(input_size, 16)
+        self.embedding = torch.nn.Linear(16, 16)
+        self.head = torch.nn.Linear(16, output_size)
+
+    def forward(self, states, taus):
+        cosines = torch.cos(np.pi * torch.arange(16) * taus.unsqueeze(-1))
+        return self.head(self.features(states.flatten(1)).unsqueeze(-2) * torch.relu(self.embedding(cosines)))
+
+def test_quantile_loss():
+    from LegoRL.utils.quantileRegression import quantile_loss
+
+    quantiles = torch.randn(8, 11, 5, requires_grad=True)
+    targets, taus = torch.randn(8, 7, 5, requires_grad=True), torch.rand(1, 11, 1)
+
+    # chunks of predicted quantiles give the same loss and gradients as one chunk
+    diff = targets.unsqueeze(1) - quantiles.unsqueeze(2)
+    expected = (diff * (taus.unsqueeze(2) - (diff < 0).float())).sum(2).sum(1) / 7
+    expected_grads = torch.autograd.grad(expected.sum(), (quantiles, targets))
+    for max_pairs in [1, 100, 2**22]:
+        loss = quantile_loss(quantiles, targets, taus, 1, max_pairs)
+        assert torch.equal(loss, expected)
+        for grad, expected_grad in zip(torch.autograd.grad(loss.sum(), (quantiles, targets)), expected_grads):
+            assert torch.allclose(grad, expected_grad)
+
+    env = DummyEnv()
+    system = System(env)
+    q = system.mdp[Quantile(Q, 11)].from_linear(quantiles.detach().reshape(8, -1))
+    target = q.one_step(system.mdp[Reward](np.ones(8)), system.mdp[Discount](np.full(8, 0.9)))
+    reference_taus = torch.tensor((2 * np.arange(11) + 1) / 22.).view(11, 1, 1)
+    diff = target.plain.unsqueeze(1) - q.plain.unsqueeze(2)
+    reference = (diff * (reference_taus - (diff < 0).float())).sum(2).sum(1) / 11
+    assert torch.allclose(q.compare(target).plain.double(), reference)
+
+def test_implicit_quantile():
+    env = DummyEnv()
+    system = System(env)
+    network = ImplicitQuantileNetwork(system, network=ImplicitNet, num_quantiles=8)
+    states = system.mdp[State](np.random.rand(6, 7, 4))
+    actions = system.mdp[Action](np.random.randint(0, 5, 6))
+
+    # number of quantiles is chosen for each call
+    q = network(states)
+    assert q.names == ("batch", "atoms", "actions") and q.plain.shape == (6, 8, 5) and q.taus.shape == (6, 8)
+    assert network(states, num_quantiles=32).plain.shape == (6, 32, 5)
+    assert q.greedy().plain.shape == (6,) and network.V(states).names == ("batch", "atoms")
+
+    # quantile levels follow gathered values and loss handles different number of target quantiles
+    prediction = q.gather(actions)
+    assert prediction.taus is q.taus
+    target = network(states, num_quantiles=4).value().one_step(system.mdp[Reward](np.ones(6)), system.mdp[Discount](np.full(6, 0.9)))
+    loss = prediction.compare(target.detach())
+    assert loss.plain.shape == (6,)
+    loss.plain.mean().backward()
+    assert network.net.head.weight.grad is not None
+
+def test_tensor_bridge():
+    from LegoRL.core.bridge import TensorBridge
+
+    bridge = TensorBridge("cpu")
+    data = np.zeros((4, 3), dtype=np.float32)
+    tensor = bridge(data, torch.float32)
+    data[0, 0] = 1
+    assert tensor[0, 0] == 1                 # memory is shared
+    assert bridge.flush_counters() == (0, 0)
+
+    assert bridge(np.zeros((4, 3)), torch.float32).dtype == torch.float32
+    assert bridge(np.zeros((4, 3))[:, ::2], torch.float64).shape == (4, 2)
+    assert bridge.flush_counters() == (4 * 3 * 4 + 4 * 2 * 8, 0)
+
+    # counters are accumulated for each iteration and logged on rare logs iterations
+    class Converting(System):
+        def iteration(self):
+            self.mdp[Reward](np.zeros(10 * self.iterations)).tensor
+
+    system = Converting(DummyEnv(), rare_logs_timer=2)
+    system.run(1)
+    assert "bytes copied" not in system.logger
+    system.run(3)
+    assert system.logger["bytes copied"] == [60, 140] and system.logger["bytes copied max"] == [80, 160]
+    assert system.logger_times["bytes copied"] == [2, 4]
+
+def test_plain_tensors():
+    from LegoRL.core.mdp_config import MDPconfig
+
+    logits = torch.randn(4, 5 * 11)
+    actions, rewards, discounts = np.array([0, 3, 1, 4]), np.array([1., -2., 0.5, 0.]), np.array([0.9, 0.9, 0., 0.9])
+
+    results = {}
+    for named_tensors in [True, False]:
+        mdp = MDPconfig(DummyEnv(), named_tensors=named_tensors)
+        a, r, d = mdp[Action](actions), mdp[Reward](rewards), mdp[Discount](discounts)
+
+        q = mdp[Q].from_linear(logits[:, :5])
+        c = mdp[Categorical(Q, -1, 1, 11)].from_linear(logits)
+        qr = mdp[Quantile(Q, 11)].from_linear(logits)
+        assert q.names == ("batch", "actions") and c.names == ("batch", "atoms", "actions")
+        assert q.tensor.names == (q.names if named_tensors else (None, None))
+
+        v = c.gather(a)
+        results[named_tensors] = [q.gather(a), q.value(mdp[DiscretePolicy].uniform()), q.one_step(r, d),
+                                  c.greedy(), v.one_step(r, d), v.compare(v.one_step(r, d)),
+                                  qr.value(), qr.gather(a).compare(qr.gather(a).one_step(r, d))]
+
+    # same results in both modes
+    for named, plain in zip(results[True], results[False]):
+        assert named.names == plain.names
+        assert torch.equal(named.tensor.rename(None), plain.tensor)
+
+    q, value, one_step, greedy, projected, kl, quantile_value, quantile_loss = results[False]
+    assert torch.equal(q.tensor, logits[:, :5].gather(1, torch.tensor(actions)[:, None])[:, 0])
+    assert torch.allclose(value.tensor, logits[:, :5].mean(1))
+    rewards, discounts = torch.tensor(rewards, dtype=torch.float32)[:, None], torch.tensor(discounts, dtype=torch.float32)[:, None]
+    assert torch.allclose(one_step.tensor, rewards + discounts * logits[:, :5])
+    assert torch.allclose(projected.tensor.exp().sum(1), torch.ones(4)) and kl.tensor.shape == (4,)
+    expected = (logits.view(4, 11, 5).softmax(1) * torch.linspace(-1, 1, 11)[:, None]).sum(1).argmax(1)
+    assert torch.equal(greedy.tensor, expected)
+    quantiles = logits.view(4, 11, 5)
+    assert torch.equal(quantile_value.tensor, quantiles[torch.arange(4), :, quantiles.mean(1).argmax(1)])
+    assert quantile_loss.tensor.shape == (4,)
@@ -0,0 +1,94 @@
+'''
+Measures Categorical value operations against the previous implementation:
+support and offsets rebuilt on every call, two index_add_ passes, KL-divergence through clamped probabilities.
+Run: python -m LegoRL.tests.benchmark_categorical
+'''
+from LegoRL.core.mdp_config import MDPconfig
+from LegoRL.representations import Q, Categorical
+from LegoRL.representations.standard import Action, Reward, Discount
+
+import time
+import warnings
+import gym.spaces
+import torch
+import torch.nn.functional as F
+import numpy as np
+
+class BenchmarkEnv():
+    def __init__(self, num_actions):
+        self.observation_space = gym.spaces.Box(low=np.zeros(4), high=np.ones(4))
+        self.action_space = gym.spaces.Discrete(num_actions)
+
+def measure(f, repeats):
+    f()
+    start = time.perf_counter()
+    for _ in range(repeats):
+        f()
+    return (time.perf_counter() - start) / repeats * 1000
+
+def reference_one_step(logits, rewards, discounts, Vmin, Vmax):
+    '''
+    Previous projection of categorical distribution, shifted by one step, back to the grid.
+    input: logits - Tensor, (batch, atoms)
+    input: rewards, discounts - Tensors, (batch,)
+    output: Tensor, log-probabilities, (batch, atoms)
+    '''
+    num_atoms = logits.shape[-1]
+    support = torch.linspace(Vmin, Vmax, num_atoms).to(logits.device)
+    delta_z = float(Vmax - Vmin) / (num_atoms - 1)
+    distributions = F.softmax(logits, dim=-1)
+
+    Tz = rewards[:, None] + discounts[:, None] * support[None]
+    Tz = Tz.clamp(min=Vmin, max=Vmax)
+    b  = (Tz - Vmin) / delta_z
+    l  = b.floor().long()
+    u  = b.ceil().long()
+
+    numel = logits.numel() // num_atoms
+    offset = torch.linspace(0, (numel - 1) * num_atoms, numel).long().view(-1, 1).to(logits.device)
+
+    proj_dist = torch.zeros_like(distributions)
+    proj_dist.view(-1).index_add_(0, (l + offset).view(-1), (distributions * (u.float() + (b.ceil() == b).float() - b)).view(-1))
+    proj_dist.view(-1).index_add_(0, (u + offset).view(-1), (distributions * (b - l.float())).view(-1))
+    proj_dist /= proj_dist.sum(-1, keepdims=True)
+    return proj_dist.log()
+
+def reference_compare(logits, target_logits):
+    '''
+    Previous KL-divergence (up to target entropy) with clamped probabilities.
+    input: logits, target_logits - Tensors, (batch, atoms)
+    output: Tensor, (batch,)
+    '''
+    target_distribution = F.softmax(target_logits, dim=-1)
+    distribution = torch.clamp(F.softmax(logits, dim=-1), 1e-8, 1 - 1e-8)
+    return -(target_distribution * distribution.log()).sum(-1)
+
+def main(batch_size=512, num_atoms=51, num_actions=18, repeats=200):
+    warnings.filterwarnings("ignore")
+    mdp = MDPconfig(BenchmarkEnv(num_actions), named_tensors=False)
+    cls = mdp[Categorical(Q, -10, 10, num_atoms)]
+
+    q = cls.from_linear(torch.randn(batch_size, num_atoms * num_actions, device=mdp.device))
+    actions = mdp[Action](np.random.randint(0, num_actions, batch_size))
+    rewards = mdp[Reward](np.random.randn(batch_size))
+    discounts = mdp[Discount](np.full(batch_size, 0.99))
+    v = q.gather(actions)
+    target = v.one_step(rewards, discounts)
+    logits, target_logits = v.plain, target.plain
+
+    timings = {
+        "one_step": (lambda: reference_one_step(logits, rewards.plain, discounts.plain, -10, 10),
+                     lambda: v.one_step(rewards, discounts)),
+        "compare":  (lambda: reference_compare(logits, target_logits),
+                     lambda: v.compare(target)),
+    }
+
+    print(f"Batch {batch_size}, {num_atoms} atoms, {num_actions} actions, ms per operation: previous | current")
+    for op, (previous, current) in timings.items():
+        print(f"{op:12} {measure(previous, repeats):8.3f} | {measure(current, repeats):8.3f}")
+    print(f"{'expectation':12} {'':8} | {measure(lambda: q.expectation(), repeats):8.3f}")
+    print(f"{'greedy':12} {'':8} | {measure(lambda: q.greedy(), repeats):8.3f}")
+    print(f"{'full one_step':12} {'':8} | {measure(lambda: q.one_step(rewards, discounts), repeats):8.3f}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,146 @@
+'''
+Measures operations of Q, Categorical and Quantile representations against the previous implementation,
+which kept PyTorch Named Tensors and aligned them by names in each operation;
+current representations are measured with named tensors returned by tensor property and with plain tensors.
+Run: python -m LegoRL.tests.benchmark_representations
+'''
+from LegoRL.core.mdp_config import MDPconfig
+from LegoRL.representations import V, Q, Categorical, Quantile
+from LegoRL.representations.standard import Action, Reward, Discount
+
+import time
+import warnings
+import gym.spaces
+import torch
+import torch.nn.functional as F
+import numpy as np
+from LegoRL.utils.namedTensorsUtils import torch_gather, torch_unflatten
+
+class BenchmarkEnv():
+    def __init__(self, num_actions):
+        self.observation_space = gym.spaces.Box(low=np.zeros(4), high=np.ones(4))
+        self.action_space = gym.spaces.Discrete(num_actions)
+
+def measure(f, repeats):
+    f()
+    start = time.perf_counter()
+    for _ in range(repeats):
+        f()
+    return (time.perf_counter() - start) / repeats * 1000
+
+def operations(mdp, cls, batch_size, num_actions):
+    q = mdp[cls].from_linear(torch.randn(batch_size, mdp[cls].rshape().numel()))
+    actions = mdp[Action](np.random.randint(0, num_actions, batch_size))
+    rewards = mdp[Reward](np.random.randn(batch_size))
+    discounts = mdp[Discount](np.full(batch_size, 0.99))
+    v = q.gather(actions)
+    target = v.one_step(rewards, discounts)
+
+    return {
+        "from_linear": lambda: mdp[cls].from_linear(q.tensor.rename(None).reshape(batch_size, -1)),
+        "greedy":      lambda: q.greedy(),
+        "gather":      lambda: q.gather(actions),
+        "value":       lambda: q.value(),
+        "one_step":    lambda: v.one_step(rewards, discounts),
+        "compare":     lambda: v.compare(target),
+    }
+
+def reference_operations(kind, mdp, cls, batch_size, num_actions, Vmin=-10, Vmax=10, num_atoms=51):
+    '''
+    Previous implementation of the same operations on named tensors.
+    Results are constructed as by previous V.construct: class of result is created again by fabrics of dimensions.
+    input: kind - "Q", "Categorical" or "Quantile"
+    output: dict <str, function>
+    '''
+    names, shape = cls.rnames(), cls.rshape()
+    def construct(tensor):
+        result = V
+        for name, fabric in cls.constructor().items():
+            if name in tensor.names:
+                result = fabric(result)
+        mdp[result]
+        return tensor.refine_names(*tensor.names)
+
+    def from_linear(tensor):
+        tensor = torch_unflatten(tensor.refine_names(..., "features"), "features", zip(names, shape))
+        return tensor.refine_names("batch", *names)
+
+    q = from_linear(torch.randn(batch_size, shape.numel()))
+    actions = torch.tensor(np.random.randint(0, num_actions, batch_size), names=("batch",))
+    rewards = torch.tensor(np.random.randn(batch_size), dtype=torch.float32, names=("batch",))
+    discounts = torch.full((batch_size,), 0.99, names=("batch",))
+
+    if kind == "Q":
+        expectation = construct
+    elif kind == "Categorical":
+        support = torch.linspace(Vmin, Vmax, num_atoms).refine_names("atoms")
+        delta_z = float(Vmax - Vmin) / (num_atoms - 1)
+        expectation = lambda q: construct((F.softmax(q, dim="atoms") * support.align_as(q)).sum(dim="atoms"))
+    else:
+        tau = torch.tensor((2 * np.arange(num_atoms) + 1) / (2.0 * num_atoms), names=("atoms",))
+        expectation = lambda q: construct(q.sum(dim="atoms") / num_atoms)
+
+    greedy = lambda: expectation(q).max(dim="actions").indices
+    gather = lambda actions: construct(torch_gather(q, actions, "actions"))
+    v = gather(actions)
+
+    def one_step(v):
+        if kind != "Categorical":
+            return construct(rewards.align_as(v) + v * discounts.align_as(v))
+
+        distributions = F.softmax(v, dim="atoms").align_to(..., "atoms")
+        r = rewards.align_as(distributions).rename(None)
+        d = discounts.align_as(distributions).rename(None)
+        supports = support.align_as(distributions).rename(None)
+        names = distributions.names
+        distributions = distributions.rename(None)
+
+        b = ((r + d * supports).clamp(min=Vmin, max=Vmax) - Vmin) / delta_z
+        l, u = b.floor().long(), b.ceil().long()
+        numel = v.numel() // num_atoms
+        offset = torch.linspace(0, (numel - 1) * num_atoms, numel).long().view(-1, 1)
+
+        proj_dist = torch.zeros_like(distributions)
+        proj_dist.view(-1).index_add_(0, (l + offset).view(-1), (distributions * (u.float() + (b.ceil() == b).float() - b)).view(-1))
+        proj_dist.view(-1).index_add_(0, (u + offset).view(-1), (distributions * (b - l.float())).view(-1))
+        proj_dist /= proj_dist.sum(-1, keepdims=True)
+        return construct(proj_dist.log().refine_names(*names).align_as(v))
+
+    def compare(v, target):
+        if kind == "Q":
+            return (target - v).pow(2)
+        if kind == "Categorical":
+            distribution = torch.clamp(F.softmax(v, dim="atoms"), 1e-8, 1 - 1e-8)
+            return -(F.softmax(target, dim="atoms") * distribution.log()).sum("atoms")
+        target = target.unflatten('atoms', [('atoms', 1), ('atomsII', num_atoms)])
+        diff = target - v.unflatten('atoms', [('atoms', num_atoms), ('atomsII', 1)])
+        return (diff * (tau.align_as(diff) - (diff < 0).float())).sum('atomsII').sum('atoms') / num_atoms
+
+    target = one_step(v)
+    return {
+        "from_linear": lambda: from_linear(q.rename(None).reshape(batch_size, -1)),
+        "greedy":      greedy,
+        "gather":      lambda: gather(actions),
+        "value":       lambda: construct(q.max(dim="actions").values) if kind == "Q" else gather(greedy()),
+        "one_step":    lambda: one_step(v),
+        "compare":     lambda: compare(v, target),
+    }
+
+def main(batch_size=32, num_actions=6, repeats=200):
+    warnings.filterwarnings("ignore")
+    representations = {"Q": Q, "Categorical": Categorical(Q), "Quantile": Quantile(Q)}
+
+    print(f"Batch {batch_size}, {num_actions} actions, ms per operation: previous | current with named tensors | current with plain tensors")
+    for name, cls in representations.items():
+        mdp = MDPconfig(BenchmarkEnv(num_actions))
+        timings = {op: [measure(f, repeats)] for op, f in reference_operations(name, mdp, mdp[cls], batch_size, num_actions).items()}
+        for named_tensors in [True, False]:
+            mdp = MDPconfig(BenchmarkEnv(num_actions), named_tensors=named_tensors)
+            for op, f in operations(mdp, cls, batch_size, num_actions).items():
+                timings[op].append(measure(f, repeats))
+
+        for op, (previous, named, plain) in timings.items():
+            print(f"{name:12} {op:12} {previous:8.3f} | {named:8.3f} | {plain:8.3f}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,35 @@
+'''
+Compares scalar and batched operations of SumTree.
+Run: python -m LegoRL.tests.benchmark_sumtree
+'''
+from LegoRL.samplers.prioritizedSampler import SumTree
+
+import time
+import numpy as np
+
+def measure(f, repeats):
+    start = time.perf_counter()
+    for _ in range(repeats):
+        f()
+    return (time.perf_counter() - start) / repeats * 1000
+
+def main(capacity=1000000, batch_size=32, repeats=20):
+    tree = SumTree(capacity)
+    tree.update_many(np.arange(capacity), np.random.uniform(size=capacity))
+    idxs = np.random.randint(0, capacity, batch_size)
+    ps = np.random.uniform(size=batch_size)
+    values = np.random.uniform(0, tree.total_p, batch_size)
+
+    def scalar_update():
+        for i, p in zip(idxs, ps):
+            tree.update(i, p)
+
+    def scalar_sample():
+        [tree.get_leaf(v) for v in values]
+
+    print(f"SumTree, capacity {capacity}, batch {batch_size}, ms per batch")
+    print(f"sample:  get_leaf loop {measure(scalar_sample, repeats):8.3f}  |  get_leaves  {measure(lambda: tree.get_leaves(values), repeats):8.3f}")
+    print(f"update:  update loop   {measure(scalar_update, repeats):8.3f}  |  update_many {measure(lambda: tree.update_many(idxs, ps), repeats):8.3f}")
+
+if __name__ == "__main__":
+    main()
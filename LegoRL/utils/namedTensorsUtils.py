@@ -1,4 +1,5 @@
 import torch
+from functools import lru_cache
 
 '''
 As PyTorch Named Tensors proved to be unstable and lacking some basic required features,
@@ -35,6 +36,8 @@ def torch_unflatten(tensor, dim, new_dims):
 
 from torch.nn.functional import one_hot
 def torch_one_hot(indexes, num_classes, new_name):
+    if not indexes.has_names():
+        return one_hot(indexes, num_classes)
     names = indexes.names + (new_name,)
     return one_hot(indexes.rename(None), num_classes).refine_names(*names)
 
@@ -50,15 +53,95 @@ def torch_set_index(data, index, value):
     return data.refine_names(*names)
 
 def torch_min(t1, t2):
+    if not t1.has_names() and not t2.has_names():
+        return torch.min(t1, t2)
     assert t1.names == t2.names
     names = t1.names
     return torch.min(t1.rename(None), t2.rename(None)).refine_names(*names)
 
 def torch_max(t1, t2):
+    if not t1.has_names() and not t2.has_names():
+        return torch.max(t1, t2)
     assert t1.names == t2.names
     names = t1.names
     return torch.max(t1.rename(None), t2.rename(None)).refine_names(*names)
 
 def torch_split(t, spl, dim):
     dim_index = t.names.index(dim)
-    return torch.split(t, spl, dim=dim_index)
\ No newline at end of file
+    return torch.split(t, spl, dim=dim_index)
+
+'''
+Plain tensors with names of dimensions kept as Python metadata (tuple of str) alongside.
+Everything depending only on names is computed once for each tuple of names and cached,
+so on each call only permute / indexing views are created.
+'''
+
+def plain_tensor(tensor, names=None):
+    '''
+    Drops names of tensor, checking that they agree with given ones.
+    input: tensor - Tensor, named or not
+    input: names - tuple of str or None (no checking)
+    output: Tensor without names
+    '''
+    if not tensor.has_names():
+        return tensor
+    if names is not None:
+        tensor = tensor.refine_names(*names)
+    return tensor.rename(None)
+
+@lru_cache(maxsize=None)
+def plain_without(names, name):
+    '''
+    Names of dimensions after reduction of one of them.
+    output: tuple of str
+    '''
+    return tuple(n for n in names if n != name)
+
+@lru_cache(maxsize=None)
+def _alignment(names, target):
+    assert set(names) <= set(target), f"Error: can't align dimensions {names} to {target}"
+    order = tuple(sorted(range(len(names)), key=lambda i: target.index(names[i])))
+    permutation = order if order != tuple(range(len(names))) else None
+    index = tuple(slice(None) if name in names else None for name in target) if len(names) < len(target) else None
+    return permutation, index
+
+def plain_align(tensor, names, target):
+    '''
+    Analogue of align_as: permutes dimensions of tensor to the order of target and inserts missing ones.
+    input: tensor - Tensor without names
+    input: names - names of tensor dimensions, tuple of str
+    input: target - names of dimensions to align to, tuple of str
+    output: Tensor without names, view of input
+    '''
+    permutation, index = _alignment(names, target)
+    if permutation is not None:
+        tensor = tensor.permute(permutation)
+    if index is not None:
+        tensor = tensor[index]
+    return tensor
+
+def plain_gather(tensor, names, indexes, index_names, without):
+    '''
+    Analogue of torch_gather: selects elements along given dimension by indexes.
+    input: tensor - Tensor without names
+    input: names - names of tensor dimensions, tuple of str
+    input: indexes - LongTensor without names
+    input: index_names - names of indexes dimensions, tuple of str
+    input: without - name of dimension to select along, str
+    output: Tensor without names, dimension "without" reduced
+    '''
+    d = names.index(without)
+    indexes = plain_align(indexes, index_names, names)
+    shape = list(tensor.shape)
+    shape[d] = 1
+    return tensor.gather(dim=d, index=indexes.expand(shape)).squeeze(d)
+
+def plain_flatten(tensor, num_dims):
+    '''
+    Flattens last dimensions of tensor into one.
+    input: tensor - Tensor without names
+    input: num_dims - number of dimensions to flatten, int
+    output: Tensor without names
+    '''
+    assert num_dims > 0, "Error: no dimensions to flatten"
+    return tensor.reshape(tuple(tensor.shape[:tensor.dim() - num_dims]) + (-1,))
@@ -0,0 +1,68 @@
+import torch
+
+'''
+Pairwise quantile regression loss with bounded memory.
+Pairwise differences between predicted and target quantiles are computed for chunks of predicted quantiles,
+so at most max_pairs differences are stored at once, in forward and in backward pass.
+Each chunk is reduced over all target quantiles, so result does not depend on chunk size.
+'''
+
+def _chunks(num_quantiles, chunk):
+    for start in range(0, num_quantiles, chunk):
+        yield start, min(chunk, num_quantiles - start)
+
+class _QuantileLoss(torch.autograd.Function):
+    '''
+    Gradients are computed chunk by chunk in closed form:
+        d loss / d q[i] = -sum_j (tau[i] - [t[j] < q[i]]) / num_targets
+        d loss / d t[j] =  sum_i (tau[i] - [t[j] < q[i]]) / num_targets
+    Quantile levels are not differentiated.
+    '''
+    @staticmethod
+    def forward(ctx, quantiles, targets, taus, dim, chunk):
+        ctx.save_for_backward(quantiles, targets, taus)
+        ctx.dim, ctx.chunk = dim, chunk
+
+        losses = []
+        for start, length in _chunks(quantiles.shape[dim], chunk):
+            q, t = quantiles.narrow(dim, start, length), taus if taus.shape[dim] == 1 else taus.narrow(dim, start, length)
+
+            # dimension dim is split into predicted quantiles (dim) and target quantiles (dim + 1)
+            diff = targets.unsqueeze(dim) - q.unsqueeze(dim + 1)
+            losses.append((diff * (t.unsqueeze(dim + 1) - (diff < 0).float())).sum(dim + 1))
+
+        loss = losses[0] if len(losses) == 1 else torch.cat(losses, dim)
+        return loss.sum(dim) / targets.shape[dim]
+
+    @staticmethod
+    def backward(ctx, grad):
+        quantiles, targets, taus = ctx.saved_tensors
+        dim = ctx.dim
+        grad = grad.unsqueeze(dim).unsqueeze(dim + 1) / targets.shape[dim]
+
+        grad_quantiles, grad_targets = [], 0
+        for start, length in _chunks(quantiles.shape[dim], ctx.chunk):
+            q, t = quantiles.narrow(dim, start, length), taus if taus.shape[dim] == 1 else taus.narrow(dim, start, length)
+            weights = (t.unsqueeze(dim + 1) - (targets.unsqueeze(dim) < q.unsqueeze(dim + 1)).float()) * grad
+            if ctx.needs_input_grad[0]:
+                grad_quantiles.append(-weights.sum(dim + 1))
+            if ctx.needs_input_grad[1]:
+                grad_targets = grad_targets + weights.sum(dim)
+
+        grad_quantiles = torch.cat(grad_quantiles, dim).sum_to_size(quantiles.shape) if grad_quantiles else None
+        grad_targets = grad_targets.sum_to_size(targets.shape) if ctx.needs_input_grad[1] else None
+        return grad_quantiles, grad_targets, None, None, None
+
+def quantile_loss(quantiles, targets, taus, dim, max_pairs=2**22):
+    '''
+    Quantile regression loss: for each predicted quantile q with level tau,
+    mean over target quantiles t of (t - q) * (tau - [t < q]), summed over predicted quantiles.
+    input: quantiles - Tensor, predicted quantiles in dimension dim
+    input: targets - Tensor, same dimensions, any number of target quantiles in dimension dim
+    input: taus - Tensor, quantile levels of predicted quantiles, same number of dimensions as quantiles, broadcastable
+    input: dim - dimension of quantiles, int
+    input: max_pairs - maximum number of pairwise differences stored at once, int
+    output: Tensor, dimension dim reduced
+    '''
+    pairs_per_quantile = max(quantiles.numel() // max(quantiles.shape[dim], 1) * targets.shape[dim], 1)
+    return _QuantileLoss.apply(quantiles, targets, taus, dim, max(1, max_pairs // pairs_per_quantile))
@@ -0,0 +1,109 @@
+import torch
+
+'''
+Returns engine: estimators over whole (timesteps, batch) tensors.
+All of them are reverse discounted scans
+    y[t] = x[t] + y[t + 1] * discounts[t] (* scale)
+computed with one vectorized step per timestep, so per-step variable discounts (episode ends) are supported,
+memory is bounded by the output, and results are bitwise identical to step-by-step loops over representations.
+'''
+
+def reverse_scan(x, discounts, last, scale=None):
+    '''
+    Computes y[t] = x[t] + y[t + 1] * discounts[t] * scale, y[T] = last.
+    input: x - Tensor, (timesteps, *batch_shape)
+    input: discounts - Tensor, broadcastable to x
+    input: last - Tensor or float, broadcastable to x[0]
+    input: scale - float or None
+    output: Tensor, (timesteps, *batch_shape)
+    '''
+    discounts = discounts.expand_as(x)
+    result = torch.empty_like(x)
+    y = last
+    for t in reversed(range(x.shape[0])):
+        carry = y * discounts[t]
+        if scale is not None:
+            carry = carry * scale
+        y = x[t] + carry
+        result[t] = y
+    return result
+
+def next_values(values, last):
+    '''
+    Shifts values one step back in time.
+    input: values - Tensor, (timesteps, *batch_shape)
+    input: last - Tensor, *batch_shape
+    output: Tensor, (timesteps, *batch_shape)
+    '''
+    return torch.cat([values[1:], last.unsqueeze(0)])
+
+def gae_advantages(rewards, values, discounts, last, tau):
+    '''
+    Generalized Advantage Estimation.
+    input: rewards, values, discounts - Tensors, (timesteps, *batch_shape)
+    input: last - Tensor, value of state after the last step, *batch_shape
+    input: tau - float
+    output: Tensor, advantages, (timesteps, *batch_shape)
+    '''
+    deltas = (rewards + next_values(values, last) * discounts) - values
+    return reverse_scan(deltas, discounts, 0, tau)
+
+def lambda_returns(rewards, values, discounts, last, lambd):
+    '''
+    TD(lambda) returns: G[t] = r[t] + discounts[t] * ((1 - lambda) V[t + 1] + lambda G[t + 1]), G[T] = V[T].
+    input: rewards, values, discounts - Tensors, (timesteps, *batch_shape)
+    input: last - Tensor, value of state after the last step, *batch_shape
+    input: lambd - float
+    output: Tensor, (timesteps, *batch_shape)
+    '''
+    bootstrap = rewards + next_values(values, last) * discounts * (1 - lambd)
+    return reverse_scan(bootstrap, discounts, last, lambd)
+
+def maxtrace_returns(rewards, discounts, last):
+    '''
+    MaxTrace (n-step to the end of rollout) returns.
+    input: rewards, discounts - Tensors, (timesteps, *batch_shape)
+    input: last - Tensor, value of state after the last step, *batch_shape
+    output: Tensor, (timesteps, *batch_shape)
+    '''
+    return reverse_scan(rewards, discounts, last)
+
+def vtrace(rewards, values, discounts, last, ratios, rho_max=1., c_max=1., lambd=1.):
+    '''
+    V-trace targets for off-policy data: v[t] - V[t] = delta[t] + discounts[t] * c[t] * (v[t + 1] - V[t + 1]),
+    where delta[t] = rho[t] * (r[t] + discounts[t] * V[t + 1] - V[t]), rho and c are truncated importance ratios.
+    Based on: https://arxiv.org/abs/1802.01561
+    input: rewards, values, discounts - Tensors, (timesteps, *batch_shape)
+    input: last - Tensor, value of state after the last step, *batch_shape
+    input: ratios - Tensor, pi(a|s) / mu(a|s) of taken actions, (timesteps, *batch_shape)
+    input: rho_max, c_max - truncation levels, float
+    input: lambd - float
+    output: Tensor, targets v, (timesteps, *batch_shape)
+    output: Tensor, advantages for policy gradient, (timesteps, *batch_shape)
+    '''
+    rhos = ratios.clamp(max=rho_max)
+    cs = lambd * ratios.clamp(max=c_max)
+
+    deltas = rhos * (rewards + discounts * next_values(values, last) - values)
+    targets = values + reverse_scan(deltas, discounts * cs, 0)
+    advantages = rhos * (rewards + discounts * next_values(targets, last) - values)
+    return targets, advantages
+
+def retrace(rewards, q_values, values, discounts, last, ratios, lambd=1.):
+    '''
+    Retrace targets for Q-function of taken actions:
+    Q_ret[t] = r[t] + discounts[t] * (V[t + 1] + c[t + 1] * (Q_ret[t + 1] - Q[t + 1])), c = lambda * min(1, ratio).
+    Based on: https://arxiv.org/abs/1606.02647
+    input: rewards, discounts - Tensors, (timesteps, *batch_shape)
+    input: q_values - Tensor, Q of taken actions, (timesteps, *batch_shape)
+    input: values - Tensor, expectation of Q under current policy, (timesteps, *batch_shape)
+    input: last - Tensor, value of state after the last step, *batch_shape
+    input: ratios - Tensor, pi(a|s) / mu(a|s) of taken actions, (timesteps, *batch_shape)
+    input: lambd - float
+    output: Tensor, (timesteps, *batch_shape)
+    '''
+    cs = lambd * ratios.clamp(max=1.)
+    next_cs = torch.cat([cs[1:], torch.zeros_like(cs[:1])])
+
+    deltas = rewards + discounts * next_values(values, last) - q_values
+    return q_values + reverse_scan(deltas, discounts * next_cs, 0)